@@ -0,0 +1,230 @@
+import logging
+from functools import reduce
+from operator import or_
+
+from django.db import DatabaseError, transaction
+from django.db.models import Count, Q, Sum
+
+from .fares import REFRESH_ROUTES_PER_QUERY, fare_day_key, group_route_days, route_days_flight_filter
+from .models import Flight, FlightStats, Reservation, RouteDailyStats
+
+
+logger = logging.getLogger('airlineapp.analytics')
+
+REFRESH_FLIGHTS_PER_QUERY = 500
+
+FLIGHT_FIELDS = ['id', 'origin_id', 'destination_id', 'departure_time', 'capacity', 'available_seats',
+                 'economy_class_price', 'business_class_price']
+
+RESERVATION_COUNTS = {
+    'confirmed': Count('id', filter=Q(status='confirmed')),
+    'pending': Count('id', filter=Q(status='pending')),
+    'cancelled': Count('id', filter=Q(status='cancelled')),
+    'economy_sold': Count('id', filter=Q(status='confirmed', seat_type='economy')),
+    'business_sold': Count('id', filter=Q(status='confirmed', seat_type='business')),
+}
+NO_RESERVATIONS = dict.fromkeys(RESERVATION_COUNTS, 0)
+
+STAT_TOTALS = ['capacity', 'seats_taken', 'confirmed', 'pending', 'cancelled', 'economy_sold', 'business_sold', 'revenue']
+STAT_FIELDS = ['origin_id', 'destination_id', 'day', *STAT_TOTALS, 'stale']
+
+
+def build_flight_stats(flights):
+    """FlightStats for ``flights`` (a Flight queryset): one flight query, one reservation aggregate."""
+    flights = list(flights.values(*FLIGHT_FIELDS))
+    counts = {
+        values.pop('flight_id'): values
+        for values in Reservation.objects.filter(flight_id__in=[flight['id'] for flight in flights])
+        .values('flight_id').annotate(**RESERVATION_COUNTS).order_by()
+    }
+    rows = []
+    for flight in flights:
+        reservations = counts.get(flight['id'], NO_RESERVATIONS)
+        origin_id, destination_id, day = fare_day_key(flight['origin_id'], flight['destination_id'], flight['departure_time'])
+        rows.append(FlightStats(
+            flight_id=flight['id'], origin_id=origin_id, destination_id=destination_id, day=day,
+            capacity=flight['capacity'],
+            seats_taken=flight['capacity'] - flight['available_seats'],
+            revenue=(reservations['economy_sold'] * flight['economy_class_price']
+                     + reservations['business_sold'] * flight['business_class_price']),
+            **reservations,
+        ))
+    return rows
+
+
+def refresh_flight_stats(flight_ids):
+    """Recompute the rollups for ``flight_ids``, including the route days they leave or join.
+
+    Flights that no longer exist lose their FlightStats row.
+    """
+    flight_ids = sorted(set(flight_ids))
+    for start in range(0, len(flight_ids), REFRESH_FLIGHTS_PER_QUERY):
+        _refresh_flights(flight_ids[start:start + REFRESH_FLIGHTS_PER_QUERY])
+
+
+def _refresh_flights(flight_ids):
+    with transaction.atomic():
+        # Lock the rows first: a concurrent refresh of the same flight waits
+        # here, then reads what the other one committed.
+        previous = {
+            flight_id: (origin_id, destination_id, day)
+            for flight_id, origin_id, destination_id, day in FlightStats.objects.select_for_update()
+            .filter(flight_id__in=flight_ids).order_by('flight_id')
+            .values_list('flight_id', 'origin_id', 'destination_id', 'day')
+        }
+        rows = build_flight_stats(Flight.objects.filter(pk__in=flight_ids))
+        current = {row.flight_id for row in rows}
+        FlightStats.objects.filter(flight_id__in=previous.keys() - current).delete()
+        FlightStats.objects.bulk_update([row for row in rows if row.flight_id in previous], STAT_FIELDS)
+        FlightStats.objects.bulk_create([row for row in rows if row.flight_id not in previous])
+        refresh_route_stats({*previous.values(), *((row.origin_id, row.destination_id, row.day) for row in rows)})
+
+
+def _refresh_after_commit(flight_ids):
+    try:
+        refresh_flight_stats(flight_ids)
+    except DatabaseError as exc:
+        # The write that triggered this has committed; don't fail it over a
+        # rollup. The rows stay stale until the flight changes again or
+        # `manage.py refresh_analytics` runs.
+        logger.warning('analytics refresh failed for flights %s: %s', sorted(flight_ids), exc)
+
+
+def flight_stats_stale(flight_ids):
+    """Mark the rollups of ``flight_ids`` for the next refresh_stale_stats() pass.
+
+    For reservation writes: one UPDATE of the flights' own FlightStats rows,
+    instead of a refresh that would lock the route's shared RouteDailyStats
+    row on every booking.
+    """
+    flight_ids = set(flight_ids)
+    if flight_ids:
+        FlightStats.objects.filter(flight_id__in=flight_ids, stale=False).update(stale=True)
+
+
+def refresh_stale_stats(batch_size=REFRESH_FLIGHTS_PER_QUERY):
+    """Refresh every flight marked stale, ``batch_size`` flights per transaction.
+
+    A flight marked again while its batch is being refreshed waits on the
+    row lock, so it stays stale for the next pass. Returns the number of
+    flights refreshed.
+    """
+    refreshed = 0
+    last_id = 0
+    while True:
+        flight_ids = list(
+            FlightStats.objects.filter(stale=True, flight_id__gt=last_id)
+            .order_by('flight_id').values_list('flight_id', flat=True)[:batch_size]
+        )
+        if not flight_ids:
+            return refreshed
+        _refresh_flights(flight_ids)
+        refreshed += len(flight_ids)
+        last_id = flight_ids[-1]
+
+
+def flight_stats_changed(flight_ids):
+    """Refresh ``flight_ids`` once the current transaction commits.
+
+    Deferred so the refresh sees every write the transaction makes (a
+    cancellation saves the reservation before it returns the seat).
+    """
+    flight_ids = set(flight_ids)
+    if flight_ids:
+        transaction.on_commit(lambda: _refresh_after_commit(flight_ids))
+
+
+def route_days_changed(keys):
+    """Refresh every flight departing on the ``(origin_id, destination_id, day)`` keys.
+
+    For bulk writers that know which route days they touched but not the flight
+    ids (bulk_create does not return ids on every backend).
+    """
+    routes = group_route_days(keys)
+    for start in range(0, len(routes), REFRESH_ROUTES_PER_QUERY):
+        chunk = routes[start:start + REFRESH_ROUTES_PER_QUERY]
+        flight_stats_changed(Flight.objects.filter(route_days_flight_filter(chunk)).values_list('id', flat=True))
+
+
+def summed(stats, group, fields, ordering=(), **extra):
+    """``stats.values(*group)`` with each of ``fields`` summed under its own name."""
+    # Annotations may not shadow model fields, hence the detour through total_<field>.
+    annotations = {f'total_{field}': Sum(field) for field in fields}
+    for values in stats.values(*group).annotate(**annotations, **extra).order_by(*ordering):
+        for field in fields:
+            values[field] = values.pop(f'total_{field}')
+        yield values
+
+
+def route_stats_aggregates(stats):
+    return summed(stats, ['origin_id', 'destination_id', 'day'], STAT_TOTALS, flights=Count('flight_id'))
+
+
+def refresh_route_stats(keys):
+    """Recompute RouteDailyStats for ``(origin_id, destination_id, day)`` keys from FlightStats."""
+    routes = group_route_days(keys)
+    for start in range(0, len(routes), REFRESH_ROUTES_PER_QUERY):
+        summary_filter = reduce(or_, (
+            Q(origin_id=origin_id, destination_id=destination_id, day__in=days)
+            for (origin_id, destination_id), days in routes[start:start + REFRESH_ROUTES_PER_QUERY]
+        ))
+        with transaction.atomic():
+            previous = {
+                (origin_id, destination_id, day): pk
+                for pk, origin_id, destination_id, day in RouteDailyStats.objects.select_for_update()
+                .filter(summary_filter).order_by('pk')
+                .values_list('pk', 'origin_id', 'destination_id', 'day')
+            }
+            rows = [RouteDailyStats(**values) for values in route_stats_aggregates(FlightStats.objects.filter(summary_filter))]
+            for row in rows:
+                row.pk = previous.pop((row.origin_id, row.destination_id, row.day), None)
+            RouteDailyStats.objects.filter(pk__in=previous.values()).delete()
+            RouteDailyStats.objects.bulk_update([row for row in rows if row.pk], ['flights', *STAT_TOTALS])
+            RouteDailyStats.objects.bulk_create([row for row in rows if not row.pk])
+
+
+def rebuild_analytics(batch_size=REFRESH_FLIGHTS_PER_QUERY):
+    with transaction.atomic():
+        FlightStats.objects.all().delete()
+        RouteDailyStats.objects.all().delete()
+        last_id = 0
+        while True:
+            flight_ids = list(Flight.objects.filter(pk__gt=last_id).order_by('pk').values_list('pk', flat=True)[:batch_size])
+            if not flight_ids:
+                break
+            FlightStats.objects.bulk_create(build_flight_stats(Flight.objects.filter(pk__in=flight_ids)))
+            last_id = flight_ids[-1]
+        RouteDailyStats.objects.bulk_create(
+            (RouteDailyStats(**values) for values in route_stats_aggregates(FlightStats.objects.all())),
+            batch_size=5000,
+        )
+
+
+def _with_rates(values):
+    capacity = values['capacity'] or 0
+    values['load_factor'] = round(values['seats_taken'] / capacity, 4) if capacity else None
+    return values
+
+
+def route_stats(start, end, origin_id=None, destination_id=None, by_day=False):
+    """Totals per route (and per day with ``by_day``) for departures between ``start`` and ``end``."""
+    stats = RouteDailyStats.objects.filter(day__gte=start, day__lte=end)
+    if origin_id is not None:
+        stats = stats.filter(origin_id=origin_id)
+    if destination_id is not None:
+        stats = stats.filter(destination_id=destination_id)
+    group = ['origin_id', 'destination_id', 'day'] if by_day else ['origin_id', 'destination_id']
+    return [_with_rates(values) for values in summed(stats, group, ['flights', *STAT_TOTALS], ordering=group)]
+
+
+def flight_stats(start, end, origin_id=None, destination_id=None, limit=100):
+    stats = FlightStats.objects.filter(day__gte=start, day__lte=end)
+    if origin_id is not None:
+        stats = stats.filter(origin_id=origin_id)
+    if destination_id is not None:
+        stats = stats.filter(destination_id=destination_id)
+    return [
+        _with_rates(values)
+        for values in stats.order_by('day', 'flight_id')
+        .values('flight_id', 'origin_id', 'destination_id', 'day', *STAT_TOTALS)[:limit]
+    ]
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class AirlineappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'airlineapp'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import signals  # noqa: F401
+        from .metrics import install_query_timer
+
+        connection_created.connect(install_query_timer)
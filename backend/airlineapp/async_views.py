@@ -0,0 +1,100 @@
+"""Async entry points for the read-heavy endpoints, for the ASGI deployment mode.
+
+Each one runs its sync counterpart from views.py, so both paths share the
+search cache, keyset pagination, replica routing and DRF authentication and
+answer alike. Each request's view runs on a worker thread it holds until the
+response is done, so its queries and any streamed cursor stay on one
+connection, and requests in flight wait on the database side by side while
+the event loop stays free. Django's async ORM would not help here: in this Django version
+``aget``/``aiterator`` hand every query to one shared thread, so concurrent
+requests queue behind each other. See backend/asgi.py for how to run them.
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.views.decorators.csrf import csrf_exempt
+
+from . import views
+
+
+class RequestThread:
+    """A worker thread held by one request from the view to the last streamed chunk.
+
+    Threads are reused: starting one per request would block the event loop
+    on every request. Up to ASYNC_VIEW_IDLE_THREADS are kept between requests.
+    """
+
+    _idle = queue.SimpleQueue()
+
+    def __init__(self):
+        try:
+            self.executor = self._idle.get_nowait()
+        except queue.Empty:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-view')
+
+    def run(self, func, *args, **kwargs):
+        return sync_to_async(func, thread_sensitive=False, executor=self.executor)(*args, **kwargs)
+
+    def release(self):
+        if self._idle.qsize() < getattr(settings, 'ASYNC_VIEW_IDLE_THREADS', 64):
+            self._idle.put(self.executor)
+        else:
+            self.executor.shutdown(wait=False)
+
+
+async def iterate_in_thread(iterator, thread):
+    """``iterator``'s items, each fetched on ``thread``, which is released once they run out."""
+    done = object()
+    try:
+        while (item := await thread.run(next, iterator, done)) is not done:
+            yield item
+    finally:
+        try:
+            await thread.run(close_old_connections)
+        finally:
+            thread.release()
+
+
+def _respond(view, request, *args, **kwargs):
+    try:
+        response = view(request, *args, **kwargs)
+        # DRF responses render lazily; do it here rather than back on the event loop.
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+    except BaseException:
+        close_old_connections()
+        raise
+    if not response.streaming:
+        # What request_finished does for a sync view's thread; a stream does it when done.
+        close_old_connections()
+    return response
+
+
+def run_in_thread(view):
+    """An async view answering with ``view``'s response."""
+
+    async def async_view(request, *args, **kwargs):
+        thread = RequestThread()
+        try:
+            response = await thread.run(_respond, view, request, *args, **kwargs)
+        except BaseException:
+            thread.release()
+            raise
+        if response.streaming and not response.is_async:
+            response.streaming_content = iterate_in_thread(iter(response.streaming_content), thread)
+        else:
+            thread.release()
+        return response
+
+    # The DRF views do their own CSRF checks.
+    return csrf_exempt(async_view)
+
+
+flight_search = run_in_thread(views.FlightSearchView.as_view())
+flight_list = run_in_thread(views.FlightList.as_view())
+get_flight = run_in_thread(views.get_flight)
+user_reservations = run_in_thread(views.user_reservations)
+city_list_view = run_in_thread(views.CityListView.as_view())
@@ -0,0 +1,249 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.db import connection, router, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .cache import get_cache
+from .models import RefreshToken
+
+
+# What authentication and the views read off request.user; anything else loads
+# on first access. Never the password hash: shared snapshots live in the cache.
+# Kept in model order, as from_db() expects.
+USER_SNAPSHOT_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if field.attname in {'id', 'username', 'email', 'first_name', 'last_name', 'is_staff', 'is_superuser', 'is_active'}
+]
+
+
+class LocalTokenCache:
+    """Bounded per-process LRU of token key -> user snapshot, with a TTL."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, snapshot = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return snapshot
+
+    def set(self, key, snapshot):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, snapshot)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedTokenCache:
+    """Token snapshots in a Django cache alias, so a revocation is seen by every worker."""
+
+    # v2: snapshots hold USER_SNAPSHOT_FIELDS only.
+    prefix = 'airline:token:v2:'
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+
+    def get(self, key):
+        return get_cache().get(self.prefix + key)
+
+    def set(self, key, snapshot):
+        get_cache().set(self.prefix + key, snapshot, self.ttl)
+
+    def delete_many(self, keys):
+        get_cache().delete_many([self.prefix + key for key in keys])
+
+
+def build_token_cache():
+    ttl = getattr(settings, 'TOKEN_CACHE_TTL', 300)
+    if getattr(settings, 'TOKEN_CACHE_BACKEND', 'local') == 'shared':
+        return SharedTokenCache(ttl)
+    return LocalTokenCache(getattr(settings, 'TOKEN_CACHE_MAX_ENTRIES', 10000), ttl)
+
+
+token_cache = build_token_cache()
+
+
+def forget_tokens(keys):
+    keys = list(keys)
+    if keys:
+        token_cache.delete_many(keys)
+    return len(keys)
+
+
+def forget_user_tokens(user_ids):
+    """Drop the cached snapshots of the users' tokens; returns how many there were.
+
+    Dropped now, and again once the transaction commits: a request
+    authenticating in between reads the old user row and may cache it again.
+    """
+    keys = list(Token.objects.filter(user_id__in=list(user_ids)).values_list('key', flat=True))
+    if keys and connection.in_atomic_block:
+        transaction.on_commit(lambda: forget_tokens(keys))
+    return forget_tokens(keys)
+
+
+def remember_token(token):
+    snapshot = {
+        'user': [getattr(token.user, field) for field in USER_SNAPSHOT_FIELDS],
+        'created': token.created,
+        'db': token._state.db,
+    }
+    token_cache.set(token.key, snapshot)
+    return snapshot
+
+
+def restore_token(key, snapshot):
+    user = User.from_db(snapshot['db'], USER_SNAPSHOT_FIELDS, snapshot['user'])
+    token = Token.from_db(snapshot['db'], ['key', 'user_id', 'created'], [key, user.pk, snapshot['created']])
+    token.user = user
+    return token
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication that skips the Token + User query while the key is cached.
+
+    Entries are dropped when the token is deleted, when the user is saved
+    (active/staff toggles) and on logout; the TTL bounds anything else.
+    """
+
+    def authenticate_credentials(self, key):
+        snapshot = token_cache.get(key)
+        if snapshot is None:
+            try:
+                token = Token.objects.select_related('user').get(key=key)
+            except Token.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if not token.user.is_active:
+                raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+            snapshot = remember_token(token)
+
+        token = restore_token(key, snapshot)
+        return (token.user, token)
+
+
+ACCESS_TOKEN_SALT = 'airlineapp.access'
+ACCESS_TOKEN_FIELDS = ['id', 'username', 'is_staff', 'is_active']
+
+
+class InvalidRefreshToken(Exception):
+    pass
+
+
+def signed_tokens_enabled():
+    return getattr(settings, 'AIRLINE_AUTH_MODE', 'token') == 'signed'
+
+
+def issue_access_token(user):
+    expires = int(time.time()) + getattr(settings, 'ACCESS_TOKEN_LIFETIME', 300)
+    return signing.Signer(salt=ACCESS_TOKEN_SALT).sign_object({'u': user.pk, 'n': user.username, 's': user.is_staff, 'e': expires})
+
+
+def read_access_token(value):
+    """Return the user an access token was issued to, without touching the database.
+
+    Only id, username and is_staff are filled in; other fields load on first access.
+    """
+    try:
+        payload = signing.Signer(salt=ACCESS_TOKEN_SALT).unsign_object(value)
+    except signing.BadSignature:
+        return None
+    if payload['e'] < time.time():
+        return None
+    return User.from_db(router.db_for_read(User), ACCESS_TOKEN_FIELDS, [payload['u'], payload['n'], payload['s'], True])
+
+
+def _digest(raw):
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def issue_refresh_token(user):
+    raw = secrets.token_urlsafe(32)
+    lifetime = timedelta(seconds=getattr(settings, 'REFRESH_TOKEN_LIFETIME', 30 * 24 * 60 * 60))
+    RefreshToken.objects.create(digest=_digest(raw), user=user, expires_at=timezone.now() + lifetime)
+    return raw
+
+
+def issue_token_pair(user):
+    return {
+        'access': issue_access_token(user),
+        'refresh': issue_refresh_token(user),
+        'expires_in': getattr(settings, 'ACCESS_TOKEN_LIFETIME', 300),
+    }
+
+
+def rotate_refresh_token(raw):
+    """Spend a refresh token and return a fresh access/refresh pair.
+
+    The conditional UPDATE is the claim: of two concurrent refreshes with the
+    same token only one matches a row.
+    """
+    now = timezone.now()
+    digest = _digest(raw or '')
+    with transaction.atomic():
+        claimed = RefreshToken.objects.filter(digest=digest, revoked_at__isnull=True, expires_at__gt=now).update(revoked_at=now)
+        if not claimed:
+            raise InvalidRefreshToken('Invalid or expired refresh token')
+        user = User.objects.get(refresh_tokens__digest=digest)
+        if not user.is_active:
+            raise InvalidRefreshToken('User inactive or deleted')
+        return issue_token_pair(user)
+
+
+def revoke_refresh_token(raw):
+    return RefreshToken.objects.filter(digest=_digest(raw), revoked_at__isnull=True).update(revoked_at=timezone.now())
+
+
+def revoke_user_refresh_tokens(user_ids):
+    return RefreshToken.objects.filter(user_id__in=list(user_ids), revoked_at__isnull=True).update(revoked_at=timezone.now())
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """``Authorization: Bearer <access token>``, verified by signature alone."""
+
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+        user = read_access_token(auth[1].decode('latin-1'))
+        if user is None:
+            raise exceptions.AuthenticationFailed(_('Invalid or expired token.'))
+        return (user, None)
+
+    def authenticate_header(self, request):
+        return self.keyword
@@ -0,0 +1,487 @@
+"""Shared pieces of the ``manage.py bench_*`` commands.
+
+Synthetic data, a throwaway test database, the request scenarios and
+drivers of bench_api, and the session store, serializer and connection
+mode benchmarks behind bench_sessions, bench_serializers and
+bench_connections.
+"""
+import abc
+import binascii
+import json
+import os
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import close_old_connections, connection, connections, transaction
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .analytics import rebuild_analytics
+from .fares import rebuild_fare_calendar
+from .models import City, Flight, Reservation
+from .routes import flights_changed_in_bulk
+
+
+SCALES = {
+    '1k': 1_000,
+    '10k': 10_000,
+    '100k': 100_000,
+    '1m': 1_000_000,
+}
+BENCH_PASSWORD = 'bench-password'
+SEED_BATCH_SIZE = 5000
+SCHEDULE_DAYS = 90
+BASE_DEPARTURE = datetime(2030, 1, 1)
+# Session benchmarks hash with MD5 so the session store, not PBKDF2, is what gets measured.
+FAST_PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+@contextmanager
+def throwaway_database(keepdb=False, name=None):
+    """Run the block against a fresh test database, destroyed afterwards unless ``keepdb``.
+
+    ``name`` overrides the test database name, e.g. a file for SQLite.
+    """
+    test_settings = connection.settings_dict['TEST']
+    old_test_name = test_settings.get('NAME')
+    if name:
+        test_settings['NAME'] = name
+    setup_test_environment()
+    try:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False, keepdb=keepdb)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            if not keepdb:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+    finally:
+        teardown_test_environment()
+        test_settings['NAME'] = old_test_name
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(name, timings, elapsed, query_counts=None, errors=0, **extra):
+    timings = sorted(timings)
+    result = {
+        'name': name,
+        'requests': len(timings),
+        'errors': errors,
+        'throughput_rps': round(len(timings) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(statistics.median(timings), 2) if timings else None,
+        'p95_ms': round(percentile(timings, 0.95), 2) if timings else None,
+        'p99_ms': round(percentile(timings, 0.99), 2) if timings else None,
+    }
+    if query_counts:
+        result['mean_queries'] = round(statistics.mean(query_counts), 2)
+        result['max_queries'] = max(query_counts)
+    result.update(extra)
+    return result
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class SeedInfo:
+    def __init__(self, city_ids, flight_range, user_count, tokens, seconds):
+        self.city_ids = city_ids
+        self.flight_range = flight_range
+        self.user_count = user_count
+        self.tokens = tokens
+        self.seconds = seconds
+
+
+def seed(flights, reservations, users, cities, rng, batch_size=SEED_BATCH_SIZE, stdout=None):
+    started = time.perf_counter()
+    base = timezone.make_aware(BASE_DEPARTURE)
+
+    def note(message):
+        if stdout is not None:
+            stdout.write(f'{message} ({time.perf_counter() - started:.1f}s)')
+
+    City.objects.bulk_create(
+        City(name=f'City {i}', airport_name=f'City {i} International Airport', airport_code=f'C{i:03}')
+        for i in range(cities)
+    )
+    city_ids = list(City.objects.order_by('id').values_list('id', flat=True))
+    note(f'{len(city_ids)} cities')
+
+    def make_flights():
+        for i in range(flights):
+            origin_id, destination_id = rng.sample(city_ids, 2)
+            departure = base + timedelta(minutes=rng.randrange(SCHEDULE_DAYS * 24 * 60))
+            seat_type = 'business' if i % 5 == 0 else 'economy'
+            yield Flight(
+                flight_number=f'BX{i}', origin_id=origin_id, destination_id=destination_id,
+                departure_time=departure, arrival_time=departure + timedelta(minutes=rng.randrange(50, 300)),
+                return_time=departure + timedelta(days=3), capacity=180, available_seats=180,
+                seat_type=seat_type, economy_class_price=rng.randrange(1500, 9000),
+                business_class_price=rng.randrange(9000, 30000),
+            )
+
+    for batch in _batched(make_flights(), batch_size):
+        with transaction.atomic():
+            Flight.objects.bulk_create(batch)
+    bounds = Flight.objects.aggregate(low=Min('id'), high=Max('id'))
+    flight_range = (bounds['low'], bounds['high'])
+    note(f'{flights} flights')
+
+    # Hash once: hashing per user would dominate seeding at any real scale.
+    password = make_password(BENCH_PASSWORD)
+    for batch in _batched((User(username=f'bench_user_{i}', email=f'bench{i}@example.com', password=password)
+                           for i in range(users)), batch_size):
+        User.objects.bulk_create(batch)
+    user_ids = list(User.objects.filter(username__startswith='bench_user_').order_by('id').values_list('id', flat=True))
+    tokens = [binascii.hexlify(os.urandom(20)).decode() for _ in user_ids]
+    for batch in _batched((Token(key=key, user_id=user_id) for key, user_id in zip(tokens, user_ids)), batch_size):
+        Token.objects.bulk_create(batch)
+    note(f'{users} users')
+
+    def make_reservations():
+        for i in range(reservations):
+            yield Reservation(
+                user_id=rng.choice(user_ids), flight_id=rng.randint(*flight_range),
+                first_name='Bench', middle_name='B', last_name=f'User{i}', email=f'bench{i}@example.com',
+                contact_number='09170000000', seat_type='economy', status=rng.choice(('pending', 'confirmed', 'cancelled')),
+            )
+
+    if user_ids:
+        for batch in _batched(make_reservations(), batch_size):
+            with transaction.atomic():
+                Reservation.objects.bulk_create(batch)
+    note(f'{reservations} reservations')
+
+    rebuild_fare_calendar()
+    rebuild_analytics()
+    flights_changed_in_bulk()
+    note('summaries rebuilt')
+    return SeedInfo(city_ids, flight_range, len(user_ids), tokens, time.perf_counter() - started)
+
+
+class Scenario(abc.ABC):
+    method = 'get'
+    authenticated = False
+
+    def __init__(self, info):
+        self.info = info
+
+    @abc.abstractmethod
+    def request(self, rng):
+        """``(path, data)`` for the next request."""
+
+
+class SearchScenario(Scenario):
+    name = 'search'
+    method = 'post'
+
+    def request(self, rng):
+        origin_id, destination_id = rng.sample(self.info.city_ids, 2)
+        day = BASE_DEPARTURE + timedelta(days=rng.randrange(SCHEDULE_DAYS))
+        return '/search/', {
+            'origin_id': origin_id, 'destination_id': destination_id,
+            'departure_time': day.strftime('%Y-%m-%d %H:%M'), 'seat_type': 'economy',
+        }
+
+
+class CreateReservationScenario(Scenario):
+    name = 'createreservation'
+    method = 'post'
+    authenticated = True
+
+    def request(self, rng):
+        return '/createreservation/', {
+            'flight_id': rng.randint(*self.info.flight_range), 'first_name': 'Bench', 'middle_name': 'B',
+            'last_name': 'Load', 'email': 'load@example.com', 'contact_number': '09170000000',
+        }
+
+
+class ReservationListScenario(Scenario):
+    name = 'reservationlist'
+
+    def request(self, rng):
+        return '/reservationlist/', {'limit': 100}
+
+
+class FlightListScenario(Scenario):
+    name = 'flights'
+
+    def request(self, rng):
+        return '/flights/', {'limit': 100}
+
+
+class LoginScenario(Scenario):
+    name = 'login'
+    method = 'post'
+
+    def request(self, rng):
+        return '/login/', {'username': f'bench_user_{rng.randrange(self.info.user_count)}', 'password': BENCH_PASSWORD}
+
+
+SCENARIOS = {scenario.name: scenario for scenario in (
+    SearchScenario, CreateReservationScenario, ReservationListScenario, FlightListScenario, LoginScenario,
+)}
+
+
+class InProcessDriver:
+    """Drives the Django test client; counts queries on each worker thread's connection."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def call(self, scenario, path, data, token):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False)
+        headers = {'HTTP_AUTHORIZATION': f'Token {token}'} if token else {}
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count):
+            if scenario.method == 'post':
+                response = client.post(path, json.dumps(data), content_type='application/json', **headers)
+            else:
+                response = client.get(path, data, **headers)
+        return response.status_code, queries[0]
+
+
+class RequestCycleDriver(InProcessDriver):
+    """InProcessDriver that also closes old connections around each request, as the
+    WSGI handler does (the test client leaves connections open)."""
+
+    def call(self, scenario, path, data, token):
+        close_old_connections()
+        try:
+            return super().call(scenario, path, data, token)
+        finally:
+            close_old_connections()
+
+
+class HttpDriver:
+    """Drives a running server over HTTP; query counts are not visible from outside."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def call(self, scenario, path, data, token):
+        headers = {'Content-Type': 'application/json'}
+        if token:
+            headers['Authorization'] = f'Token {token}'
+        if scenario.method == 'post':
+            request = urllib.request.Request(self.base_url + path, json.dumps(data).encode(), headers, method='POST')
+        else:
+            query = urllib.parse.urlencode(data)
+            request = urllib.request.Request(f'{self.base_url}{path}?{query}', headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                return response.status, None
+        except urllib.error.HTTPError as exc:
+            return exc.code, None
+
+
+def _timed_request(send):
+    queries = [0]
+
+    def count(execute, sql, params, many, context):
+        queries[0] += 1
+        return execute(sql, params, many, context)
+
+    began = time.perf_counter()
+    with connection.execute_wrapper(count):
+        response = send()
+    return (time.perf_counter() - began) * 1000, queries[0], response.status_code
+
+
+def session_store_benchmark(info, logins, reads, rng):
+    """Time logins (one session write each) and session-authenticated reads
+    against whatever SESSION_ENGINE is active."""
+    client = Client(raise_request_exception=False)
+    summaries = []
+
+    def run(name, count, send):
+        started = time.perf_counter()
+        results = [_timed_request(send) for _ in range(count)]
+        elapsed = time.perf_counter() - started
+        summaries.append(summarize(name, [r[0] for r in results], elapsed, [r[1] for r in results],
+                                   sum(1 for r in results if r[2] >= 400)))
+
+    def login():
+        credentials = {'username': f'bench_user_{rng.randrange(info.user_count)}', 'password': BENCH_PASSWORD}
+        return client.post('/login/', json.dumps(credentials), content_type='application/json')
+
+    run('login', logins, login)
+    run('session_read', reads, lambda: client.get('/user_reservations/'))
+    return summaries
+
+
+def serialization_benchmark(repeat=3):
+    """Seconds to turn every flight into API output, per path.
+
+    ``drf`` is FlightSerializer over model instances, ``values`` the compiled
+    values_list() path; both are then rendered with the stock and orjson renderers.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    from .renderers import ORJSONRenderer
+    from .serializers import FlightSerializer, flight_rows
+
+    flights = Flight.objects.select_related('origin', 'destination').order_by('id')
+    paths = {
+        'drf': lambda: FlightSerializer(flights.all(), many=True).data,
+        'values': lambda: flight_rows.serialize(flight_rows.values(flights.all())),
+    }
+    count = flights.count()
+    results = {}
+    for name, build in paths.items():
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            data = build()
+            timings.append(time.perf_counter() - started)
+        results[f'{name}_serialize_s'] = round(min(timings), 4)
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            started = time.perf_counter()
+            for _ in range(repeat):
+                renderer.render(data)
+            results[f'{name}_render_{type(renderer).__name__}_s'] = round((time.perf_counter() - started) / repeat, 4)
+    results['flights'] = count
+    results['values_speedup'] = round(results['drf_serialize_s'] / results['values_serialize_s'], 1) if results['values_serialize_s'] else None
+    return results
+
+
+# Settings applied to the default alias for each AIRLINE_DB_CONNECTIONS mode.
+CONNECTION_MODES = {
+    'close': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+    'persistent': {'CONN_MAX_AGE': 600, 'CONN_HEALTH_CHECKS': True},
+    'pooled': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+}
+POOL_COUNTERS = ('checkouts', 'connections_opened', 'waits', 'reconnects', 'recycled', 'timeouts')
+
+
+def connection_mode_benchmark(info, modes, scenarios, requests, concurrency, seed_value, pool_size=10):
+    """Drive ``scenarios`` once per connection mode, switching the default alias in between.
+
+    Returns per-mode scenario summaries plus how many connections each mode
+    opened (and the pool counters for ``pooled``).
+    """
+    from django.conf import settings
+    from django.db import DEFAULT_DB_ALIAS, connections
+    from django.db.backends.signals import connection_created
+
+    from .db.pool import close_pools
+    from .metrics import registry
+
+    settings_dict = connections.settings[DEFAULT_DB_ALIAS]
+    original = {key: settings_dict.get(key) for key in ('ENGINE', 'CONN_MAX_AGE', 'CONN_HEALTH_CHECKS', 'POOL')}
+    unpooled = {pooled: engine for engine, pooled in settings.POOLED_ENGINES.items()}
+    base_engine = unpooled.get(original['ENGINE'], original['ENGINE'])
+    opened = [0]
+
+    def count_connection(sender, connection, **kwargs):
+        if connection.alias == DEFAULT_DB_ALIAS:
+            opened[0] += 1
+
+    results = {}
+    connection_created.connect(count_connection)
+    try:
+        for mode in modes:
+            connections.close_all()
+            close_pools()
+            registry.reset()
+            settings_dict.update(CONNECTION_MODES[mode])
+            settings_dict['ENGINE'] = settings.POOLED_ENGINES[base_engine] if mode == 'pooled' else base_engine
+            settings_dict['POOL'] = {'SIZE': pool_size}
+            # Drop this thread's wrapper so the next query builds one for the new engine.
+            del connections[DEFAULT_DB_ALIAS]
+            opened[0] = 0
+            summaries = [run_scenario(SCENARIOS[name](info), RequestCycleDriver(), requests, concurrency, 5, seed_value)
+                         for name in scenarios]
+            result = {'scenarios': summaries, 'connections_opened': opened[0]}
+            if mode == 'pooled':
+                # connection_created fires on every checkout; the pool knows what it really opened.
+                result['pool'] = {counter: registry.value(f'airline_db_pool_{counter}_total', alias=DEFAULT_DB_ALIAS)
+                                  for counter in POOL_COUNTERS}
+                result['connections_opened'] = result['pool']['connections_opened']
+            results[mode] = result
+    finally:
+        connection_created.disconnect(count_connection)
+        connections.close_all()
+        close_pools()
+        for key, value in original.items():
+            if value is None:
+                settings_dict.pop(key, None)
+            else:
+                settings_dict[key] = value
+        del connections[DEFAULT_DB_ALIAS]
+    return results
+
+
+def run_scenario(scenario, driver, requests, concurrency, warmup, seed_value):
+    def worker(index):
+        rng = random.Random(seed_value * 1_000_003 + index)
+        path, data = scenario.request(rng)
+        token = rng.choice(scenario.info.tokens) if scenario.authenticated and scenario.info.tokens else None
+        began = time.perf_counter()
+        status_code, queries = driver.call(scenario, path, data, token)
+        return (time.perf_counter() - began) * 1000, queries, status_code
+
+    for index in range(warmup):
+        worker(-1 - index)
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, range(requests)))
+    else:
+        results = [worker(index) for index in range(requests)]
+    elapsed = time.perf_counter() - started
+
+    timings = [result[0] for result in results]
+    query_counts = [result[1] for result in results if result[1] is not None]
+    errors = sum(1 for result in results if result[2] >= 400)
+    return summarize(scenario.name, timings, elapsed, query_counts, errors, concurrency=concurrency)
+
+
+def compare(baseline, current):
+    previous = {scenario['name']: scenario for scenario in baseline.get('scenarios', [])}
+    rows = []
+    for scenario in current['scenarios']:
+        before = previous.get(scenario['name'])
+        if before is None:
+            continue
+        row = {'name': scenario['name']}
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'throughput_rps', 'mean_queries'):
+            if before.get(key) and scenario.get(key) is not None:
+                row[key] = f"{before[key]} -> {scenario[key]} ({(scenario[key] - before[key]) / before[key]:+.0%})"
+        rows.append(row)
+    return rows
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.utils.http import parse_etags, quote_etag
+
+from .models import City
+
+
+CITY_NAMESPACE = 'cities'
+CITY_FIELDS = ('id', 'name', 'airport_name', 'airport_code', 'status')
+
+
+def get_cache():
+    return caches[getattr(settings, 'AIRLINE_CACHE_ALIAS', 'default')]
+
+
+def _version_key(namespace):
+    return f'airline:{namespace}:version'
+
+
+def get_version(namespace):
+    cache = get_cache()
+    version = cache.get(_version_key(namespace))
+    if version is None:
+        # Seed from the clock so a version key lost to eviction or a restart can
+        # never come back at a number that still has entries cached under it.
+        cache.add(_version_key(namespace), time.time_ns(), None)
+        version = cache.get(_version_key(namespace), time.time_ns())
+    return version
+
+
+def get_versions(*namespaces):
+    """get_version() for several namespaces in one cache round trip."""
+    found = get_cache().get_many([_version_key(namespace) for namespace in namespaces])
+    return [
+        found[_version_key(namespace)] if _version_key(namespace) in found else get_version(namespace)
+        for namespace in namespaces
+    ]
+
+
+def bump_version(namespace):
+    cache = get_cache()
+    try:
+        return cache.incr(_version_key(namespace))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(_version_key(namespace), version, None)
+        return version
+
+
+def versioned_key(namespace, key):
+    return f'airline:{namespace}:{get_version(namespace)}:{key}'
+
+
+def make_etag(data):
+    raw = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True, separators=(',', ':'))
+    return quote_etag(hashlib.md5(raw.encode()).hexdigest())
+
+
+def read_through(namespace, key, build, timeout):
+    """Return ``{'data': ..., 'etag': ...}`` for ``key``, building it on a miss.
+
+    ``build`` returns the data or ``None`` when there is nothing to cache.
+    """
+    cache = get_cache()
+    cache_key = versioned_key(namespace, key)
+    entry = cache.get(cache_key)
+    if entry is None:
+        data = build()
+        if data is None:
+            return None
+        entry = {'data': data, 'etag': make_etag(data)}
+        cache.set(cache_key, entry, timeout)
+    return entry
+
+
+def peek(namespace, key):
+    return get_cache().get(versioned_key(namespace, key))
+
+
+def etag_matches(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags or etag in [tag.removeprefix('W/') for tag in etags]
+
+
+def city_cache_seconds():
+    return getattr(settings, 'CITY_CACHE_SECONDS', 3600)
+
+
+def city_list():
+    return read_through(CITY_NAMESPACE, 'list', lambda: list(City.objects.order_by('id').values(*CITY_FIELDS)),
+                        city_cache_seconds())
+
+
+def cached_city_list():
+    return peek(CITY_NAMESPACE, 'list')
+
+
+def city_detail(city_id):
+    def build():
+        return City.objects.filter(pk=city_id).values(*CITY_FIELDS[1:]).first()
+
+    return read_through(CITY_NAMESPACE, f'detail:{city_id}', build, city_cache_seconds())
+
+
+def invalidate_cities():
+    """Drop the cached city lists and details.
+
+    Bumped now, and again once the transaction commits: a read that ran in
+    between saw the old rows and may have cached them under the new version.
+    """
+    bump_version(CITY_NAMESPACE)
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: bump_version(CITY_NAMESPACE))
@@ -0,0 +1,223 @@
+import os
+import threading
+import time
+from collections import deque
+
+from django.db import DatabaseError
+
+from ..metrics import LATENCY_BUCKETS, registry
+
+
+POOL_DEFAULTS = {
+    # Connections kept open per process, idle or checked out.
+    'SIZE': 10,
+    # Seconds after which a connection is closed instead of reused.
+    'RECYCLE': 30 * 60,
+    # Seconds a checkout waits for a free connection before giving up.
+    'TIMEOUT': 10,
+    # Connections idle longer than this are pinged before they are handed out.
+    'PING_AFTER': 30,
+}
+
+
+class PoolTimeout(DatabaseError):
+    pass
+
+
+class ConnectionPool:
+    """A bounded, thread-safe set of open DB-API connections for one database.
+
+    ``ping`` raises if a connection is dead.
+    """
+
+    def __init__(self, alias, ping, size, recycle, timeout, ping_after):
+        self.alias = alias
+        self.ping = ping
+        self.size = size
+        self.recycle = recycle
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+        self.closed = False
+        self._idle = deque()  # (connection, opened_at, returned_at)
+        self._opened = {}  # id(connection) -> opened_at, for everything counted against size
+        self._available = threading.Condition(threading.Lock())
+
+    def checkout(self, connect):
+        """An idle connection if one is healthy, else a new one from ``connect()`` while under SIZE."""
+        registry.inc('airline_db_pool_checkouts_total', alias=self.alias)
+        deadline = None
+        with self._available:
+            while True:
+                while self._idle:
+                    conn, opened_at, returned_at = self._idle.pop()
+                    now = time.monotonic()
+                    if now - opened_at >= self.recycle:
+                        registry.inc('airline_db_pool_recycled_total', alias=self.alias)
+                        self._discard(conn)
+                        continue
+                    if now - returned_at >= self.ping_after and not self._alive(conn):
+                        registry.inc('airline_db_pool_reconnects_total', alias=self.alias)
+                        self._discard(conn)
+                        continue
+                    return conn
+                if len(self._opened) < self.size:
+                    # Reserve the slot, then connect outside the lock.
+                    slot = object()
+                    self._opened[id(slot)] = None
+                    break
+                if deadline is None:
+                    registry.inc('airline_db_pool_waits_total', alias=self.alias)
+                    started = time.monotonic()
+                    deadline = started + self.timeout
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._available.wait(remaining):
+                    if not self._idle and len(self._opened) >= self.size:
+                        registry.inc('airline_db_pool_timeouts_total', alias=self.alias)
+                        raise PoolTimeout(f'No connection to {self.alias!r} became free within {self.timeout}s')
+            if deadline is not None:
+                registry.observe('airline_db_pool_wait_seconds', time.monotonic() - started, alias=self.alias)
+
+        try:
+            conn = connect()
+        except BaseException:
+            with self._available:
+                del self._opened[id(slot)]
+                self._available.notify()
+            raise
+        with self._available:
+            del self._opened[id(slot)]
+            self._opened[id(conn)] = time.monotonic()
+        registry.inc('airline_db_pool_connections_opened_total', alias=self.alias)
+        return conn
+
+    def checkin(self, conn):
+        with self._available:
+            opened_at = self._opened.get(id(conn))
+            if opened_at is None or self.closed:
+                self._discard(conn)
+                return
+            self._idle.append((conn, opened_at, time.monotonic()))
+            self._available.notify()
+
+    def discard(self, conn):
+        with self._available:
+            self._discard(conn)
+
+    def _discard(self, conn):
+        # Caller holds the lock.
+        self._opened.pop(id(conn), None)
+        self._close_quietly(conn)
+        self._available.notify()
+
+    def _alive(self, conn):
+        try:
+            self.ping(conn)
+        except Exception:
+            return False
+        return True
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close_idle(self):
+        with self._available:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def stats(self):
+        with self._available:
+            return {'open': len(self._opened), 'idle': len(self._idle), 'size': self.size}
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(wrapper):
+    """The process-wide pool for ``wrapper``'s database, created on first use.
+
+    Keyed by where the wrapper connects, so switching to the test database
+    gets a fresh pool. A forked child never reuses its parent's sockets.
+    """
+    settings_dict = wrapper.settings_dict
+    key = (wrapper.alias, settings_dict['NAME'], settings_dict['HOST'], settings_dict['PORT'], settings_dict['USER'])
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None or pool.pid != os.getpid():
+            options = {**POOL_DEFAULTS, **settings_dict.get('POOL', {})}
+            pool = _pools[key] = ConnectionPool(
+                wrapper.alias, ping=ping,
+                size=options['SIZE'], recycle=options['RECYCLE'], timeout=options['TIMEOUT'],
+                ping_after=options['PING_AFTER'],
+            )
+        return pool
+
+
+def ping(conn):
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT 1')
+        cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def pool_stats():
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.alias: pool.stats() for pool in pools}
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.closed = True
+        pool.close_idle()
+
+
+class PooledConnectionMixin:
+    """Hands connections out of a per-process ConnectionPool instead of opening one per request.
+
+    Combine with a backend's DatabaseWrapper (see db/mysql and db/sqlite3).
+    Closing the wrapper, which Django does at the end of every request with
+    CONN_MAX_AGE = 0, returns the connection to the pool. A connection closed
+    mid-transaction or after an error it can't recover from is dropped instead.
+    """
+
+    connection_pool = None
+
+    def get_new_connection(self, conn_params):
+        self.connection_pool = get_pool(self)
+        return self.connection_pool.checkout(lambda: super(PooledConnectionMixin, self).get_new_connection(conn_params))
+
+    def _close(self):
+        pool, conn = self.connection_pool, self.connection
+        if pool is None:
+            return super()._close()
+        if conn is None or pool.pid != os.getpid():
+            # Inherited across a fork: the socket belongs to the parent.
+            return
+        try:
+            if self.in_atomic_block or (self.errors_occurred and not self.is_usable()):
+                raise DatabaseError('connection is not reusable')
+            if not self.get_autocommit():
+                conn.rollback()
+        except Exception:
+            pool.discard(conn)
+            return
+        pool.checkin(conn)
+
+
+registry.describe('airline_db_pool_checkouts_total', 'counter', 'Connections handed out by the pool, by alias.')
+registry.describe('airline_db_pool_connections_opened_total', 'counter', 'New connections the pool had to open.')
+registry.describe('airline_db_pool_waits_total', 'counter', 'Checkouts that waited because every connection was in use.')
+registry.describe('airline_db_pool_wait_seconds', 'histogram', 'Time checkouts spent waiting for a free connection.', LATENCY_BUCKETS)
+registry.describe('airline_db_pool_timeouts_total', 'counter', 'Checkouts that gave up waiting for a free connection.')
+registry.describe('airline_db_pool_reconnects_total', 'counter', 'Idle connections that failed their health check and were replaced.')
+registry.describe('airline_db_pool_recycled_total', 'counter', 'Connections closed for reaching the pool RECYCLE age.')
@@ -0,0 +1,12 @@
+from django.db.backends.sqlite3 import base
+
+from ..pool import PooledConnectionMixin
+
+
+class DatabaseWrapper(PooledConnectionMixin, base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        if self.is_in_memory_db():
+            # Django never closes in-memory databases, so they would never come back to the pool.
+            self.connection_pool = None
+            return base.DatabaseWrapper.get_new_connection(self, conn_params)
+        return super().get_new_connection(conn_params)
@@ -0,0 +1,131 @@
+import logging
+from datetime import datetime, time, timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import FareCalendarDay, Flight
+
+
+logger = logging.getLogger('airlineapp.fares')
+
+REFRESH_ROUTES_PER_QUERY = 100
+FARE_DAY_FIELDS = ['min_economy_price', 'min_business_price', 'flights']
+
+
+def fare_day_aggregates(flights):
+    return (
+        flights.annotate(day=TruncDate('departure_time'))
+        .values('origin_id', 'destination_id', 'day')
+        .annotate(
+            min_economy_price=Min('economy_class_price'),
+            min_business_price=Min('business_class_price'),
+            flights=Count('id'),
+        )
+        .order_by()
+    )
+
+
+def fare_day_key(origin_id, destination_id, departure_time):
+    return origin_id, destination_id, timezone.localtime(departure_time).date()
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def route_days_flight_filter(routes):
+    """Q matching flights departing on any of ``[((origin_id, destination_id), days), ...]``.
+
+    Each route is bounded by its first and last day, so callers still filter
+    the results down to the exact days.
+    """
+    return reduce(or_, (
+        Q(origin_id=origin_id, destination_id=destination_id,
+          departure_time__gte=_day_start(min(days)), departure_time__lt=_day_start(max(days) + timedelta(days=1)))
+        for (origin_id, destination_id), days in routes
+    ))
+
+
+def group_route_days(keys):
+    routes = {}
+    for origin_id, destination_id, day in keys:
+        if None not in (origin_id, destination_id, day):
+            routes.setdefault((origin_id, destination_id), set()).add(day)
+    return list(routes.items())
+
+
+def refresh_fare_days(keys):
+    """Recompute the FareCalendarDay rows for ``(origin_id, destination_id, day)`` keys."""
+    routes = group_route_days(keys)
+    for start in range(0, len(routes), REFRESH_ROUTES_PER_QUERY):
+        _refresh_routes(routes[start:start + REFRESH_ROUTES_PER_QUERY])
+
+
+def _refresh_after_commit(keys):
+    try:
+        refresh_fare_days(keys)
+    except DatabaseError as exc:
+        # The flight write has committed; the days stay stale until the next
+        # change on them or `manage.py refresh_fare_calendar`.
+        logger.warning('fare calendar refresh failed for %s: %s', sorted(keys), exc)
+
+
+def fare_days_changed(keys):
+    """Refresh the fare calendar for ``keys`` once the current transaction commits.
+
+    Deferred so the refresh reads committed flights and never fails the write
+    that triggered it.
+    """
+    keys = set(keys)
+    if keys:
+        transaction.on_commit(lambda: _refresh_after_commit(keys))
+
+
+def _refresh_routes(routes):
+    keys = {(origin_id, destination_id, day) for (origin_id, destination_id), days in routes for day in days}
+    rows = {}
+    for values in fare_day_aggregates(Flight.objects.filter(route_days_flight_filter(routes))):
+        key = (values['origin_id'], values['destination_id'], values['day'])
+        if key in keys:
+            rows[key] = FareCalendarDay(**values)
+    gone = group_route_days(keys - rows.keys())
+
+    # An upsert in key order rather than delete-and-insert, so concurrent
+    # refreshes of the same day update one row instead of colliding on the
+    # (origin, destination, day) constraint. MySQL infers the conflict target.
+    unique_fields = ['origin', 'destination', 'day'] if connection.features.supports_update_conflicts_with_target else None
+    with transaction.atomic():
+        FareCalendarDay.objects.bulk_create(
+            [rows[key] for key in sorted(rows)],
+            update_conflicts=True, unique_fields=unique_fields, update_fields=FARE_DAY_FIELDS,
+        )
+        if gone:
+            FareCalendarDay.objects.filter(reduce(or_, (
+                Q(origin_id=origin_id, destination_id=destination_id, day__in=days)
+                for (origin_id, destination_id), days in gone
+            ))).delete()
+
+
+def rebuild_fare_calendar(batch_size=5000):
+    with transaction.atomic():
+        FareCalendarDay.objects.all().delete()
+        batch = []
+        for values in fare_day_aggregates(Flight.objects.all()).iterator(chunk_size=batch_size):
+            batch.append(FareCalendarDay(**values))
+            if len(batch) >= batch_size:
+                FareCalendarDay.objects.bulk_create(batch)
+                batch = []
+        FareCalendarDay.objects.bulk_create(batch)
+
+
+def fare_calendar(origin_id, destination_id, start, end):
+    return list(
+        FareCalendarDay.objects.filter(origin_id=origin_id, destination_id=destination_id, day__gte=start, day__lte=end)
+        .order_by('day')
+        .values('day', 'min_economy_price', 'min_business_price', 'flights')
+    )
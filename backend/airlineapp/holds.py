@@ -0,0 +1,70 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .analytics import flight_stats_stale
+from .inventory import release_seat
+from .metrics import registry
+from .models import Flight, Reservation
+from .search_cache import seats_changed
+
+
+HOLD_SWEEP_BATCH_SIZE = 1000
+
+
+def expire_holds(batch_size=HOLD_SWEEP_BATCH_SIZE, now=None):
+    """Cancel pending reservations whose hold has lapsed and give their seats back.
+
+    Works through the (status, expires_at) index one batch per transaction, so
+    the sweep holds locks on at most ``batch_size`` reservations at a time.
+    Returns the number of holds expired.
+    """
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        count = _expire_batch(batch_size, now)
+        expired += count
+        if count < batch_size:
+            return expired
+
+
+def _expire_batch(batch_size, now):
+    with transaction.atomic():
+        # Only the reservation rows are locked; the flight's route comes along for the search cache.
+        rows = list(
+            Reservation.objects.select_for_update(skip_locked=True, of=('self',))
+            .filter(status='pending', expires_at__lt=now)
+            .order_by('expires_at')
+            .values_list('id', 'flight_id', 'seat_number', 'flight__origin_id', 'flight__destination_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+        Reservation.objects.filter(pk__in=[row[0] for row in rows]).update(status='cancelled', expires_at=None)
+
+        seats_by_flight = Counter(flight_id for _, flight_id, seat_number, _, _ in rows if not seat_number)
+        if seats_by_flight:
+            returned = Case(*[When(pk=flight_id, then=Value(seats)) for flight_id, seats in seats_by_flight.items()],
+                            output_field=IntegerField())
+            Flight.objects.filter(pk__in=seats_by_flight).update(
+                available_seats=Least(F('available_seats') + returned, F('capacity')),
+            )
+            routes = {(origin_id, destination_id) for _, flight_id, _, origin_id, destination_id in rows if flight_id in seats_by_flight}
+            seats_changed(routes, seats_by_flight)
+        for _, flight_id, seat_number, _, _ in rows:
+            if seat_number:
+                release_seat(flight_id, seat_number)
+        # The UPDATEs above bypass the Reservation signals.
+        flight_stats_stale(flight_id for _, flight_id, _, _, _ in rows)
+
+    registry.inc('airline_holds_expired_total', len(rows))
+    return len(rows)
+
+
+def convert_hold(reservation):
+    """Record a held reservation being confirmed: it no longer expires."""
+    Reservation.objects.filter(pk=reservation.pk).update(expires_at=None)
+    reservation.expires_at = None
+    registry.inc('airline_holds_converted_total')
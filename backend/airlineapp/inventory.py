@@ -0,0 +1,193 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from .metrics import registry
+from .models import Flight, Reservation
+from .search_cache import seats_changed
+from .seatmap import SEAT_MAP_FIELDS, SeatLayout, clear_bit, is_set, seat_label, set_bit
+
+
+CLAIM_ATTEMPTS = 5
+
+
+class SeatInventoryError(Exception):
+    message = 'Seats unavailable'
+
+    def __str__(self):
+        return self.message
+
+
+class SoldOut(SeatInventoryError):
+    message = 'Sold out'
+
+
+class SeatTypeUnavailable(SeatInventoryError):
+    message = 'Seat type not offered on this flight'
+
+
+class NoSuchSeat(SeatInventoryError):
+    message = 'No such seat on this flight'
+
+
+class SeatTaken(SeatInventoryError):
+    message = 'Seat already taken'
+
+
+class SeatMapBusy(SeatInventoryError):
+    message = 'Seat map is busy, try again'
+
+
+class SeatMapInUse(SeatInventoryError):
+    message = 'Seats are already assigned on this flight'
+
+
+def flight_route(flight_id):
+    """``(origin_id, destination_id)`` of the flight, for callers that haven't loaded it."""
+    return Flight.objects.filter(pk=flight_id).values_list('origin_id', 'destination_id').first() or (None, None)
+
+
+def reserve_seats(flight_id, seat_type, seats=1, route=None):
+    # A single conditional UPDATE: the row lock taken by the write serialises
+    # concurrent bookers, and the available_seats >= n guard means the counter
+    # can never go negative. The cabin is part of the predicate so an economy
+    # booking never draws from a business flight's inventory.
+    updated = Flight.objects.filter(
+        pk=flight_id, seat_type=seat_type, available_seats__gte=seats,
+    ).update(available_seats=F('available_seats') - seats)
+    if updated:
+        seats_changed([route or flight_route(flight_id)], {flight_id: -seats})
+        return
+
+    flight = Flight.objects.filter(pk=flight_id).values('seat_type').first()
+    if flight is None:
+        raise Flight.DoesNotExist(f'Flight {flight_id} does not exist')
+    if flight['seat_type'] != seat_type:
+        raise SeatTypeUnavailable()
+    raise SoldOut()
+
+
+def release_seats(flight_id, seats=1, route=None):
+    Flight.objects.filter(pk=flight_id).update(
+        available_seats=Least(F('available_seats') + seats, F('capacity')),
+    )
+    seats_changed([route or flight_route(flight_id)], {flight_id: seats})
+
+
+def _load_seat_map(flight_id):
+    # Locking read: on MySQL/PostgreSQL concurrent claims queue on the row and
+    # always see the latest bitmap. SQLite has no row locks; the version check
+    # in _swap_seat_map catches the race there and the caller retries.
+    flight = Flight.objects.select_for_update().filter(pk=flight_id).values(*SEAT_MAP_FIELDS, 'origin_id', 'destination_id').first()
+    if flight is None:
+        raise Flight.DoesNotExist(f'Flight {flight_id} does not exist')
+    layout = SeatLayout.for_flight(flight['seat_layout'], flight['capacity'], flight['seat_type'])
+    return flight, layout, layout.bitmap(flight['occupied_seats'])
+
+
+def _swap_seat_map(flight, bits, **changes):
+    # Compare-and-swap on seat_map_version: the bitmap is rewritten only if no
+    # other claim or release landed since it was read.
+    return Flight.objects.filter(pk=flight['id'], seat_map_version=flight['seat_map_version'], **changes.pop('guard', {})).update(
+        occupied_seats=bytes(bits), seat_map_version=F('seat_map_version') + 1, **changes,
+    )
+
+
+def claim_seat(flight_id, seat, seat_type=None):
+    """Mark one seat occupied and take it out of available_seats; returns its label."""
+    for _ in range(CLAIM_ATTEMPTS):
+        with transaction.atomic():
+            flight, layout, bits = _load_seat_map(flight_id)
+            located = layout.locate(seat)
+            if located is None:
+                raise NoSuchSeat()
+            cabin, index = located
+            if cabin.seat_class != flight['seat_type'] or (seat_type and seat_type != flight['seat_type']):
+                raise SeatTypeUnavailable()
+            if is_set(bits, index):
+                raise SeatTaken()
+            if flight['available_seats'] < 1:
+                raise SoldOut()
+            set_bit(bits, index)
+            if _swap_seat_map(flight, bits, guard={'available_seats__gte': 1}, available_seats=F('available_seats') - 1):
+                seats_changed([(flight['origin_id'], flight['destination_id'])], {flight_id: -1})
+                return seat_label(cabin, index)
+    raise SeatMapBusy()
+
+
+def release_seat(flight_id, seat):
+    """Free a claimed seat and return it to available_seats; a no-op if it was free."""
+    for _ in range(CLAIM_ATTEMPTS):
+        with transaction.atomic():
+            flight, layout, bits = _load_seat_map(flight_id)
+            located = layout.locate(seat)
+            if located is None or not is_set(bits, located[1]):
+                return False
+            clear_bit(bits, located[1])
+            if _swap_seat_map(flight, bits, available_seats=Least(F('available_seats') + 1, F('capacity'))):
+                seats_changed([(flight['origin_id'], flight['destination_id'])], {flight_id: 1})
+                return True
+    raise SeatMapBusy()
+
+
+def set_seat_layout(flight_id, cabins):
+    """Replace a flight's layout; only allowed while no seat is assigned."""
+    layout = SeatLayout(cabins)
+    with transaction.atomic():
+        flight, _, bits = _load_seat_map(flight_id)
+        if any(bits):
+            raise SeatMapInUse()
+        if not _swap_seat_map(flight, b'', seat_layout=[cabin.to_json() for cabin in layout.cabins]):
+            raise SeatMapBusy()
+    return layout
+
+
+def release_reservation_seats(reservation):
+    if reservation.seat_number:
+        release_seat(reservation.flight_id, reservation.seat_number)
+    else:
+        release_seats(reservation.flight_id)
+
+
+def reinstate_reservation_seats(reservation):
+    """Take a cancelled reservation's seat back; raises SeatInventoryError if it's gone.
+
+    A reinstated pending reservation gets a fresh hold.
+    """
+    if reservation.seat_number:
+        claim_seat(reservation.flight_id, reservation.seat_number, reservation.seat_type)
+    else:
+        reserve_seats(reservation.flight_id, reservation.seat_type)
+    if reservation.status == 'pending':
+        reservation.expires_at = hold_expiry()
+        Reservation.objects.filter(pk=reservation.pk).update(expires_at=reservation.expires_at)
+
+
+def hold_expiry():
+    return timezone.now() + timedelta(minutes=getattr(settings, 'RESERVATION_HOLD_MINUTES', 15))
+
+
+def book_reservation(flight_id, seat_type=None, seats=1, seat_number=None, **fields):
+    flight = Flight.objects.filter(pk=flight_id).values('seat_type', 'origin_id', 'destination_id').first()
+    if flight is None:
+        raise Flight.DoesNotExist(f'Flight {flight_id} does not exist')
+    seat_type = seat_type or flight['seat_type']
+
+    held = fields.get('status', 'pending') == 'pending'
+    if held:
+        fields.setdefault('expires_at', hold_expiry())
+
+    with transaction.atomic():
+        if seat_number:
+            seat_number = claim_seat(flight_id, seat_number, seat_type)
+        else:
+            reserve_seats(flight_id, seat_type, seats, route=(flight['origin_id'], flight['destination_id']))
+        reservation = Reservation.objects.create(flight_id=flight_id, seat_type=seat_type, seat_number=seat_number or '', **fields)
+    if held:
+        registry.inc('airline_holds_created_total')
+    return reservation
+
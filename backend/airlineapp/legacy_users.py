@@ -0,0 +1,139 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+from dateutil import parser
+from django.contrib.auth.hashers import identify_hasher, is_password_usable, make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import AuthUser, Passenger
+
+
+LEGACY_CHUNK_SIZE = 2000
+LEGACY_USER_FIELDS = ('id', 'username', 'password', 'email', 'is_superuser', 'is_staff', 'is_active', 'last_login', 'data_joined')
+TRUE_VALUES = {'1', 't', 'true', 'y', 'yes'}
+NULL_DATES = {'', 'null', 'none', '0000-00-00 00:00:00'}
+
+
+class MigrationReport:
+    def __init__(self, last_id=0):
+        self.last_id = last_id
+        self.read = 0
+        self.migrated = 0
+        self.passengers = 0
+        self.skipped = 0
+        self.without_password = 0
+        self.errors = []
+
+    def add_error(self, legacy_id, error):
+        self.errors.append({'id': legacy_id, 'error': error})
+
+
+def to_bool(value):
+    return (value or '').strip().lower() in TRUE_VALUES
+
+
+def to_datetime(value):
+    value = (value or '').strip()
+    if value.lower() in NULL_DATES:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        parsed = parser.parse(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+
+def hash_password(raw, hasher='default', reset=False):
+    """A Django password value for a legacy password.
+
+    Values already in Django's hash format are kept; blank ones become unusable.
+    Plaintext ones are hashed at full strength, or with ``reset`` made unusable
+    too, so the user has to reset the password before logging in.
+    """
+    if not raw:
+        return make_password(None)
+    try:
+        identify_hasher(raw)
+    except ValueError:
+        return make_password(None if reset else raw, hasher=hasher)
+    return raw
+
+
+def migrate_legacy_users(after=0, chunk_size=LEGACY_CHUNK_SIZE, hasher='default', reset_passwords=False,
+                         hash_workers=None, on_chunk=None):
+    """Copy AuthUser rows with ids above ``after`` into User, plus a Passenger for non-staff users.
+
+    Reads by primary key, ``chunk_size`` rows at a time, and writes each chunk
+    in its own transaction. Password hashing, the slow part, runs on
+    ``hash_workers`` threads before the transaction opens (hashlib releases the
+    GIL); at the default work factor that is about a third of a CPU second per
+    user. ``reset_passwords`` skips it and leaves plaintext passwords unusable,
+    for tables too large to hash in one sitting. Usernames that already exist are skipped, so re-running a chunk is
+    harmless. ``on_chunk(report)`` is called after every commit; ``report.last_id``
+    is then safe to resume from.
+    """
+    report = MigrationReport(after)
+    with ThreadPoolExecutor(hash_workers) as pool:
+        while True:
+            rows = list(
+                AuthUser.objects.filter(pk__gt=report.last_id).order_by('pk').values_list(*LEGACY_USER_FIELDS)[:chunk_size]
+            )
+            if not rows:
+                return report
+            _migrate_chunk(rows, report, partial(hash_password, hasher=hasher, reset=reset_passwords), pool)
+            report.read += len(rows)
+            report.last_id = rows[-1][0]
+            if on_chunk is not None:
+                on_chunk(report)
+
+
+def _migrate_chunk(rows, report, hash_one, pool):
+    users = {}
+    for legacy_id, username, password, email, is_superuser, is_staff, is_active, last_login, date_joined in rows:
+        username = (username or '').strip()
+        if not username:
+            report.add_error(legacy_id, 'username is blank')
+            continue
+        if username in users:
+            report.skipped += 1
+            continue
+        try:
+            last_login = to_datetime(last_login)
+            date_joined = to_datetime(date_joined) or timezone.now()
+        except (ValueError, OverflowError) as exc:
+            report.add_error(legacy_id, f'invalid date: {exc}')
+            continue
+        users[username] = User(
+            username=username, password=password, email=(email or '').strip(),
+            is_superuser=to_bool(is_superuser), is_staff=to_bool(is_staff), is_active=to_bool(is_active),
+            last_login=last_login, date_joined=date_joined,
+        )
+
+    for username in User.objects.filter(username__in=list(users)).values_list('username', flat=True):
+        del users[username]
+        report.skipped += 1
+    if not users:
+        return
+
+    users = list(users.values())
+    for user, password in zip(users, pool.map(hash_one, [user.password for user in users])):
+        user.password = password
+    without_password = sum(not is_password_usable(user.password) for user in users)
+
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        # MySQL does not hand back the new ids.
+        if any(user.pk is None for user in users):
+            ids = dict(User.objects.filter(username__in=[user.username for user in users]).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        # Staff are admins, who have no passenger profile.
+        passengers = [Passenger(user_id=user.pk, contact_number='', gender='', address='')
+                      for user in users if not user.is_staff and not user.is_superuser]
+        Passenger.objects.bulk_create(passengers)
+    report.migrated += len(users)
+    report.passengers += len(passengers)
+    report.without_password += without_password
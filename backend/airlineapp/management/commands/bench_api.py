@@ -0,0 +1,78 @@
+import json
+import random
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from airlineapp.benchmarks import SCALES, SCENARIOS, HttpDriver, InProcessDriver, compare, run_scenario, seed, throwaway_database
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Seed synthetic cities, flights, users and reservations into a throwaway test database and '
+            'drive the REST endpoints, reporting latency percentiles, throughput and query counts as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='1k',
+                            help='Number of flights and reservations; users and cities scale with it.')
+        parser.add_argument('--flights', type=int)
+        parser.add_argument('--reservations', type=int)
+        parser.add_argument('--users', type=int)
+        parser.add_argument('--cities', type=int)
+        parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS),
+                            default=['search', 'flights', 'reservationlist', 'createreservation', 'login'])
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--login-requests', type=int, default=20, help='Login runs the password hasher; keep it short.')
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--warmup', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--keepdb', action='store_true', help='Reuse (and do not destroy) the test database.')
+        parser.add_argument('--url', help='Drive a running server at this base URL instead of the test client. '
+                                          'The server must be using the seeded database.')
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        parser.add_argument('--compare', help='A previous JSON report to diff against.')
+
+    def handle(self, *args, **options):
+        size = SCALES[options['scale']]
+        flights = options['flights'] if options['flights'] is not None else size
+        reservations = options['reservations'] if options['reservations'] is not None else size
+        users = options['users'] if options['users'] is not None else max(10, size // 10)
+        cities = options['cities'] if options['cities'] is not None else min(200, max(10, size // 100))
+        if cities < 2:
+            raise CommandError('At least two cities are needed.')
+
+        with throwaway_database(keepdb=options['keepdb']):
+            rng = random.Random(options['seed'])
+            info = seed(flights, reservations, users, cities, rng, stdout=self.stderr)
+            driver = HttpDriver(options['url']) if options['url'] else InProcessDriver()
+            scenarios = []
+            for name in options['scenarios']:
+                requests = options['login_requests'] if name == 'login' else options['requests']
+                self.stderr.write(f'running {name} x{requests}')
+                scenarios.append(run_scenario(SCENARIOS[name](info), driver, requests,
+                                              options['concurrency'], options['warmup'], options['seed']))
+
+        report = {
+            'commit': current_commit(),
+            'database': connection.vendor,
+            'driver': 'http' if options['url'] else 'test-client',
+            'dataset': {'flights': flights, 'reservations': reservations, 'users': users, 'cities': cities,
+                        'seed_seconds': round(info.seconds, 2)},
+            'scenarios': scenarios,
+        }
+        if options['compare']:
+            with open(options['compare']) as stream:
+                report['compared_to'] = compare(json.load(stream), report)
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                stream.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,104 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client
+from django.utils import timezone
+
+from airlineapp.benchmarks import summarize, throwaway_database
+from airlineapp.models import City, Flight
+
+
+ENDPOINTS = {
+    'flights': ('/flights/', '/async/flights/'),
+    'get_flight': ('/get_flight/{flight_id}/', '/async/get_flight/{flight_id}/'),
+    'cities': ('/cities/', '/async/cities/'),
+}
+
+
+class Command(BaseCommand):
+    help = ('Compare the sync (WSGI, thread-per-request) and async (ASGI) read endpoints in one process '
+            'against a throwaway test database, with optional simulated database latency.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='get_flight')
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads.')
+        parser.add_argument('--concurrency', type=int, default=64, help='In-flight ASGI requests.')
+        parser.add_argument('--flights', type=int, default=200)
+        parser.add_argument('--db-latency-ms', type=float, default=2.0,
+                            help='Sleep added to every query to stand in for a network round-trip.')
+
+    def handle(self, *args, **options):
+        latency = options['db_latency_ms'] / 1000
+
+        def slow_query(execute, sql, params, many, context):
+            time.sleep(latency)
+            return execute(sql, params, many, context)
+
+        def add_latency(sender, connection, **kwargs):
+            connection.execute_wrappers.append(slow_query)
+
+        with throwaway_database():
+            try:
+                flight_id = self.seed(options['flights'])
+                sync_path, async_path = (path.format(flight_id=flight_id) for path in ENDPOINTS[options['endpoint']])
+                if latency:
+                    connection_created.connect(add_latency)
+                    connection.execute_wrappers.append(slow_query)
+                results = [
+                    self.run_sync(sync_path, options['requests'], options['threads']),
+                    asyncio.run(self.run_async(async_path, options['requests'], options['concurrency'])),
+                ]
+            finally:
+                connection_created.disconnect(add_latency)
+                connection.execute_wrappers[:] = [wrapper for wrapper in connection.execute_wrappers if wrapper is not slow_query]
+
+        self.stdout.write(json.dumps({'endpoint': options['endpoint'], 'db_latency_ms': options['db_latency_ms'],
+                                      'results': results}, indent=2))
+
+    def seed(self, count):
+        origin = City.objects.create(name='Cebu', airport_code='CEB')
+        destination = City.objects.create(name='Manila', airport_code='MNL')
+        start = timezone.now()
+        Flight.objects.bulk_create(
+            Flight(flight_number=f'PR{i}', origin=origin, destination=destination,
+                   departure_time=start + timedelta(hours=i), arrival_time=start + timedelta(hours=i + 1),
+                   return_time=start + timedelta(days=3), capacity=180, available_seats=180)
+            for i in range(count)
+        )
+        return Flight.objects.order_by('id').values_list('id', flat=True).first()
+
+    def run_sync(self, path, requests, threads):
+        client = Client()
+
+        def one(_):
+            began = time.perf_counter()
+            response = client.get(path)
+            assert response.status_code == 200, response.status_code
+            return (time.perf_counter() - began) * 1000
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            timings = list(pool.map(one, range(requests)))
+        return summarize(f'wsgi ({threads} threads)', timings, time.perf_counter() - started)
+
+    async def run_async(self, path, requests, concurrency):
+        client = AsyncClient()
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with gate:
+                began = time.perf_counter()
+                response = await client.get(path)
+                assert response.status_code == 200, response.status_code
+                return (time.perf_counter() - began) * 1000
+
+        started = time.perf_counter()
+        timings = await asyncio.gather(*(one() for _ in range(requests)))
+        return summarize(f'asgi ({concurrency} in flight)', timings, time.perf_counter() - started)
@@ -0,0 +1,43 @@
+import json
+import os
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from airlineapp.benchmarks import CONNECTION_MODES, SCENARIOS, connection_mode_benchmark, seed, throwaway_database
+
+
+class Command(BaseCommand):
+    help = ('Compare per-request latency with connections closed per request, kept persistent, '
+            'and pooled (see AIRLINE_DB_CONNECTIONS) on a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=list(CONNECTION_MODES), default=list(CONNECTION_MODES))
+        parser.add_argument('--scenarios', nargs='+', choices=sorted(SCENARIOS), default=['search', 'createreservation'])
+        parser.add_argument('--flights', type=int, default=200)
+        parser.add_argument('--reservations', type=int, default=200)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=1)
+        parser.add_argument('--pool-size', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        test_file = None
+        if connection.vendor == 'sqlite':
+            # An in-memory test database is never closed, which would hide the difference.
+            test_file = os.path.join(tempfile.mkdtemp(), 'bench_connections.sqlite3')
+        with throwaway_database(name=test_file):
+            rng = random.Random(options['seed'])
+            info = seed(options['flights'], options['reservations'], options['users'], 10, rng, stdout=self.stderr)
+            results = connection_mode_benchmark(info, options['modes'], options['scenarios'], options['requests'],
+                                                options['concurrency'], options['seed'], pool_size=options['pool_size'])
+
+        report = json.dumps({'database': connection.vendor, 'concurrency': options['concurrency'], 'modes': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                stream.write(report)
+        self.stdout.write(report)
@@ -0,0 +1,62 @@
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from airlineapp.routes import Leg, RouteGraph
+
+
+DAY = 24 * 60 * 60
+
+
+def synthetic_legs(flights, cities, days, rng):
+    for flight_id in range(1, flights + 1):
+        origin_id, destination_id = rng.sample(range(1, cities + 1), 2)
+        departure = rng.randrange(days * DAY)
+        arrival = departure + rng.randrange(45, 6 * 60) * 60
+        economy = rng.randrange(1500, 12000)
+        yield Leg(departure, arrival, flight_id, origin_id, destination_id, economy, economy * 3, 'economy', 180)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark in-memory connection search over synthetic schedules of increasing size.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 50000])
+        parser.add_argument('--cities', type=int, default=80)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        results = []
+        for size in options['sizes']:
+            graph = RouteGraph(min_connection=45 * 60, max_connection=12 * 60 * 60, connection_overrides={})
+            started = time.perf_counter()
+            graph.load(synthetic_legs(size, options['cities'], options['days'], rng))
+            build_ms = (time.perf_counter() - started) * 1000
+
+            for optimize in ('earliest', 'cheapest'):
+                timings = []
+                found = 0
+                for _ in range(options['queries']):
+                    origin_id, destination_id = rng.sample(range(1, options['cities'] + 1), 2)
+                    start = rng.randrange((options['days'] - 2) * DAY)
+                    began = time.perf_counter()
+                    itineraries = graph.search(origin_id, destination_id, start, start + DAY, optimize=optimize)
+                    timings.append((time.perf_counter() - began) * 1000)
+                    found += bool(itineraries)
+                timings.sort()
+                results.append({
+                    'flights': size,
+                    'optimize': optimize,
+                    'build_ms': round(build_ms, 1),
+                    'p50_ms': round(statistics.median(timings), 3),
+                    'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3),
+                    'max_ms': round(timings[-1], 3),
+                    'hit_rate': round(found / len(timings), 2),
+                })
+        self.stdout.write(json.dumps(results, indent=2))
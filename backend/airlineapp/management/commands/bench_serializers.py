@@ -0,0 +1,23 @@
+import json
+import random
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from airlineapp.benchmarks import seed, serialization_benchmark, throwaway_database
+
+
+class Command(BaseCommand):
+    help = ('Time FlightSerializer against the compiled values() path, and JSONRenderer against '
+            'ORJSONRenderer, over a throwaway test database of synthetic flights.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--flights', type=int, default=10_000)
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            seed(options['flights'], 0, 0, 50, random.Random(options['seed']))
+            results = serialization_benchmark(options['repeat'])
+        self.stdout.write(json.dumps({'database': connection.vendor, **results}, indent=2))
@@ -0,0 +1,41 @@
+import json
+import random
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from airlineapp.benchmarks import FAST_PASSWORD_HASHERS, seed, session_store_benchmark, throwaway_database
+from airlineapp.cache import get_cache
+
+
+class Command(BaseCommand):
+    help = ('Compare login and session-read throughput for each session store '
+            '(see AIRLINE_SESSION_STORE) on a throwaway test database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stores', nargs='+', choices=sorted(settings.SESSION_ENGINES),
+                            default=sorted(settings.SESSION_ENGINES))
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--reads', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        results = {}
+        with throwaway_database(), override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS):
+            info = seed(0, 0, options['users'], 2, random.Random(options['seed']))
+            for store in options['stores']:
+                get_cache().clear()
+                self.stderr.write(f'running {store}')
+                with override_settings(SESSION_ENGINE=settings.SESSION_ENGINES[store]):
+                    results[store] = session_store_benchmark(
+                        info, options['logins'], options['reads'], random.Random(options['seed']))
+
+        report = json.dumps({'database': connection.vendor, 'users': options['users'], 'stores': results}, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                stream.write(report)
+        self.stdout.write(report)
@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from airlineapp.holds import HOLD_SWEEP_BATCH_SIZE, expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Cancel pending reservations whose hold has expired and return their seats to the flight.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=HOLD_SWEEP_BATCH_SIZE)
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='Keep sweeping, sleeping this many seconds between passes.')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            expired = expire_holds(options['batch_size'])
+            self.stdout.write(f'{expired} holds expired in {time.perf_counter() - started:.2f}s')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
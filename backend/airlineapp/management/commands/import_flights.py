@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from airlineapp.schedule_import import IMPORT_BATCH_SIZE, import_flights, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Bulk import a flight schedule from CSV or JSON Lines, upserting on flight_number + departure_time.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--input-format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--max-errors', type=int, default=50, help='How many row errors to print.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        input_format = options['input_format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        started = time.perf_counter()
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                report = import_flights(read_rows(stream, input_format), batch_size=options['batch_size'])
+        except OSError as exc:
+            raise CommandError(exc)
+        elapsed = time.perf_counter() - started
+
+        for error in report.errors[:options['max_errors']]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        processed = report.created + report.updated + len(report.errors)
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.created} created, {report.updated} updated, {len(report.errors)} failed '
+            f'in {elapsed:.2f}s ({processed / elapsed if elapsed else 0:.0f} rows/s)'
+        ))
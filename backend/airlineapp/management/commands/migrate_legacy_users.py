@@ -0,0 +1,77 @@
+import json
+import os
+import time
+
+from django.contrib.auth.hashers import get_hasher
+from django.core.management.base import BaseCommand, CommandError
+
+from airlineapp.legacy_users import LEGACY_CHUNK_SIZE, migrate_legacy_users
+
+
+class Command(BaseCommand):
+    help = ('Copy legacy AuthUser rows into auth users and passengers in chunked bulk inserts. '
+            'With --checkpoint, an interrupted run picks up after the last committed chunk.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=LEGACY_CHUNK_SIZE)
+        parser.add_argument('--checkpoint', help='File recording the last migrated AuthUser id.')
+        parser.add_argument('--start-after', type=int, help='AuthUser id to resume after; overrides the checkpoint.')
+        parser.add_argument('--hasher', default='default',
+                            help='Algorithm from PASSWORD_HASHERS for legacy passwords. Users are moved to '
+                                 'the default one the next time they log in.')
+        parser.add_argument('--reset-passwords', action='store_true',
+                            help='Do not hash plaintext legacy passwords; leave them unusable so those users go '
+                                 'through a password reset. Hashing costs about a third of a CPU second per user.')
+        parser.add_argument('--hash-workers', type=int, default=os.cpu_count(), help='Threads hashing passwords.')
+        parser.add_argument('--max-errors', type=int, default=50, help='How many row errors to print.')
+
+    def handle(self, *args, **options):
+        try:
+            get_hasher(options['hasher'])
+        except ValueError as exc:
+            raise CommandError(exc)
+        checkpoint = options['checkpoint']
+        after = options['start_after']
+        if after is None:
+            after = read_checkpoint(checkpoint) if checkpoint else 0
+
+        started = time.perf_counter()
+
+        def progress(report):
+            if checkpoint:
+                write_checkpoint(checkpoint, report.last_id)
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'{report.read} rows read, up to id {report.last_id} ({report.read / elapsed:.0f} rows/s)')
+
+        report = migrate_legacy_users(
+            after=after, chunk_size=options['chunk_size'], hasher=options['hasher'],
+            reset_passwords=options['reset_passwords'],
+            hash_workers=options['hash_workers'], on_chunk=progress,
+        )
+        elapsed = time.perf_counter() - started
+
+        for error in report.errors[:options['max_errors']]:
+            self.stderr.write(f"id {error['id']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.migrated} users and {report.passengers} passengers created, {report.skipped} skipped, '
+            f'{len(report.errors)} failed in {elapsed:.2f}s ({report.read / elapsed if elapsed else 0:.0f} rows/s); '
+            f'{report.without_password} need a password reset'
+        ))
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as stream:
+            return json.load(stream)['last_id']
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError, KeyError, TypeError) as exc:
+        raise CommandError(f'Unreadable checkpoint {path}: {exc}')
+
+
+def write_checkpoint(path, last_id):
+    # Written beside the target and renamed over it, so a crash never leaves half a file.
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as stream:
+        json.dump({'last_id': last_id}, stream)
+    os.replace(temporary, path)
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from airlineapp.analytics import REFRESH_FLIGHTS_PER_QUERY, rebuild_analytics, refresh_stale_stats
+from airlineapp.models import FlightStats, RouteDailyStats
+
+
+class Command(BaseCommand):
+    help = ('Rebuild the flight and route analytics rollups from all flights and reservations. '
+            'With --stale, only refresh the flights whose reservations changed since the last pass.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stale', action='store_true', help='Refresh only the flights marked stale by bookings.')
+        parser.add_argument('--batch-size', type=int, default=REFRESH_FLIGHTS_PER_QUERY)
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help='With --stale, keep sweeping, sleeping this many seconds between passes.')
+
+    def handle(self, *args, **options):
+        if not options['stale']:
+            started = time.perf_counter()
+            rebuild_analytics(options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{FlightStats.objects.count()} flights and {RouteDailyStats.objects.count()} route days rebuilt '
+                f'in {time.perf_counter() - started:.2f}s'
+            ))
+            return
+        while True:
+            started = time.perf_counter()
+            refreshed = refresh_stale_stats(options['batch_size'])
+            self.stdout.write(f'{refreshed} stale flights refreshed in {time.perf_counter() - started:.2f}s')
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,17 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from airlineapp.fares import rebuild_fare_calendar
+from airlineapp.models import FareCalendarDay
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the fare calendar summary table from all flights.'
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rebuild_fare_calendar()
+        self.stdout.write(self.style.SUCCESS(
+            f'{FareCalendarDay.objects.count()} fare days rebuilt in {time.perf_counter() - started:.2f}s'
+        ))
@@ -0,0 +1,171 @@
+import json
+import logging
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MAX_RECORDED_QUERIES = 200
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Process-local counters and histograms rendered in the Prometheus text format.
+
+    Each worker process keeps its own registry; scrape every worker (or sum in
+    Prometheus) to get the whole picture.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help = {}
+        self._histograms = {}
+        self._counters = {}
+
+    def describe(self, name, kind, help_text, buckets=None):
+        self._help[name] = (kind, help_text, buckets)
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self._help[name][2])
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def value(self, name, **labels):
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self):
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+
+        lines = []
+        for name, (kind, help_text, buckets) in sorted(self._help.items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(labels)} {value}')
+                continue
+            for (metric, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {count}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(total)}')
+                lines.append(f'{name}_count{_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+registry = Registry()
+registry.describe('airline_requests_total', 'counter', 'Requests served, by route, method and status.')
+registry.describe('airline_request_duration_seconds', 'histogram', 'Request latency by route.', LATENCY_BUCKETS)
+registry.describe('airline_db_queries_per_request', 'histogram', 'Database queries issued per request.', QUERY_COUNT_BUCKETS)
+registry.describe('airline_db_duration_seconds', 'histogram', 'Time spent in the database per request.', LATENCY_BUCKETS)
+registry.describe('airline_response_size_bytes', 'histogram', 'Response body size by route.', SIZE_BUCKETS)
+registry.describe('airline_serializer_duration_seconds', 'histogram', 'Time spent in serializer .data by serializer.', LATENCY_BUCKETS)
+registry.describe('airline_holds_created_total', 'counter', 'Pending reservations created with a hold expiry.')
+registry.describe('airline_holds_converted_total', 'counter', 'Held reservations confirmed before they expired.')
+registry.describe('airline_holds_expired_total', 'counter', 'Held reservations cancelled by the expiry sweeper.')
+
+
+class RequestStats:
+    def __init__(self):
+        self.query_count = 0
+        self.query_time = 0.0
+        self.queries = []
+        self.serializer_time = 0.0
+
+    def record_query(self, sql, duration):
+        self.query_count += 1
+        self.query_time += duration
+        if len(self.queries) < MAX_RECORDED_QUERIES:
+            self.queries.append((sql, duration))
+
+
+current_stats = ContextVar('airline_request_stats', default=None)
+
+
+def query_timer(execute, sql, params, many, context):
+    """``connection.execute_wrapper`` hook feeding the current request's stats."""
+    stats = current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record_query(sql, time.perf_counter() - started)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+@contextmanager
+def serializer_timer(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        registry.observe('airline_serializer_duration_seconds', elapsed, serializer=name)
+        stats = current_stats.get()
+        if stats is not None:
+            stats.serializer_time += elapsed
+
+
+def log_sampled(logger, rate, event, **fields):
+    if rate <= 0 or not logger.isEnabledFor(logging.INFO) or random.random() >= rate:
+        return
+    logger.info(json.dumps({'event': event, **fields}, default=str, sort_keys=True))
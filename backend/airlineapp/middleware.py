@@ -0,0 +1,115 @@
+import json
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+
+from .metrics import RequestStats, current_stats, registry
+from .routers import RequestWrites, current_writes, pin_to_primary
+
+
+slow_logger = logging.getLogger('airlineapp.slow_requests')
+
+
+class RequestMetricsMiddleware:
+    """Per-route latency, query, serializer and response-size metrics; logs slow requests."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_request_seconds = getattr(settings, 'METRICS_SLOW_REQUEST_MS', 500) / 1000
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match is not None else 'unmatched'
+        method = request.method
+
+        registry.inc('airline_requests_total', route=route, method=method, status=response.status_code)
+        registry.observe('airline_request_duration_seconds', elapsed, route=route, method=method)
+        registry.observe('airline_db_queries_per_request', stats.query_count, route=route)
+        registry.observe('airline_db_duration_seconds', stats.query_time, route=route)
+        if not response.streaming:
+            registry.observe('airline_response_size_bytes', len(response.content), route=route)
+
+        if elapsed >= self.slow_request_seconds:
+            slowest = sorted(stats.queries, key=lambda query: query[1], reverse=True)[:5]
+            slow_logger.warning(json.dumps({
+                'event': 'slow_request',
+                'route': route,
+                'method': method,
+                'status': response.status_code,
+                'duration_ms': round(elapsed * 1000, 1),
+                'db_queries': stats.query_count,
+                'db_ms': round(stats.query_time * 1000, 1),
+                'serializer_ms': round(stats.serializer_time * 1000, 1),
+                'slowest_queries': [{'sql': sql[:300], 'ms': round(duration * 1000, 2)} for sql, duration in slowest],
+            }))
+
+
+class ReplicaPinningMiddleware:
+    """After a request that wrote to the database, pin the client to the primary
+    for READ_YOUR_WRITES_SECONDS so its next reads see its own writes."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        writes = RequestWrites()
+        token = current_writes.set(writes)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_writes.reset(token)
+        if writes.wrote:
+            pin_to_primary(request, response)
+        return response
+
+    async def __acall__(self, request):
+        writes = RequestWrites()
+        token = current_writes.set(writes)
+        try:
+            # Sync views run in a thread with a copy of this context, which
+            # still holds the same RequestWrites.
+            response = await self.get_response(request)
+        finally:
+            current_writes.reset(token)
+        if writes.wrote:
+            # The pin may be a cache write; keep it off the event loop.
+            await sync_to_async(pin_to_primary)(request, response)
+        return response
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airlineapp', '0017_reservation_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin', 'destination', 'departure_time'], name='flight_route_departure_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['origin', 'destination', 'seat_type', 'trip_choice', 'departure_time'], name='flight_route_search_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airlineapp', '0018_flight_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='flight',
+            index=models.Index(fields=['flight_number', 'departure_time'], name='flight_number_departure_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.3 on 2026-10-18 17:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+
+
+def populate_fare_calendar(apps, schema_editor):
+    Flight = apps.get_model('airlineapp', 'Flight')
+    FareCalendarDay = apps.get_model('airlineapp', 'FareCalendarDay')
+    days = (
+        Flight.objects.annotate(day=TruncDate('departure_time'))
+        .values('origin_id', 'destination_id', 'day')
+        .annotate(min_economy_price=Min('economy_class_price'), min_business_price=Min('business_class_price'), flights=Count('id'))
+        .order_by()
+    )
+    FareCalendarDay.objects.bulk_create((FareCalendarDay(**values) for values in days), batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airlineapp', '0019_flight_number_departure_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FareCalendarDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('min_economy_price', models.IntegerField()),
+                ('min_business_price', models.IntegerField()),
+                ('flights', models.IntegerField()),
+                ('destination', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airlineapp.city')),
+                ('origin', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='airlineapp.city')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('origin', 'destination', 'day'), name='fare_calendar_route_day_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_fare_calendar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airlineapp', '0021_refreshtoken'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flight',
+            name='occupied_seats',
+            field=models.BinaryField(default=b''),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='seat_layout',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='flight',
+            name='seat_map_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='seat_number',
+            field=models.CharField(blank=True, default='', max_length=4),
+        ),
+    ]
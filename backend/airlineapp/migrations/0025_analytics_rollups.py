@@ -0,0 +1,102 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:05
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+
+def populate_analytics(apps, schema_editor):
+    Flight = apps.get_model('airlineapp', 'Flight')
+    Reservation = apps.get_model('airlineapp', 'Reservation')
+    FlightStats = apps.get_model('airlineapp', 'FlightStats')
+    RouteDailyStats = apps.get_model('airlineapp', 'RouteDailyStats')
+
+    counts = {
+        values.pop('flight_id'): values
+        for values in Reservation.objects.values('flight_id').annotate(
+            confirmed=Count('id', filter=Q(status='confirmed')),
+            pending=Count('id', filter=Q(status='pending')),
+            cancelled=Count('id', filter=Q(status='cancelled')),
+            economy_sold=Count('id', filter=Q(status='confirmed', seat_type='economy')),
+            business_sold=Count('id', filter=Q(status='confirmed', seat_type='business')),
+        ).order_by()
+    }
+    empty = dict(confirmed=0, pending=0, cancelled=0, economy_sold=0, business_sold=0)
+
+    def flight_rows():
+        for flight in Flight.objects.values('id', 'origin_id', 'destination_id', 'departure_time', 'capacity', 'available_seats',
+                                            'economy_class_price', 'business_class_price').iterator():
+            reservations = counts.get(flight['id'], empty)
+            yield FlightStats(
+                flight_id=flight['id'], origin_id=flight['origin_id'], destination_id=flight['destination_id'],
+                day=timezone.localtime(flight['departure_time']).date(), capacity=flight['capacity'],
+                seats_taken=flight['capacity'] - flight['available_seats'],
+                revenue=(reservations['economy_sold'] * flight['economy_class_price']
+                         + reservations['business_sold'] * flight['business_class_price']),
+                **reservations,
+            )
+
+    FlightStats.objects.bulk_create(flight_rows(), batch_size=5000)
+    totals = ['capacity', 'seats_taken', 'confirmed', 'pending', 'cancelled', 'economy_sold', 'business_sold', 'revenue']
+    days = FlightStats.objects.values('origin_id', 'destination_id', 'day').annotate(
+        flights=Count('flight_id'), **{f'total_{field}': Sum(field) for field in totals},
+    ).order_by()
+    RouteDailyStats.objects.bulk_create(
+        (RouteDailyStats(origin_id=values['origin_id'], destination_id=values['destination_id'], day=values['day'],
+                         flights=values['flights'], **{field: values[f'total_{field}'] for field in totals})
+         for values in days),
+        batch_size=5000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airlineapp', '0024_reservation_user_status_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlightStats',
+            fields=[
+                ('flight_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('origin_id', models.BigIntegerField()),
+                ('destination_id', models.BigIntegerField()),
+                ('day', models.DateField()),
+                ('capacity', models.IntegerField()),
+                ('seats_taken', models.IntegerField()),
+                ('confirmed', models.IntegerField()),
+                ('pending', models.IntegerField()),
+                ('cancelled', models.IntegerField()),
+                ('economy_sold', models.IntegerField()),
+                ('business_sold', models.IntegerField()),
+                ('revenue', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day', 'origin_id', 'destination_id'], name='flight_stats_day_route_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RouteDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('origin_id', models.BigIntegerField()),
+                ('destination_id', models.BigIntegerField()),
+                ('day', models.DateField()),
+                ('flights', models.IntegerField()),
+                ('capacity', models.IntegerField()),
+                ('seats_taken', models.IntegerField()),
+                ('confirmed', models.IntegerField()),
+                ('pending', models.IntegerField()),
+                ('cancelled', models.IntegerField()),
+                ('economy_sold', models.IntegerField()),
+                ('business_sold', models.IntegerField()),
+                ('revenue', models.BigIntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='route_daily_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('origin_id', 'destination_id', 'day'), name='route_daily_stats_uniq')],
+            },
+        ),
+        migrations.RunPython(populate_analytics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.3 on 2026-10-18 18:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('airlineapp', '0025_analytics_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flightstats',
+            name='stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='flightstats',
+            index=models.Index(fields=['stale', 'flight_id'], name='flight_stats_stale_idx'),
+        ),
+    ]
@@ -41,11 +41,95 @@ class Flight(models.Model):
     seat_type = models.CharField(max_length=10, choices=SEAT_TYPE_CHOICES, default='economy')
     economy_class_price = models.IntegerField(default=0)
     business_class_price = models.IntegerField(default=0)
+    # Seat map: see seatmap.py. No layout means rows of ABC DEF covering capacity.
+    seat_layout = models.JSONField(null=True, blank=True)
+    occupied_seats = models.BinaryField(default=b'')
+    seat_map_version = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['origin', 'destination', 'departure_time'], name='flight_route_departure_idx'),
+            models.Index(fields=['origin', 'destination', 'seat_type', 'trip_choice', 'departure_time'], name='flight_route_search_idx'),
+            models.Index(fields=['flight_number', 'departure_time'], name='flight_number_departure_idx'),
+        ]
 
     def __str__(self):
         return f'{self.flight_number} - {self.origin.name} to {self.destination.name}'
 
 
+class FareCalendarDay(models.Model):
+    origin = models.ForeignKey(City, related_name='+', on_delete=models.CASCADE)
+    destination = models.ForeignKey(City, related_name='+', on_delete=models.CASCADE)
+    day = models.DateField()
+    min_economy_price = models.IntegerField()
+    min_business_price = models.IntegerField()
+    flights = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['origin', 'destination', 'day'], name='fare_calendar_route_day_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.origin_id} to {self.destination_id} on {self.day}'
+
+
+# Analytics rollups, maintained by analytics.py. Plain id columns rather than
+# foreign keys: the rows are derived data, refreshed after the flights and
+# reservations they summarise have been written or deleted.
+
+class FlightStats(models.Model):
+    flight_id = models.BigIntegerField(primary_key=True)
+    origin_id = models.BigIntegerField()
+    destination_id = models.BigIntegerField()
+    day = models.DateField()
+    capacity = models.IntegerField()
+    seats_taken = models.IntegerField()
+    confirmed = models.IntegerField()
+    pending = models.IntegerField()
+    cancelled = models.IntegerField()
+    economy_sold = models.IntegerField()
+    business_sold = models.IntegerField()
+    revenue = models.BigIntegerField()
+    # Set by reservation writes; refresh_stale_stats() recomputes the row and clears it.
+    stale = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['day', 'origin_id', 'destination_id'], name='flight_stats_day_route_idx'),
+            models.Index(fields=['stale', 'flight_id'], name='flight_stats_stale_idx'),
+        ]
+
+    def __str__(self):
+        return f'Stats for flight {self.flight_id}'
+
+
+class RouteDailyStats(models.Model):
+    origin_id = models.BigIntegerField()
+    destination_id = models.BigIntegerField()
+    day = models.DateField()
+    flights = models.IntegerField()
+    capacity = models.IntegerField()
+    seats_taken = models.IntegerField()
+    confirmed = models.IntegerField()
+    pending = models.IntegerField()
+    cancelled = models.IntegerField()
+    economy_sold = models.IntegerField()
+    business_sold = models.IntegerField()
+    revenue = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['origin_id', 'destination_id', 'day'], name='route_daily_stats_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='route_daily_stats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.origin_id} to {self.destination_id} on {self.day}'
+
+
 class Reservation(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -61,6 +145,15 @@ class Reservation(models.Model):
     contact_number = models.CharField(max_length=15)
     seat_type = models.CharField(max_length=10, choices=Flight.SEAT_TYPE_CHOICES)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    seat_number = models.CharField(max_length=4, blank=True, default='')
+    # Set while a reservation is a pending hold; expire_holds cancels it after this.
+    expires_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expires_at'], name='reservation_hold_expiry_idx'),
+            models.Index(fields=['user', 'status'], name='reservation_user_status_idx'),
+        ]
 
     def __str__(self):
         return f'{self.first_name} {self.last_name} - Reservation for {self.flight.flight_number}'
@@ -85,6 +178,23 @@ class Admin(models.Model):
     admin_code = models.CharField(max_length=20)
 
 
+class RefreshToken(models.Model):
+    # Only a SHA-256 digest of the token is stored; the raw value is handed out once.
+    digest = models.CharField(max_length=64, unique=True)
+    user = models.ForeignKey(User, related_name='refresh_tokens', on_delete=models.CASCADE)
+    created = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'revoked_at'], name='refresh_token_user_idx'),
+        ]
+
+    def __str__(self):
+        return f'Refresh token for user {self.user_id}'
+
+
 class AuthUser(models.Model):
     password = models.CharField(max_length=20)
     last_login = models.CharField(max_length=100)
@@ -0,0 +1,104 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+
+
+STREAM_CHUNK_SIZE = 2000
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    raw = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list):
+        raise InvalidCursor(cursor)
+    return values
+
+
+class KeysetPaginator:
+    """Cursor pagination over a unique ordering, e.g. ('departure_time', 'id').
+
+    The cursor is the ordering key of the last row on the page, so fetching the
+    next page is an indexed range scan instead of an OFFSET.
+    """
+
+    def __init__(self, ordering=('id',), default_limit=100, max_limit=1000):
+        self.ordering = tuple(ordering)
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+
+    def is_requested(self, request):
+        return 'cursor' in request.GET or 'limit' in request.GET
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        return max(1, min(limit, self.max_limit))
+
+    def filter_after(self, queryset, values):
+        if len(values) != len(self.ordering):
+            raise InvalidCursor(values)
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            clause = Q(**{f'{field}__gt': values[i]})
+            for previous, value in zip(self.ordering[:i], values[:i]):
+                clause &= Q(**{previous: value})
+            condition |= clause
+        try:
+            return queryset.filter(condition)
+        except (ValueError, TypeError, ValidationError):
+            raise InvalidCursor(values)
+
+    def key_of(self, row):
+        if isinstance(row, dict):
+            return [row[field] for field in self.ordering]
+        return [getattr(row, field) for field in self.ordering]
+
+    def paginate(self, queryset, request):
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.GET.get('cursor')
+        if cursor:
+            queryset = self.filter_after(queryset, decode_cursor(cursor))
+        limit = self.get_limit(request)
+        try:
+            rows = list(queryset[:limit + 1])
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_cursor(self.key_of(rows[-1]))
+        return rows, next_cursor
+
+    def page(self, queryset, request, serialize=list):
+        rows, next_cursor = self.paginate(queryset, request)
+        return {'results': serialize(rows), 'next': next_cursor}
+
+
+def wants_stream(request):
+    return request.GET.get('stream', '').lower() in ('1', 'true', 'ndjson')
+
+
+def stream_json_lines(rows):
+    def lines():
+        for row in rows:
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
@@ -0,0 +1,157 @@
+import hashlib
+import itertools
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .cache import get_cache
+from .metrics import registry
+
+
+PIN_COOKIE = 'airline_read_primary'
+
+# Set by @read_from_replica for the duration of a read-only view.
+read_alias = ContextVar('airline_read_alias', default=None)
+# Set by ReplicaPinningMiddleware; the router flags it when anything is written.
+current_writes = ContextVar('airline_request_writes', default=None)
+
+
+class RequestWrites:
+    def __init__(self):
+        self.wrote = False
+
+
+class ReplicaRouter:
+    """Reads go to the replica chosen for the current read-only view; everything else to default.
+
+    Only views wrapped in @read_from_replica read from a replica, so writes,
+    and reads inside a write path, always see the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        writes = current_writes.get()
+        if writes is not None:
+            writes.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in replica_aliases()
+
+
+def replica_aliases():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+class ReplicaPool:
+    """Round-robins over the replicas, skipping any that failed to connect recently."""
+
+    def __init__(self):
+        self._turn = itertools.count()
+        self._down_until = {}
+        self._lock = threading.Lock()
+
+    def choose(self):
+        replicas = replica_aliases()
+        if not replicas:
+            return None
+        start = next(self._turn)
+        for offset in range(len(replicas)):
+            alias = replicas[(start + offset) % len(replicas)]
+            with self._lock:
+                if self._down_until.get(alias, 0) > time.monotonic():
+                    continue
+            try:
+                connections[alias].ensure_connection()
+            except DatabaseError:
+                self.mark_down(alias)
+                continue
+            return alias
+        return None
+
+    def mark_down(self, alias):
+        registry.inc('airline_replica_unavailable_total', alias=alias)
+        with self._lock:
+            self._down_until[alias] = time.monotonic() + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+
+    def reset(self):
+        with self._lock:
+            self._turn = itertools.count()
+            self._down_until.clear()
+
+
+replica_pool = ReplicaPool()
+
+
+def _pin_key(request):
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if not credentials:
+        return None
+    return 'airline:pin:' + hashlib.sha256(credentials.encode()).hexdigest()
+
+
+def is_pinned(request):
+    """Has this client written within READ_YOUR_WRITES_SECONDS?
+
+    Browsers carry a cookie; token clients that ignore cookies are found by a
+    cache entry keyed on their credentials.
+    """
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    key = _pin_key(request)
+    return key is not None and get_cache().get(key) is not None
+
+
+def pin_to_primary(request, response):
+    window = getattr(settings, 'READ_YOUR_WRITES_SECONDS', 5)
+    response.set_cookie(PIN_COOKIE, '1', max_age=window, httponly=True, samesite='Lax')
+    key = _pin_key(request)
+    if key is not None:
+        get_cache().set(key, 1, window)
+
+
+def _iterate_on(alias, iterator):
+    # Streaming bodies are produced after the view returns; route each chunk.
+    iterator = iter(iterator)
+    while True:
+        token = read_alias.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            read_alias.reset(token)
+        yield chunk
+
+
+def read_from_replica(view):
+    """Serve a read-only view from a replica, unless the client has just written."""
+
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        alias = None if is_pinned(request) else replica_pool.choose()
+        registry.inc('airline_replica_reads_total', alias=alias or DEFAULT_DB_ALIAS)
+        token = read_alias.set(alias)
+        try:
+            response = view(request, *args, **kwargs)
+        finally:
+            read_alias.reset(token)
+        if alias is not None and getattr(response, 'streaming', False):
+            response.streaming_content = _iterate_on(alias, response.streaming_content)
+        return response
+
+    return wrapped
+
+
+registry.describe('airline_replica_reads_total', 'counter', 'Read-only requests by the database alias that served them.')
+registry.describe('airline_replica_unavailable_total', 'counter', 'Times a replica failed to connect and was skipped.')
@@ -0,0 +1,271 @@
+import heapq
+import threading
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from .cache import bump_version, get_version
+from .models import City, Flight
+
+
+FLIGHT_NAMESPACE = 'flights'
+LEG_FIELDS = ('departure', 'arrival', 'flight_id', 'origin_id', 'destination_id', 'economy_price', 'business_price', 'seat_type',
+              'available_seats')
+
+Leg = namedtuple('Leg', LEG_FIELDS)
+Itinerary = namedtuple('Itinerary', ['legs', 'departure', 'arrival', 'price'])
+
+
+def leg_from_values(values):
+    (flight_id, origin_id, destination_id, departure_time, arrival_time,
+     economy_price, business_price, seat_type, available_seats) = values
+    return Leg(departure_time.timestamp(), arrival_time.timestamp(), flight_id, origin_id, destination_id,
+               economy_price, business_price, seat_type, available_seats)
+
+
+LEG_COLUMNS = ('id', 'origin_id', 'destination_id', 'departure_time', 'arrival_time',
+               'economy_class_price', 'business_class_price', 'seat_type', 'available_seats')
+
+
+def _between(departures, times, city_id, start, end):
+    city_times = times.get(city_id)
+    if not city_times:
+        return []
+    return departures[city_id][bisect_left(city_times, start):bisect_left(city_times, end)]
+
+
+class RouteGraph:
+    """Time-expanded flight graph: per-origin departures sorted by departure time.
+
+    Built once from a single query and patched on Flight save/delete and seat
+    changes. A shared version counter tells other workers their copy is stale.
+    Patches replace the per-origin lists instead of editing them, so a search
+    can take a consistent snapshot under the lock and run without it.
+    """
+
+    def __init__(self, min_connection=None, max_connection=None, connection_overrides=None):
+        self.min_connection = (min_connection if min_connection is not None
+                               else getattr(settings, 'ROUTE_MIN_CONNECTION_MINUTES', 45) * 60)
+        self.max_connection = (max_connection if max_connection is not None
+                               else getattr(settings, 'ROUTE_MAX_CONNECTION_MINUTES', 12 * 60) * 60)
+        self.connection_overrides = (connection_overrides if connection_overrides is not None
+                                     else getattr(settings, 'ROUTE_MIN_CONNECTION_OVERRIDES', {}))
+        self.version = None
+        self._lock = threading.RLock()
+        self._reset([], {})
+
+    def _reset(self, legs, city_codes):
+        departures = {}
+        for leg in sorted(legs):
+            departures.setdefault(leg.origin_id, []).append(leg)
+        self._departures = departures
+        self._times = {origin: [leg.departure for leg in origin_legs] for origin, origin_legs in departures.items()}
+        self._origin_of = {leg.flight_id: leg.origin_id for leg in legs}
+        self._connection_times = {
+            city_id: self.connection_overrides[code] * 60
+            for city_id, code in city_codes.items() if code in self.connection_overrides
+        }
+
+    def __len__(self):
+        return len(self._origin_of)
+
+    def load(self, legs, city_codes=None):
+        with self._lock:
+            self._reset(list(legs), city_codes or {})
+
+    def rebuild(self):
+        version = get_version(FLIGHT_NAMESPACE)
+        legs = [leg_from_values(values) for values in Flight.objects.values_list(*LEG_COLUMNS).iterator(chunk_size=5000)]
+        city_codes = dict(City.objects.values_list('id', 'airport_code'))
+        with self._lock:
+            self._reset(legs, city_codes)
+            self.version = version
+
+    def invalidate(self):
+        with self._lock:
+            self.version = None
+
+    def ensure_current(self):
+        if self.version is None or self.version != get_version(FLIGHT_NAMESPACE):
+            self.rebuild()
+
+    def add_leg(self, leg):
+        with self._lock:
+            self._remove(leg.flight_id)
+            legs = list(self._departures.get(leg.origin_id, ()))
+            index = bisect_left(legs, leg)
+            legs.insert(index, leg)
+            self._replace(leg.origin_id, legs)
+            self._origin_of[leg.flight_id] = leg.origin_id
+
+    def remove_leg(self, flight_id):
+        with self._lock:
+            self._remove(flight_id)
+
+    def set_seats(self, seats):
+        """Update available_seats for ``{flight_id: seats}``; unknown flights are ignored."""
+        with self._lock:
+            for flight_id, available_seats in seats.items():
+                origin_id = self._origin_of.get(flight_id)
+                if origin_id is None:
+                    continue
+                legs = list(self._departures[origin_id])
+                for index, leg in enumerate(legs):
+                    if leg.flight_id == flight_id:
+                        legs[index] = leg._replace(available_seats=available_seats)
+                        self._replace(origin_id, legs)
+                        break
+
+    def add_seats(self, changes):
+        """Add ``{flight_id: change}`` to available_seats, never below zero; unknown flights are ignored."""
+        with self._lock:
+            seats = {
+                leg.flight_id: max(leg.available_seats + changes[leg.flight_id], 0)
+                for flight_id in changes if flight_id in self._origin_of
+                for leg in self._departures[self._origin_of[flight_id]] if leg.flight_id == flight_id
+            }
+            self.set_seats(seats)
+
+    def _remove(self, flight_id):
+        origin_id = self._origin_of.pop(flight_id, None)
+        if origin_id is None:
+            return
+        self._replace(origin_id, [leg for leg in self._departures[origin_id] if leg.flight_id != flight_id])
+
+    def _replace(self, origin_id, legs):
+        # Caller holds the lock. New dicts, so snapshots taken by running searches stay intact.
+        self._departures = {**self._departures, origin_id: legs}
+        self._times = {**self._times, origin_id: [leg.departure for leg in legs]}
+
+    def departures_between(self, city_id, start, end):
+        with self._lock:
+            departures, times = self._departures, self._times
+        return _between(departures, times, city_id, start, end)
+
+    def connection_time(self, city_id):
+        return self._connection_times.get(city_id, self.min_connection)
+
+    def search(self, origin_id, destination_id, earliest, latest, optimize='earliest', seat_type=None,
+               max_legs=3, limit=5):
+        """Best itineraries from origin to destination, first leg departing in [earliest, latest).
+
+        Labels are expanded in order of arrival time (``optimize='earliest'``)
+        or total fare (``optimize='cheapest'``); at most ``limit`` labels are
+        settled per (city, legs used), which keeps the search bounded on busy
+        hubs while still returning ``limit`` alternatives.
+        """
+        price_of = (lambda leg: leg.business_price) if seat_type == 'business' else (lambda leg: leg.economy_price)
+        if optimize == 'cheapest':
+            rank = lambda arrival, price: (price, arrival)
+        else:
+            rank = lambda arrival, price: (arrival, price)
+
+        queue = []
+        counter = 0
+        settled = {}
+        results = []
+
+        def push_legs(legs, path, price, visited):
+            nonlocal counter
+            best_arrival = {}
+            best_price = {}
+            for leg in legs:
+                if leg.available_seats < 1 or (seat_type and leg.seat_type != seat_type):
+                    continue
+                if leg.destination_id in visited:
+                    continue
+                total = price + price_of(leg)
+                # Only push a departure if it beats every earlier departure from
+                # this label to the same city on arrival time or on fare.
+                if (leg.arrival >= best_arrival.get(leg.destination_id, float('inf'))
+                        and total >= best_price.get(leg.destination_id, float('inf'))):
+                    continue
+                best_arrival[leg.destination_id] = min(leg.arrival, best_arrival.get(leg.destination_id, float('inf')))
+                best_price[leg.destination_id] = min(total, best_price.get(leg.destination_id, float('inf')))
+                counter += 1
+                heapq.heappush(queue, (rank(leg.arrival, total), counter, leg.arrival, total, path + (leg,)))
+
+        with self._lock:
+            departures, times, connection_times = self._departures, self._times, self._connection_times
+
+        push_legs(_between(departures, times, origin_id, earliest, latest), (), 0, {origin_id})
+        while queue and len(results) < limit:
+            _, _, arrival, price, path = heapq.heappop(queue)
+            city_id = path[-1].destination_id
+            state = (city_id, len(path))
+            if settled.get(state, 0) >= limit:
+                continue
+            settled[state] = settled.get(state, 0) + 1
+            if city_id == destination_id:
+                results.append(Itinerary(path, path[0].departure, arrival, price))
+                continue
+            if len(path) >= max_legs:
+                continue
+            window_start = arrival + connection_times.get(city_id, self.min_connection)
+            visited = {origin_id, *(leg.destination_id for leg in path)}
+            push_legs(_between(departures, times, city_id, window_start, arrival + self.max_connection),
+                      path, price, visited)
+        return results
+
+
+route_graph = RouteGraph()
+
+
+def search_connections(origin_id, destination_id, departure_time, window=timedelta(days=1), **options):
+    route_graph.ensure_current()
+    start = departure_time.timestamp()
+    return route_graph.search(origin_id, destination_id, start, start + window.total_seconds(), **options)
+
+
+def available_itineraries(itineraries, seats):
+    """``itineraries`` without those using a flight that has no seats left.
+
+    ``seats`` maps flight ids to available_seats as just read from the
+    database. The graph only sees seat changes committed by this worker, so
+    those counts win and are patched into it.
+    """
+    stale = {
+        leg.flight_id: seats[leg.flight_id]
+        for itinerary in itineraries for leg in itinerary.legs
+        if leg.flight_id in seats and seats[leg.flight_id] != leg.available_seats
+    }
+    if stale:
+        route_graph.set_seats(stale)
+    return [itinerary for itinerary in itineraries if all(seats.get(leg.flight_id, 0) > 0 for leg in itinerary.legs)]
+
+
+def flight_changed(flight):
+    # Patched once the save commits, so a rolled-back save leaves no phantom leg.
+    leg = leg_from_values([getattr(flight, column) for column in LEG_COLUMNS])
+    transaction.on_commit(lambda: _patch(route_graph.add_leg, leg))
+
+
+def flight_deleted(flight_id):
+    transaction.on_commit(lambda: _patch(route_graph.remove_leg, flight_id))
+
+
+def flight_seats_changed(changes):
+    """Patch ``{flight_id: seats returned}`` in (negative when taken); call after the change commits."""
+    route_graph.add_seats(changes)
+
+
+def _patch(apply, change):
+    apply(change)
+    _mark_local_change()
+
+
+def flights_changed_in_bulk():
+    bump_version(FLIGHT_NAMESPACE)
+
+
+def _mark_local_change():
+    # Keep this worker's patched copy; other workers see the new version and rebuild.
+    # Only when our bump is the one right after the version the graph holds:
+    # otherwise another worker changed flights in between and we must rebuild too.
+    known = route_graph.version
+    version = bump_version(FLIGHT_NAMESPACE)
+    if known is not None and version == known + 1:
+        route_graph.version = version
@@ -0,0 +1,204 @@
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.utils import timezone
+
+from .analytics import route_days_changed
+from .fares import fare_day_key, fare_days_changed
+from .models import City, Flight
+from .routes import flights_changed_in_bulk
+from .search_cache import routes_changed
+
+
+IMPORT_BATCH_SIZE = 1000
+UPDATE_BATCH_SIZE = 200
+UPSERT_KEY = ('flight_number', 'departure_time')
+REQUIRED_FIELDS = ('flight_number', 'origin', 'destination', 'departure_time', 'arrival_time', 'return_time', 'capacity')
+OPTIONAL_FIELDS = {
+    'available_seats': None,
+    'trip_choice': 'one-way',
+    'seat_type': 'economy',
+    'economy_class_price': 0,
+    'business_class_price': 0,
+}
+UPDATE_FIELDS = [
+    'origin', 'destination', 'arrival_time', 'return_time', 'capacity', 'available_seats',
+    'trip_choice', 'seat_type', 'economy_class_price', 'business_class_price',
+]
+
+
+class ImportReport:
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+
+    def add_error(self, row_number, errors):
+        self.errors.append({'row': row_number, 'errors': errors})
+
+    def as_dict(self):
+        return {'created': self.created, 'updated': self.updated, 'failed': len(self.errors), 'errors': self.errors}
+
+
+def read_csv(stream):
+    for row_number, row in enumerate(csv.DictReader(stream), start=1):
+        yield row_number, {key.strip(): value.strip() for key, value in row.items() if key and value is not None}
+
+
+def read_json_lines(stream):
+    for row_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as exc:
+            yield row_number, ValidationError(f'Invalid JSON: {exc}')
+            continue
+        if not isinstance(row, dict):
+            yield row_number, ValidationError('Expected a JSON object')
+            continue
+        yield row_number, row
+
+
+def read_rows(stream, input_format):
+    if isinstance(stream, bytes):
+        stream = io.StringIO(stream.decode('utf-8'))
+    elif not isinstance(stream, io.TextIOBase):
+        stream = io.TextIOWrapper(stream, encoding='utf-8')
+    if input_format == 'csv':
+        return read_csv(stream)
+    if input_format == 'jsonl':
+        return read_json_lines(stream)
+    raise ValueError(f'Unsupported import format: {input_format}')
+
+
+def _to_python(field_name, value, tz):
+    field = Flight._meta.get_field(field_name)
+    value = field.to_python(value)
+    if field.choices and value not in dict(field.choices):
+        raise ValidationError(f'"{value}" is not a valid choice.')
+    if isinstance(field, models.DateTimeField) and timezone.is_naive(value):
+        value = timezone.make_aware(value, tz)
+    return value
+
+
+def build_flight(row, city_ids, tz=None):
+    tz = tz or timezone.get_current_timezone()
+    values = {}
+    errors = {}
+
+    for name in REQUIRED_FIELDS:
+        if row.get(name) in (None, ''):
+            errors[name] = 'This field is required.'
+
+    for name in ('origin', 'destination'):
+        code = str(row.get(name) or '').upper()
+        if code and code not in city_ids:
+            errors[name] = f'Unknown airport code "{code}".'
+        elif code:
+            values[f'{name}_id'] = city_ids[code]
+
+    for name in ('flight_number', 'departure_time', 'arrival_time', 'return_time', 'capacity', *OPTIONAL_FIELDS):
+        value = row.get(name)
+        if value in (None, ''):
+            if name in OPTIONAL_FIELDS:
+                values[name] = OPTIONAL_FIELDS[name]
+            continue
+        try:
+            values[name] = _to_python(name, value, tz)
+        except ValidationError as exc:
+            errors[name] = ' '.join(exc.messages)
+
+    if errors:
+        return None, errors
+
+    if values['capacity'] < 0:
+        errors['capacity'] = 'Must not be negative.'
+    elif values['available_seats'] is not None and not 0 <= values['available_seats'] <= values['capacity']:
+        errors['available_seats'] = 'Must be between 0 and capacity.'
+    if values['arrival_time'] <= values['departure_time']:
+        errors['arrival_time'] = 'Must be after departure_time.'
+    if errors:
+        return None, errors
+    return Flight(**values), None
+
+
+def upsert_flights(flights, report):
+    """Create or update ``(row_number, flight)`` pairs; a key repeated within the batch is a row error."""
+    pending = {}
+    for row_number, flight in flights:
+        key = tuple(getattr(flight, field) for field in UPSERT_KEY)
+        if key in pending:
+            report.add_error(row_number, {'row': 'Duplicates an earlier row with the same flight_number and departure_time.'})
+            continue
+        pending[key] = flight
+    if not pending:
+        return
+    flights = list(pending.values())
+
+    departures = [key[1] for key in pending]
+    existing = Flight.objects.filter(
+        flight_number__in={key[0] for key in pending},
+        departure_time__range=(min(departures), max(departures)),
+    ).only('id', 'origin', 'destination', 'capacity', 'available_seats', *UPSERT_KEY)
+    fare_days = {fare_day_key(flight.origin_id, flight.destination_id, flight.departure_time) for flight in flights}
+    to_update = []
+    for flight in existing:
+        incoming = pending.pop((flight.flight_number, flight.departure_time), None)
+        if incoming is None:
+            continue
+        fare_days.add(fare_day_key(flight.origin_id, flight.destination_id, flight.departure_time))
+        incoming.pk = flight.pk
+        if incoming.available_seats is None:
+            # Keep seats already sold when a re-import only changes capacity.
+            sold = flight.capacity - flight.available_seats
+            incoming.available_seats = max(incoming.capacity - sold, 0)
+        to_update.append(incoming)
+    for flight in pending.values():
+        if flight.available_seats is None:
+            flight.available_seats = flight.capacity
+
+    with transaction.atomic():
+        Flight.objects.bulk_create(pending.values(), batch_size=IMPORT_BATCH_SIZE)
+        # bulk_update() sends one UPDATE ... CASE WHEN per batch; smaller batches
+        # keep each statement's CASE lists short.
+        Flight.objects.bulk_update(to_update, UPDATE_FIELDS, batch_size=UPDATE_BATCH_SIZE)
+        fare_days_changed(fare_days)
+        route_days_changed(fare_days)
+        routes_changed(key[:2] for key in fare_days)
+    report.created += len(pending)
+    report.updated += len(to_update)
+
+
+def import_flights(rows, batch_size=IMPORT_BATCH_SIZE):
+    """Validate and upsert ``(row_number, row)`` pairs keyed on flight_number and departure_time."""
+    city_ids = {}
+    for code, city_id in City.objects.order_by('id').values_list('airport_code', 'id'):
+        city_ids.setdefault(code.upper(), city_id)
+
+    tz = timezone.get_current_timezone()
+    report = ImportReport()
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        flights = []
+        for row_number, row in batch:
+            if isinstance(row, ValidationError):
+                report.add_error(row_number, {'row': ' '.join(row.messages)})
+                continue
+            flight, errors = build_flight(row, city_ids, tz)
+            if errors:
+                report.add_error(row_number, errors)
+            else:
+                flights.append((row_number, flight))
+        upsert_flights(flights, report)
+    if report.created or report.updated:
+        flights_changed_in_bulk()
+    return report
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import time
+from datetime import datetime
+from functools import lru_cache
+
+from dateutil import parser
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .cache import CITY_NAMESPACE, bump_version, get_cache, get_versions
+from .metrics import registry
+from .routes import flight_seats_changed
+
+
+# How long a worker may hold the right to recompute one search.
+SEARCH_LOCK_SECONDS = 5
+SEARCH_LOCK_POLL = 0.02
+
+
+@lru_cache(maxsize=1024)
+def _from_isoformat(value):
+    return datetime.fromisoformat(value)
+
+
+def parse_departure(value):
+    """``value`` as an aware datetime.
+
+    The ISO strings the clients send are parsed once per worker; anything else
+    goes through dateutil, uncached, since it may be relative to today.
+    """
+    try:
+        departure_time = _from_isoformat(value)
+    except ValueError:
+        departure_time = parser.parse(value)
+    if timezone.is_naive(departure_time):
+        departure_time = timezone.make_aware(departure_time)
+    return departure_time
+
+
+def route_namespace(origin_id, destination_id):
+    return f'search:{origin_id}:{destination_id}'
+
+
+def search_key(criteria):
+    """``(route, key)`` for ``criteria``, or None for searches not scoped to one route.
+
+    Criteria that mean the same search share a key: ids as ints, the
+    departure time as an aware ISO timestamp, blank filters left out.
+    """
+    try:
+        route = (int(criteria.get('origin_id')), int(criteria.get('destination_id')))
+        departure = criteria.get('departure_time')
+        departure = parse_departure(departure).isoformat() if departure else ''
+    except (TypeError, ValueError, OverflowError):
+        return None
+    filters = [criteria.get('trip_choice') or '', criteria.get('seat_type') or '']
+    if not all(isinstance(value, str) for value in filters):
+        return None
+    raw = json.dumps([*route, departure, *filters])
+    return route, hashlib.md5(raw.encode()).hexdigest()
+
+
+def cached_search(criteria, build):
+    """``build()``'s result for ``criteria``, served from the cache while the route is unchanged.
+
+    Entries are fresh for SEARCH_CACHE_SECONDS and kept SEARCH_CACHE_STALE_SECONDS
+    longer. When one goes stale a single worker rebuilds it while the others
+    keep serving the stale copy; when there is no copy at all they wait for
+    that worker instead of all querying at once.
+    """
+    fresh_for = getattr(settings, 'SEARCH_CACHE_SECONDS', 30)
+    found = search_key(criteria) if fresh_for else None
+    if found is None:
+        return build()
+    route, key = found
+    route_version, city_version = get_versions(route_namespace(*route), CITY_NAMESPACE)
+    cache_key = f'airline:search:{route_version}:{city_version}:{key}'
+
+    cache = get_cache()
+    entry = cache.get(cache_key)
+    if entry is not None and entry[0] > time.time():
+        registry.inc('airline_search_cache_total', result='hit')
+        return entry[1]
+
+    lock_key = f'{cache_key}:lock'
+    if not cache.add(lock_key, 1, SEARCH_LOCK_SECONDS):
+        if entry is None:
+            entry = _wait_for(cache, cache_key, lock_key)
+        if entry is not None:
+            registry.inc('airline_search_cache_total', result='stale' if entry[0] <= time.time() else 'waited')
+            return entry[1]
+        # Whoever held the lock gave up or is too slow; answer this one directly.
+        registry.inc('airline_search_cache_total', result='timeout')
+        return build()
+
+    try:
+        data = build()
+        cache.set(cache_key, (time.time() + fresh_for, data),
+                  fresh_for + getattr(settings, 'SEARCH_CACHE_STALE_SECONDS', 10))
+    finally:
+        cache.delete(lock_key)
+    registry.inc('airline_search_cache_total', result='miss')
+    return data
+
+
+def _wait_for(cache, cache_key, lock_key):
+    deadline = time.monotonic() + SEARCH_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(SEARCH_LOCK_POLL)
+        entry = cache.get(cache_key)
+        if entry is not None:
+            return entry
+        if cache.get(lock_key) is None:
+            return cache.get(cache_key)
+    return None
+
+
+def _bump_routes(routes):
+    for origin_id, destination_id in routes:
+        bump_version(route_namespace(origin_id, destination_id))
+
+
+def routes_changed(routes):
+    """Drop cached searches on each ``(origin_id, destination_id)`` route.
+
+    Bumped now, and again once the transaction commits: a search that ran in
+    between saw the old rows and may have cached them under the new version.
+    """
+    routes = {tuple(route) for route in routes if None not in route}
+    _bump_routes(routes)
+    if routes and connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump_routes(routes))
+
+
+def seats_changed(routes, seats):
+    """Drop cached searches on ``routes`` once the transaction commits.
+
+    For the seat counters, which are written with queryset.update() and so
+    bypass the Flight signals. ``seats`` maps flight ids to how many seats
+    were returned (negative when taken), for the connection graph. The callers
+    pass in the routes they already know, so nothing is read back after the
+    commit, when a failed query would leave the routes un-bumped.
+    """
+    routes = {tuple(route) for route in routes if None not in route}
+    seats = dict(seats)
+    if routes or seats:
+        transaction.on_commit(lambda: _seats_committed(routes, seats))
+
+
+def _seats_committed(routes, seats):
+    _bump_routes(routes)
+    # The connection graph keeps seat counts too.
+    flight_seats_changed(seats)
+
+
+registry.describe('airline_search_cache_total', 'counter',
+                  'Flight searches by how the result cache answered them (hit, miss, stale, waited, timeout).')
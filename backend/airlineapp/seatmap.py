@@ -0,0 +1,147 @@
+"""Cabin layouts and the occupied-seat bitmap stored on each flight.
+
+A layout is a list of cabins, each ``{"class": "economy", "first_row": 10,
+"rows": 30, "seats": "ABC DEFG HJK"}`` (spaces mark aisles). Seats are numbered
+row-major within a cabin and every cabin starts on a byte boundary, so the
+bitmap slice for one cabin is a plain byte range. Bits are MSB-first: seat ``i``
+is ``byte[i >> 3] & (0x80 >> (i & 7))``.
+"""
+import base64
+import math
+import re
+
+from .models import Flight
+
+
+SEAT_LABEL = re.compile(r'^(\d{1,3})([A-Z])$')
+DEFAULT_SEATS = 'ABC DEF'
+SEAT_CLASSES = {choice for choice, _ in Flight.SEAT_TYPE_CHOICES}
+
+
+class InvalidLayout(ValueError):
+    pass
+
+
+class Cabin:
+    def __init__(self, seat_class, first_row, rows, seats, offset, size=None):
+        self.seat_class = seat_class
+        self.first_row = first_row
+        self.rows = rows
+        self.seats = seats
+        self.letters = seats.replace(' ', '')
+        self.columns = {letter: column for column, letter in enumerate(self.letters)}
+        self.size = size if size is not None else rows * len(self.letters)
+        self.offset = offset
+
+    @property
+    def byte_range(self):
+        start = self.offset >> 3
+        return start, start + math.ceil(self.size / 8)
+
+    def to_json(self):
+        return {'class': self.seat_class, 'first_row': self.first_row, 'rows': self.rows, 'seats': self.seats}
+
+
+class SeatLayout:
+    def __init__(self, cabins):
+        if not isinstance(cabins, list) or not cabins:
+            raise InvalidLayout('A layout needs at least one cabin')
+        self.cabins = []
+        self.by_row = {}
+        offset = 0
+        for spec in cabins:
+            cabin = self._cabin(spec, offset)
+            for row in range(cabin.first_row, cabin.first_row + cabin.rows):
+                if row in self.by_row:
+                    raise InvalidLayout(f'Row {row} is in more than one cabin')
+                self.by_row[row] = cabin
+            self.cabins.append(cabin)
+            offset += math.ceil(cabin.size / 8) * 8
+        self.nbytes = offset >> 3
+
+    @staticmethod
+    def _cabin(spec, offset):
+        try:
+            seat_class, first_row, rows, seats = spec['class'], int(spec['first_row']), int(spec['rows']), str(spec['seats'])
+        except (KeyError, TypeError, ValueError):
+            raise InvalidLayout('Each cabin needs class, first_row, rows and seats')
+        letters = seats.replace(' ', '')
+        if seat_class not in SEAT_CLASSES:
+            raise InvalidLayout(f'Unknown cabin class {seat_class!r}')
+        if first_row < 1 or rows < 1 or first_row + rows > 1000:
+            raise InvalidLayout('Rows must be between 1 and 999')
+        if not letters or not letters.isalpha() or not letters.isupper() or len(set(letters)) != len(letters):
+            raise InvalidLayout('Seats must be distinct capital letters, with spaces for aisles')
+        return Cabin(seat_class, first_row, rows, seats, offset, spec.get('size'))
+
+    @classmethod
+    def for_flight(cls, seat_layout, capacity, seat_type):
+        """The flight's own layout, or rows of ``ABC DEF`` covering its capacity."""
+        if seat_layout:
+            return cls(seat_layout)
+        width = len(DEFAULT_SEATS.replace(' ', ''))
+        return cls([{'class': seat_type, 'first_row': 1, 'rows': max(1, math.ceil(capacity / width)),
+                     'seats': DEFAULT_SEATS, 'size': max(0, capacity)}])
+
+    def locate(self, label):
+        """``(cabin, bit index)`` for a seat label like ``"12C"``, or ``None``."""
+        match = SEAT_LABEL.match(label.strip().upper()) if isinstance(label, str) else None
+        if match is None:
+            return None
+        row, letter = int(match.group(1)), match.group(2)
+        cabin = self.by_row.get(row)
+        if cabin is None or letter not in cabin.columns:
+            return None
+        index = (row - cabin.first_row) * len(cabin.letters) + cabin.columns[letter]
+        if index >= cabin.size:
+            return None
+        return cabin, cabin.offset + index
+
+    def bitmap(self, stored):
+        bits = bytearray(stored or b'')
+        if len(bits) < self.nbytes:
+            bits.extend(bytes(self.nbytes - len(bits)))
+        return bits
+
+    def to_json(self, stored):
+        bits = self.bitmap(stored)
+        cabins = []
+        for cabin in self.cabins:
+            start, end = cabin.byte_range
+            cabins.append({**cabin.to_json(), 'size': cabin.size, 'occupied': base64.b64encode(bits[start:end]).decode()})
+        return cabins
+
+
+def is_set(bits, index):
+    return bool(bits[index >> 3] & (0x80 >> (index & 7)))
+
+
+def set_bit(bits, index):
+    bits[index >> 3] |= 0x80 >> (index & 7)
+
+
+def clear_bit(bits, index):
+    bits[index >> 3] &= ~(0x80 >> (index & 7)) & 0xFF
+
+
+def seat_label(cabin, index):
+    position = index - cabin.offset
+    row, column = divmod(position, len(cabin.letters))
+    return f'{cabin.first_row + row}{cabin.letters[column]}'
+
+
+SEAT_MAP_FIELDS = ('id', 'capacity', 'available_seats', 'seat_type', 'seat_layout', 'occupied_seats', 'seat_map_version')
+
+
+def seat_map(flight_id):
+    flight = Flight.objects.filter(pk=flight_id).values(*SEAT_MAP_FIELDS).first()
+    if flight is None:
+        return None
+    layout = SeatLayout.for_flight(flight['seat_layout'], flight['capacity'], flight['seat_type'])
+    return {
+        'flight_id': flight['id'],
+        'version': flight['seat_map_version'],
+        'seat_type': flight['seat_type'],
+        'available_seats': flight['available_seats'],
+        'cabins': layout.to_json(flight['occupied_seats']),
+    }
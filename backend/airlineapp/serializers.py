@@ -1,39 +1,183 @@
-from rest_framework import serializers
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
 from .models import Flight, City, Reservation, Passenger, Admin
 from django.contrib.auth.models import User
+from .inventory import book_reservation, SeatInventoryError
+from .metrics import serializer_timer
 
 
+class TimedListSerializer(serializers.ListSerializer):
+    @property
+    def data(self):
+        with serializer_timer(f'{type(self.child).__name__}[]'):
+            return super().data
 
-class CitySerializer(serializers.ModelSerializer):
+
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        with serializer_timer(type(self).__name__):
+            return super().data
+
+
+class CitySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = City
         fields = ['name', 'airport_name', 'airport_code', 'status']
+        list_serializer_class = TimedListSerializer
 
 
-class FlightSerializer(serializers.ModelSerializer):
+class FlightSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     origin = CitySerializer(read_only=True)
     destination = CitySerializer(read_only=True)
 
     class Meta:
         model = Flight
-        fields = '__all__'
+        exclude = ['seat_layout', 'occupied_seats', 'seat_map_version']
+        list_serializer_class = TimedListSerializer
 
 
-class ReservationSerializer(serializers.ModelSerializer):
+class ReservationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     flight = FlightSerializer()
 
     class Meta:
         model = Reservation
-        fields = ['id', 'flight', 'first_name', 'middle_name', 'last_name', 'email', 'contact_number', 'seat_type', 'status']
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'flight', 'first_name', 'middle_name', 'last_name', 'email', 'contact_number', 'seat_type', 'status', 'seat_number']
+        read_only_fields = ['seat_number']
 
     def create(self, validated_data):
         flight_data = validated_data.pop('flight')
-        flight = Flight.objects.get(pk=flight_data['id'])
+        try:
+            return book_reservation(flight_data['id'], **validated_data)
+        except Flight.DoesNotExist:
+            raise serializers.ValidationError({'flight': 'Flight not found'})
+        except SeatInventoryError as exc:
+            raise serializers.ValidationError({'flight': str(exc)})
+
+
+
+class CompactFlightSerializer(serializers.ModelSerializer):
+    origin = serializers.CharField(source='origin.airport_code', read_only=True)
+    destination = serializers.CharField(source='destination.airport_code', read_only=True)
+
+    class Meta:
+        model = Flight
+        fields = ['id', 'flight_number', 'origin', 'destination', 'departure_time', 'arrival_time']
 
-        user = self.context['request'].user
 
-        reservation = Reservation.objects.create(flight=flight, **validated_data)
-        return reservation
+class CompactReservationSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """List view of a reservation: the flight is reduced to what a booking list shows."""
+    flight = CompactFlightSerializer(read_only=True)
+
+    class Meta:
+        model = Reservation
+        list_serializer_class = TimedListSerializer
+        fields = ['id', 'flight', 'first_name', 'last_name', 'seat_type', 'seat_number', 'status', 'expires_at']
+
+
+# Field types whose to_representation returns database values unchanged.
+PASSTHROUGH_FIELDS = (
+    serializers.CharField, serializers.IntegerField, serializers.BooleanField, serializers.ChoiceField,
+)
+
+
+class ValuesSerializer:
+    """A read-only ModelSerializer compiled down to one values_list() query.
+
+    The serializer's fields (nested serializers included) are resolved once into
+    column lookups and per-column converters, so rows are turned straight into
+    the dicts the serializer would produce without building model instances.
+    Nested serializers must sit on non-null relations. ``fields`` limits the
+    output (and the query) to those top-level fields.
+    """
+
+    def __init__(self, serializer_class, fields=None):
+        self.name = f'{serializer_class.__name__}[]'
+        self.serializer_class = serializer_class
+        self.serializer = serializer_class()
+        self.fields = None if fields is None else frozenset(fields)
+        self.field_names = [name for name, field in self.serializer.fields.items() if not field.write_only]
+        self.lookups = []
+        self._builders = {}
+        self._subsets = {}
+        self.builder()
+
+    def subset(self, fields):
+        """The same rows reduced to ``fields``, compiled once per distinct selection."""
+        fields = frozenset(fields)
+        unknown = fields.difference(self.field_names)
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        rows = self._subsets.get(fields)
+        if rows is None:
+            rows = self._subsets[fields] = ValuesSerializer(self.serializer_class, fields)
+        return rows
+
+    def builder(self):
+        """The row -> dict function for the active time zone (compiled once per zone)."""
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        build = self._builders.get(tz)
+        if build is None:
+            lookups = []
+            build = self._builders[tz] = self._compile(self.serializer, '', tz, lookups, self.fields)
+            self.lookups = lookups
+        return build
+
+    def _compile(self, serializer, prefix, tz, lookups, fields=None):
+        parts = []
+        for name, field in serializer.fields.items():
+            if field.write_only or (fields is not None and name not in fields):
+                continue
+            if field.source == '*' or isinstance(field, serializers.SerializerMethodField):
+                raise ImproperlyConfigured(f'{name}: only plain and nested fields can be compiled')
+            lookup = prefix + field.source.replace('.', '__')
+            if isinstance(field, serializers.BaseSerializer):
+                parts.append((name, None, self._compile(field, lookup + '__', tz, lookups)))
+                continue
+            lookups.append(lookup)
+            parts.append((name, len(lookups) - 1, _converter(field, tz)))
+
+        def build(row):
+            data = {}
+            for name, index, convert in parts:
+                if index is None:
+                    data[name] = convert(row)
+                    continue
+                value = row[index]
+                data[name] = value if convert is None or value is None else convert(value)
+            return data
+
+        return build
+
+    def values(self, queryset):
+        # Named rows, so KeysetPaginator can read ordering columns off them.
+        return queryset.values_list(*self.lookups, named=True)
+
+    def serialize(self, rows):
+        with serializer_timer(self.name):
+            build = self.builder()
+            return [build(row) for row in rows]
+
+
+def _converter(field, tz):
+    if isinstance(field, PASSTHROUGH_FIELDS):
+        return None
+    iso_output = getattr(field, 'format', api_settings.DATETIME_FORMAT) in (ISO_8601, 'iso-8601')
+    if type(field) is not serializers.DateTimeField or hasattr(field, 'timezone') or not iso_output:
+        return field.to_representation
+
+    # DateTimeField.to_representation, minus the per-value time zone lookup.
+    def convert(value):
+        if tz is None or value.utcoffset() is None:
+            return field.to_representation(value)
+        text = value.astimezone(tz).isoformat()
+        return text[:-6] + 'Z' if text.endswith('+00:00') else text
+
+    return convert
 
 
 class RegistrationSerializer(serializers.ModelSerializer):
@@ -104,3 +248,8 @@ class AdminLoginSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
 
+
+
+flight_rows = ValuesSerializer(FlightSerializer)
+reservation_rows = ValuesSerializer(ReservationSerializer)
+compact_reservation_rows = ValuesSerializer(CompactReservationSerializer)
@@ -0,0 +1,76 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .analytics import flight_stats_changed, flight_stats_stale
+from .authentication import forget_tokens, forget_user_tokens, revoke_user_refresh_tokens
+from .cache import invalidate_cities
+from .fares import fare_day_key, fare_days_changed
+from .models import City, Flight, Reservation
+from .routes import flight_changed, flight_deleted, flights_changed_in_bulk
+from .search_cache import routes_changed
+from .typeahead import city_deleted, city_saved
+
+
+@receiver(post_save, sender=City)
+def city_changed(sender, instance, **kwargs):
+    city_saved(instance)
+    invalidate_cities()
+    # Minimum connection times are keyed by airport code.
+    flights_changed_in_bulk()
+
+
+@receiver(post_delete, sender=City)
+def city_removed(sender, instance, **kwargs):
+    city_deleted(instance.id)
+    invalidate_cities()
+    flights_changed_in_bulk()
+
+
+@receiver(pre_save, sender=Flight)
+def flight_saving(sender, instance, **kwargs):
+    previous = None
+    if instance.pk:
+        previous = Flight.objects.filter(pk=instance.pk).values_list('origin_id', 'destination_id', 'departure_time').first()
+    instance._previous_fare_day = fare_day_key(*previous) if previous else None
+
+
+@receiver(post_save, sender=Flight)
+def flight_saved(sender, instance, **kwargs):
+    flight_changed(instance)
+    keys = {fare_day_key(instance.origin_id, instance.destination_id, instance.departure_time)}
+    if getattr(instance, '_previous_fare_day', None):
+        keys.add(instance._previous_fare_day)
+    fare_days_changed(keys)
+    routes_changed(key[:2] for key in keys)
+    flight_stats_changed([instance.id])
+
+
+@receiver(post_delete, sender=Flight)
+def flight_removed(sender, instance, **kwargs):
+    flight_deleted(instance.id)
+    fare_days_changed([fare_day_key(instance.origin_id, instance.destination_id, instance.departure_time)])
+    routes_changed([(instance.origin_id, instance.destination_id)])
+    flight_stats_changed([instance.id])
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def reservation_changed(sender, instance, **kwargs):
+    flight_stats_stale([instance.flight_id])
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    # Logins only touch last_login, which the token snapshot does not need fresh.
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    forget_user_tokens([instance.pk])
+    if not instance.is_active:
+        revoke_user_refresh_tokens([instance.pk])
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    forget_tokens([instance.key])
@@ -1,3 +1,1670 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from unittest import mock
+from datetime import datetime, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.hashers import get_hasher, identify_hasher
+from django.contrib.auth.models import User
+from django.contrib.sessions.models import Session
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import signals
+from .analytics import refresh_stale_stats
+from .async_views import run_in_thread
+from .authentication import issue_refresh_token, restore_token, token_cache
+from .cache import CITY_NAMESPACE, bump_version, city_list, get_cache, versioned_key
+from .renderers import ORJSONRenderer
+from .serializers import (CompactReservationSerializer, FlightSerializer, ReservationSerializer,
+                          compact_reservation_rows, flight_rows, reservation_rows)
+from .benchmarks import FAST_PASSWORD_HASHERS, SCENARIOS, InProcessDriver, run_scenario, seed, session_store_benchmark
+from .metrics import registry
+from .routers import PIN_COOKIE, replica_pool
+from .db.pool import ConnectionPool, PoolTimeout, close_pools
+from .inventory import SoldOut, book_reservation, release_reservation_seats, release_seats
+from .models import AuthUser, City, Flight, FlightStats, Passenger, Reservation
+from .routes import route_graph
+from .search_cache import cached_search
+from .typeahead import city_index
+
+
+def make_city(name, code):
+    return City.objects.create(name=name, airport_name=f'{name} Airport', airport_code=code)
+
+
+def make_flight(origin, destination, departure_time, **kwargs):
+    values = {
+        'flight_number': 'PR100',
+        'arrival_time': departure_time + timedelta(hours=2),
+        'return_time': departure_time + timedelta(days=3),
+        'capacity': 180,
+        'available_seats': 180,
+        'economy_class_price': 2500,
+        'business_class_price': 9000,
+    }
+    values.update(kwargs)
+    return Flight.objects.create(origin=origin, destination=destination, departure_time=departure_time, **values)
+
+
+def admin_client():
+    client = APIClient()
+    client.force_authenticate(User.objects.create_user('admin', password='secret', is_staff=True))
+    return client
+
+
+class FlightSearchViewTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.cebu = make_city('Cebu', 'CEB')
+        self.manila = make_city('Manila', 'MNL')
+        self.departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+
+    def search(self, **criteria):
+        return self.client.post('/search/', criteria, format='json')
+
+    def test_search_filters_by_route_and_seat_type(self):
+        make_flight(self.cebu, self.manila, self.departure, flight_number='PR101')
+        make_flight(self.cebu, self.manila, self.departure, flight_number='PR102', seat_type='business')
+        make_flight(self.manila, self.cebu, self.departure, flight_number='PR103')
+
+        response = self.search(origin_id=self.cebu.id, destination_id=self.manila.id, seat_type='economy')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([flight['flight_number'] for flight in response.data], ['PR101'])
+        self.assertEqual(response.data[0]['origin']['airport_code'], 'CEB')
+        self.assertEqual(response.data[0]['destination']['airport_code'], 'MNL')
+
+    def test_search_query_count_is_constant(self):
+        criteria = {
+            'origin_id': self.cebu.id,
+            'destination_id': self.manila.id,
+            'departure_time': '2024-03-01 00:00',
+            'trip_choice': 'one-way',
+            'seat_type': 'economy',
+        }
+        make_flight(self.cebu, self.manila, self.departure)
+        with self.assertNumQueries(1):
+            response = self.search(**criteria)
+        self.assertEqual(len(response.data), 1)
+
+        for hour in range(1, 25):
+            make_flight(self.cebu, self.manila, self.departure + timedelta(hours=hour))
+        with self.assertNumQueries(1):
+            response = self.search(**criteria)
+        self.assertEqual(len(response.data), 25)
+
+
+class SearchCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        registry.reset()
+        self.client = APIClient()
+        self.cebu = make_city('Cebu', 'CEB')
+        self.manila = make_city('Manila', 'MNL')
+        self.flight = make_flight(self.cebu, self.manila, timezone.make_aware(datetime(2024, 3, 1, 8, 0)))
+        self.criteria = {'origin_id': self.cebu.id, 'destination_id': self.manila.id,
+                         'departure_time': '2024-03-01 00:00', 'seat_type': 'economy'}
+
+    def search(self, **criteria):
+        return self.client.post('/search/', {**self.criteria, **criteria}, format='json').data
+
+    def test_repeat_searches_are_served_from_the_cache(self):
+        self.assertEqual(len(self.search()), 1)
+        with self.assertNumQueries(0):
+            # The same search spelled differently shares the entry.
+            rows = self.search(origin_id=str(self.cebu.id), departure_time='2024-03-01T00:00:00')
+        self.assertEqual([row['id'] for row in rows], [self.flight.id])
+        self.assertEqual(registry.value('airline_search_cache_total', result='hit'), 1)
+
+    def test_flight_changes_on_the_route_invalidate_it(self):
+        self.search()
+        make_flight(self.cebu, self.manila, timezone.make_aware(datetime(2024, 3, 2, 8, 0)))
+        self.assertEqual(len(self.search()), 2)
+
+        self.flight.economy_class_price = 1999
+        self.flight.save()
+        self.assertEqual(self.search()[0]['economy_class_price'], 1999)
+
+        self.flight.delete()
+        self.assertEqual(len(self.search()), 1)
+
+    def test_seat_changes_invalidate_the_route(self):
+        user = User.objects.create_user(username='juan', password='secret')
+        self.assertEqual(self.search()[0]['available_seats'], 180)
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = book_reservation(self.flight.id, 'economy', **reservation_fields(user))
+        self.assertEqual(self.search()[0]['available_seats'], 179)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_reservation_seats(reservation)
+        self.assertEqual(self.search()[0]['available_seats'], 180)
+
+    def test_seat_invalidation_reads_nothing_after_commit(self):
+        user = User.objects.create_user(username='juan', password='secret')
+        self.search()
+        with self.captureOnCommitCallbacks() as callbacks:
+            book_reservation(self.flight.id, 'economy', seat_number='1A', **reservation_fields(user))
+            book_reservation(self.flight.id, 'economy', **reservation_fields(user))
+        # A query failing here would leave the route's cached searches in place.
+        with self.assertNumQueries(0):
+            for callback in callbacks:
+                callback()
+        self.assertEqual(self.search()[0]['available_seats'], 178)
+
+    def test_other_routes_stay_cached(self):
+        self.search()
+        make_flight(self.manila, self.cebu, timezone.make_aware(datetime(2024, 3, 1, 8, 0)))
+        with self.assertNumQueries(0):
+            self.search()
+
+    def test_only_one_caller_rebuilds_a_missing_entry(self):
+        calls = []
+
+        def build():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['result']
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cached_search(self.criteria, build))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [['result']] * 8)
+
+    def test_stale_entry_is_served_while_it_is_rebuilt(self):
+        cached_search(self.criteria, lambda: ['old'])
+        seen_during_rebuild = []
+
+        def rebuild():
+            # Another request arriving mid-rebuild gets the stale copy.
+            seen_during_rebuild.append(cached_search(self.criteria, lambda: ['other']))
+            return ['new']
+
+        with mock.patch('airlineapp.search_cache.time.time', return_value=time.time() + 31):
+            self.assertEqual(cached_search(self.criteria, rebuild), ['new'])
+        self.assertEqual(seen_during_rebuild, [['old']])
+        self.assertEqual(cached_search(self.criteria, lambda: ['other']), ['new'])
+
+
+class FlightBatchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cebu = make_city('Cebu', 'CEB')
+        manila = make_city('Manila', 'MNL')
+        departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+        self.flights = [make_flight(cebu, manila, departure + timedelta(hours=hour), flight_number=f'PR{hour}')
+                        for hour in range(3)]
+
+    def batch(self, **params):
+        return self.client.get('/flights/batch/', params)
+
+    def test_returns_flights_in_request_order_from_one_query(self):
+        first, second, third = self.flights
+        with self.assertNumQueries(1):
+            response = self.batch(ids=f'{third.id},{first.id},999999,{third.id}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([flight['id'] for flight in response.data['results']], [third.id, first.id])
+        self.assertEqual(response.data['missing'], [999999])
+        self.assertEqual(response.data['results'][1], FlightSerializer(first).data)
+
+    def test_field_selection(self):
+        response = self.batch(ids=str(self.flights[0].id), fields='flight_number,origin')
+
+        self.assertEqual(response.data['results'], [{
+            'id': self.flights[0].id,
+            'flight_number': 'PR0',
+            'origin': {'name': 'Cebu', 'airport_name': 'Cebu Airport', 'airport_code': 'CEB', 'status': 'active'},
+        }])
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.batch().status_code, 400)
+        self.assertEqual(self.batch(ids='1,x').status_code, 400)
+        self.assertEqual(self.batch(ids=','.join(map(str, range(1, 502)))).status_code, 400)
+        response = self.batch(ids='1', fields='flight_number,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Unknown fields: password'})
+
+    def test_single_flight_endpoints_use_one_query(self):
+        flight = self.flights[0]
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(f'/flights/{flight.id}/').json()['origin']['name'], 'Cebu')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(f'/get_flight/{flight.id}/').data['destination']['airport_code'], 'MNL')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cebu = make_city('Cebu', 'CEB')
+        manila = make_city('Manila', 'MNL')
+        departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+        self.flights = [
+            make_flight(cebu, manila, departure + timedelta(hours=hour), flight_number=f'PR{hour}')
+            for hour in (4, 0, 3, 1, 2)
+        ]
+
+    def test_flight_list_pages_follow_departure_order(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {'limit': 2}
+            if cursor:
+                params['cursor'] = cursor
+            response = self.client.get('/flights/', params)
+            self.assertEqual(response.status_code, 200)
+            seen += [flight['flight_number'] for flight in response.data['results']]
+            cursor = response.data['next']
+            if cursor is None:
+                break
+        self.assertEqual(seen, ['PR0', 'PR1', 'PR2', 'PR3', 'PR4'])
+
+    def test_flight_list_without_paging_params_returns_plain_list(self):
+        response = self.client.get('/flights/')
+        self.assertEqual(len(response.data), 5)
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/flights/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/auth_users/', {'cursor': 'WyJ4Il0'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_flight_list_streams_ndjson(self):
+        response = self.client.get('/flights/', {'stream': 'ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([row['flight_number'] for row in rows], ['PR0', 'PR1', 'PR2', 'PR3', 'PR4'])
+
+    def test_auth_users_paginate_by_id(self):
+        users = [User.objects.create_user(username=f'user{i}', password='secret') for i in range(3)]
+        first = self.client.get('/api/auth_users/', {'limit': 2}).json()
+        second = self.client.get('/api/auth_users/', {'limit': 2, 'cursor': first['next']}).json()
+        self.assertEqual([row['id'] for row in first['results'] + second['results']], [user.id for user in users])
+        self.assertIsNone(second['next'])
+
+    def test_passenger_list_keeps_its_shape_without_paging_params(self):
+        for i in range(3):
+            user = User.objects.create_user(username=f'user{i}', password='secret')
+            Passenger.objects.create(user=user, contact_number='0917', gender='F', address='Cebu')
+
+        plain = self.client.get('/api/passengers/').json()
+        self.assertEqual(len(plain), 3)
+        self.assertNotIn('id', plain[0])
+        page = self.client.get('/api/passengers/', {'limit': 2}).json()
+        self.assertEqual([row['user__username'] for row in page['results']], ['user0', 'user1'])
+        self.assertIn('id', page['results'][0])
+
+
+def reservation_fields(user, **overrides):
+    fields = {
+        'user': user,
+        'first_name': 'Juan',
+        'middle_name': 'Santos',
+        'last_name': 'Dela Cruz',
+        'email': 'juan@example.com',
+        'contact_number': '09171234567',
+    }
+    fields.update(overrides)
+    return fields
+
+
+class CreateReservationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='juan', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+        self.flight = make_flight(make_city('Cebu', 'CEB'), make_city('Manila', 'MNL'), departure,
+                                  capacity=2, available_seats=1)
+
+    def book(self, **overrides):
+        data = {
+            'flight_id': self.flight.id,
+            'first_name': 'Juan',
+            'middle_name': 'Santos',
+            'last_name': 'Dela Cruz',
+            'email': 'juan@example.com',
+            'contact_number': '09171234567',
+            'seat_type': 'economy',
+        }
+        data.update(overrides)
+        return self.client.post('/createreservation/', data, format='json')
+
+    def test_booking_decrements_available_seats(self):
+        response = self.book()
+        self.assertEqual(response.status_code, 200)
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 0)
+        self.assertTrue(Reservation.objects.filter(pk=response.data['reservation_id'], user=self.user).exists())
+
+    def test_sold_out_flight_is_rejected(self):
+        self.book()
+        response = self.book()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data, {'error': 'Sold out'})
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_other_cabin_is_not_drawn_from(self):
+        response = self.book(seat_type='business')
+        self.assertEqual(response.status_code, 400)
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 1)
+
+    def test_deleting_reservation_releases_seat(self):
+        reservation_id = self.book().data['reservation_id']
+        self.client.delete(f'/delete_reservation/{reservation_id}/')
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 1)
+
+
+class SeatMapTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='juan', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+        self.flight = make_flight(make_city('Cebu', 'CEB'), make_city('Manila', 'MNL'), departure,
+                                  capacity=12, available_seats=12)
+
+    def book(self, seat):
+        data = reservation_fields(self.user, flight_id=self.flight.id, seat_number=seat)
+        del data['user']
+        return self.client.post('/createreservation/', data, format='json')
+
+    def occupied(self, cabin=0):
+        return base64.b64decode(self.client.get(f'/flights/{self.flight.id}/seats/').json()['cabins'][cabin]['occupied'])
+
+    def test_claim_marks_seat_and_second_claim_conflicts(self):
+        response = self.book('2b')
+        self.assertEqual((response.status_code, response.data['seat_number']), (200, '2B'))
+
+        self.assertEqual(self.book('2B').status_code, 409)
+        self.assertEqual(self.book('9A').status_code, 400)
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 11)
+        # Row 2 seat B is index 7 of the default ABC DEF layout.
+        self.assertEqual(self.occupied(), bytes([0b00000001, 0]))
+
+    def test_map_is_one_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/flights/{self.flight.id}/seats/')
+        self.assertEqual(response.json()['cabins'], [
+            {'class': 'economy', 'first_row': 1, 'rows': 2, 'seats': 'ABC DEF', 'size': 12, 'occupied': 'AAA='},
+        ])
+
+    def test_cancel_releases_the_seat(self):
+        reservation_id = self.book('1A').data['reservation_id']
+
+        self.client.put(f'/edit_reservation/{reservation_id}/', {'status': 'cancelled'}, format='json')
+
+        self.assertEqual(self.occupied(), bytes(2))
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 12)
+
+    def test_reinstating_a_cancelled_reservation_takes_its_seat_again(self):
+        reservation_id = self.book('1A').data['reservation_id']
+        self.client.put(f'/edit_reservation/{reservation_id}/', {'status': 'cancelled'}, format='json')
+
+        response = self.client.put(f'/edit_reservation/{reservation_id}/', {'status': 'confirmed'}, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.occupied(), bytes([0b10000000, 0]))
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 11)
+
+    def test_reinstating_fails_when_the_seat_was_resold(self):
+        reservation_id = self.book('1A').data['reservation_id']
+        self.client.put(f'/edit_reservation/{reservation_id}/', {'status': 'cancelled'}, format='json')
+        self.assertEqual(self.book('1A').status_code, 200)
+
+        response = self.client.put(f'/edit_reservation/{reservation_id}/', {'status': 'pending'}, format='json')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Reservation.objects.get(pk=reservation_id).status, 'cancelled')
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 11)
+
+    def test_layout_can_be_replaced_until_seats_are_assigned(self):
+        cabins = [{'class': 'business', 'first_row': 1, 'rows': 2, 'seats': 'AC DF'},
+                  {'class': 'economy', 'first_row': 10, 'rows': 40, 'seats': 'ABC DEFG HJK'}]
+        response = self.client.put(f'/flights/{self.flight.id}/seats/', {'cabins': cabins}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([cabin['size'] for cabin in response.json()['cabins']], [8, 400])
+
+        self.assertEqual(self.book('1A').status_code, 400)
+        self.assertEqual(self.book('49K').status_code, 200)
+        self.assertEqual(self.occupied(1)[-1], 0b00000001)
+
+        response = self.client.put(f'/flights/{self.flight.id}/seats/', {'cabins': cabins}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+
+class ReservationHoldTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.user = User.objects.create_user(username='juan', password='secret')
+        departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+        self.flight = make_flight(make_city('Cebu', 'CEB'), make_city('Manila', 'MNL'), departure,
+                                  capacity=10, available_seats=10)
+
+    def test_pending_booking_gets_a_hold(self):
+        reservation = book_reservation(self.flight.id, **reservation_fields(self.user))
+        self.assertIsNotNone(reservation.expires_at)
+        confirmed = book_reservation(self.flight.id, **reservation_fields(self.user, status='confirmed'))
+        self.assertIsNone(confirmed.expires_at)
+
+    def test_sweeper_cancels_lapsed_holds_in_batches_and_returns_seats(self):
+        past = timezone.now() - timedelta(minutes=1)
+        for _ in range(5):
+            book_reservation(self.flight.id, **reservation_fields(self.user, expires_at=past))
+        book_reservation(self.flight.id, seat_number='1A', **reservation_fields(self.user, expires_at=past))
+        live = book_reservation(self.flight.id, **reservation_fields(self.user))
+        out = io.StringIO()
+
+        call_command('expire_holds', batch_size=2, stdout=out)
+
+        self.assertIn('6 holds expired', out.getvalue())
+        self.assertEqual(list(Reservation.objects.filter(status='pending').values_list('id', flat=True)), [live.id])
+        self.flight.refresh_from_db()
+        self.assertEqual((self.flight.available_seats, bytes(self.flight.occupied_seats)), (9, bytes(2)))
+        self.assertIn('airline_holds_expired_total 6', registry.render())
+
+    def test_reinstated_hold_needs_a_free_seat_and_gets_a_new_expiry(self):
+        past = timezone.now() - timedelta(minutes=1)
+        lapsed = book_reservation(self.flight.id, **reservation_fields(self.user, expires_at=past))
+        call_command('expire_holds', stdout=io.StringIO())
+        for _ in range(10):
+            book_reservation(self.flight.id, **reservation_fields(self.user, status='confirmed'))
+
+        response = APIClient().put(f'/edit_reservation/{lapsed.id}/', {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        APIClient().delete(f"/delete_reservation/{Reservation.objects.filter(status='confirmed').first().id}/")
+        response = APIClient().put(f'/edit_reservation/{lapsed.id}/', {'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        lapsed.refresh_from_db()
+        self.assertGreater(lapsed.expires_at, timezone.now())
+        self.flight.refresh_from_db()
+        self.assertEqual(self.flight.available_seats, 0)
+
+    def test_confirming_a_hold_converts_it(self):
+        reservation = book_reservation(self.flight.id, **reservation_fields(self.user))
+
+        APIClient().put(f'/edit_reservation/{reservation.id}/', {'status': 'confirmed'}, format='json')
+
+        reservation.refresh_from_db()
+        self.assertIsNone(reservation.expires_at)
+        self.assertIn('airline_holds_converted_total 1', registry.render())
+        call_command('expire_holds', stdout=io.StringIO())
+        self.assertEqual(Reservation.objects.get(pk=reservation.pk).status, 'confirmed')
+
+
+class ReservationListingTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='juan', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cebu, self.manila = make_city('Cebu', 'CEB'), make_city('Manila', 'MNL')
+        self.departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+
+    def add_reservations(self, count, **overrides):
+        for i in range(count):
+            flight = make_flight(self.cebu, self.manila, self.departure + timedelta(hours=i), flight_number=f'PR{i}')
+            Reservation.objects.create(flight=flight, seat_type='economy', **reservation_fields(self.user, **overrides))
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for path in ('/user_reservations/', '/reservationlist/', '/reservationlist/?compact=1'):
+            Reservation.objects.all().delete()
+            self.add_reservations(1)
+            with self.assertNumQueries(1):
+                self.client.get(path)
+            self.add_reservations(10)
+            with self.assertNumQueries(1):
+                response = self.client.get(path)
+            self.assertEqual(len(response.json()), 11, path)
+
+    def test_status_filter_and_compact_representation(self):
+        self.add_reservations(2)
+        self.add_reservations(1, status='confirmed')
+
+        response = self.client.get('/user_reservations/', {'status': 'confirmed', 'compact': '1'})
+
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(response.json()[0]['flight']['origin'], 'CEB')
+        self.assertEqual(set(response.json()[0]), {'id', 'flight', 'first_name', 'last_name', 'seat_type', 'seat_number', 'status', 'expires_at'})
+        self.assertEqual(len(self.client.get('/reservationlist/', {'status': 'pending,confirmed'}).json()), 3)
+        self.assertEqual(self.client.get('/reservationlist/', {'status': 'lost'}).status_code, 400)
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='juan', password='secret')
+        cebu, manila = make_city('Cebu', 'CEB'), make_city('Manila', 'MNL')
+        departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0, 0, 250000))
+        for i in range(3):
+            flight = make_flight(cebu, manila, departure + timedelta(days=i), flight_number=f'PR{i}')
+            book_reservation(flight.id, seat_number=f'{i + 1}A', **reservation_fields(user))
+
+    def test_values_rows_match_model_serializers(self):
+        flights = Flight.objects.order_by('id')
+        reservations = Reservation.objects.order_by('id')
+
+        self.assertEqual(flight_rows.serialize(flight_rows.values(flights)), FlightSerializer(flights, many=True).data)
+        self.assertEqual(reservation_rows.serialize(reservation_rows.values(reservations)),
+                         ReservationSerializer(reservations, many=True).data)
+        self.assertEqual(compact_reservation_rows.serialize(compact_reservation_rows.values(reservations)),
+                         CompactReservationSerializer(reservations, many=True).data)
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {'flights': FlightSerializer(Flight.objects.all(), many=True).data, 'when': timezone.now(), 1: Decimal('2.50')}
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class ConcurrentBookingTests(TransactionTestCase):
+    threads = 16
+    attempts_per_thread = 5
+    seats = 20
+
+    def test_last_seats_are_never_oversold(self):
+        user = User.objects.create_user(username='juan', password='secret')
+        departure = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+        flight = make_flight(make_city('Cebu', 'CEB'), make_city('Manila', 'MNL'), departure,
+                             capacity=self.seats, available_seats=self.seats)
+        booked = []
+        sold_out = []
+        start = threading.Barrier(self.threads)
+
+        def worker():
+            start.wait()
+            try:
+                for _ in range(self.attempts_per_thread):
+                    while True:
+                        try:
+                            booked.append(book_reservation(flight.id, 'economy', **reservation_fields(user)).id)
+                        except SoldOut:
+                            sold_out.append(1)
+                        except OperationalError:
+                            # SQLite reports writer contention as "database is locked"; retry.
+                            time.sleep(0.001)
+                            continue
+                        break
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=worker) for _ in range(self.threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+
+        flight.refresh_from_db()
+        self.assertEqual(len(booked), self.seats)
+        self.assertEqual(len(sold_out), self.threads * self.attempts_per_thread - self.seats)
+        self.assertEqual(flight.available_seats, 0)
+        self.assertEqual(Reservation.objects.filter(flight=flight).count(), self.seats)
+
+
+class CityCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.cebu = make_city('Cebu', 'CEB')
+        make_city('Manila', 'MNL')
+
+    def test_city_list_is_served_from_cache(self):
+        first = self.client.get('/cities/')
+        self.assertEqual([city['airport_code'] for city in first.data], ['CEB', 'MNL'])
+        with self.assertNumQueries(0):
+            second = self.client.get('/cities/')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_matching_etag_returns_not_modified(self):
+        etag = self.client.get('/cities/')['ETag']
+        response = self.client.get('/cities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_city_changes_invalidate_cache(self):
+        etag = self.client.get('/cities/')['ETag']
+        self.client.get(f'/get_city/{self.cebu.id}/')
+
+        self.client.put(f'/edit_city/{self.cebu.id}/', {
+            'name': 'Lapu-Lapu', 'airport_name': 'Mactan-Cebu International Airport',
+            'airport_code': 'CEB', 'status': 'active',
+        }, format='json')
+
+        response = self.client.get('/cities/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['name'], 'Lapu-Lapu')
+        self.assertEqual(self.client.get(f'/get_city/{self.cebu.id}/').data['name'], 'Lapu-Lapu')
+
+        self.client.delete(f'/delete_city/{self.cebu.id}/')
+        self.assertEqual(self.client.get(f'/get_city/{self.cebu.id}/').status_code, 404)
+        self.assertEqual(len(self.client.get('/cities/').data), 1)
+
+    def test_list_cached_before_commit_is_dropped_on_commit(self):
+        stale = city_list()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cebu.name = 'Lapu-Lapu'
+            self.cebu.save()
+            # A read that ran before the commit still saw the old rows.
+            get_cache().set(versioned_key(CITY_NAMESPACE, 'list'), stale)
+        self.assertEqual(self.client.get('/cities/').data[0]['name'], 'Lapu-Lapu')
+
+
+class CityTypeaheadTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        city_index.invalidate()
+        self.cebu = City.objects.create(name='Cebu', airport_name='Mactan-Cebu International Airport', airport_code='CEB')
+        self.cebu_city = City.objects.create(name='Cebú City', airport_name='Cebu City Heliport', airport_code='CBH')
+        self.davao = City.objects.create(name='Davao', airport_name='Francisco Bangoy International Airport', airport_code='DVO')
+        self.client = APIClient()
+
+    def names(self, query, **params):
+        return [city['name'] for city in self.client.get('/cities/search/', {'q': query, **params}).json()]
+
+    def test_prefix_matches_rank_exact_code_first(self):
+        self.assertEqual(self.names('ceb'), ['Cebu', 'Cebú City'])
+        self.assertEqual(self.names('cbh'), ['Cebú City'])
+        self.assertEqual(self.names('mactan'), ['Cebu'])
+        self.assertEqual(self.names('international'), ['Cebu', 'Davao'])
+        self.assertEqual(self.names('international', limit=1), ['Cebu'])
+
+    def test_small_typos_are_tolerated(self):
+        self.assertEqual(self.names('davoa'), ['Davao'])
+        self.assertEqual(self.names('francsco'), ['Davao'])
+        self.assertEqual(self.names('qqqq'), [])
+
+    def test_index_follows_city_changes_without_queries(self):
+        self.names('dav')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.davao.name = 'Tagum'
+            self.davao.save()
+            City.objects.create(name='Iloilo', airport_name='Iloilo International Airport', airport_code='ILO')
+            self.cebu_city.delete()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names('tag'), ['Tagum'])
+            self.assertEqual(self.names('ilo'), ['Iloilo'])
+            self.assertEqual(self.names('ceb'), ['Cebu'])
+
+    def test_change_on_another_worker_between_patch_and_bump_forces_rebuild(self):
+        self.names('dav')
+
+        def bump_after_another_worker(namespace):
+            # The other worker commits its city and bumps just before we do.
+            City.objects.bulk_create([City(name='Tagbilaran', airport_name='Bohol-Panglao Airport', airport_code='TAG')])
+            bump_version(namespace)
+            return bump_version(namespace)
+
+        with mock.patch('airlineapp.typeahead.bump_version', bump_after_another_worker):
+            with self.captureOnCommitCallbacks(execute=True):
+                City.objects.create(name='Iloilo', airport_name='Iloilo International Airport', airport_code='ILO')
+
+        self.assertEqual(self.names('tag'), ['Tagbilaran'])
+
+    def test_rolled_back_saves_leave_the_index_alone(self):
+        self.names('dav')
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                City.objects.create(name='Iloilo', airport_name='Iloilo International Airport', airport_code='ILO')
+                raise ValueError
+        self.assertEqual(self.names('ilo'), [])
+
+
+class FlightImportTests(TestCase):
+    csv_header = 'flight_number,origin,destination,departure_time,arrival_time,return_time,capacity,seat_type,economy_class_price\n'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.cebu = make_city('Cebu', 'CEB')
+        self.manila = make_city('Manila', 'MNL')
+
+    def post_csv(self, body):
+        return self.client.generic('POST', '/importflights/', self.csv_header + body, content_type='text/csv')
+
+    def test_csv_import_creates_flights_and_reports_bad_rows(self):
+        response = self.post_csv(
+            'PR101,CEB,MNL,2024-03-01 08:00,2024-03-01 09:30,2024-03-05 08:00,180,economy,2500\n'
+            'PR102,ceb,MNL,2024-03-01 10:00,2024-03-01 11:30,2024-03-05 10:00,20,business,0\n'
+            'PR103,CEB,XXX,2024-03-01 12:00,2024-03-01 13:30,2024-03-05 12:00,180,economy,2500\n'
+            'PR104,CEB,MNL,not-a-date,2024-03-01 13:30,2024-03-05 12:00,180,first,2500\n'
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual([error['row'] for error in response.data['errors']], [3, 4])
+        self.assertIn('destination', response.data['errors'][0]['errors'])
+        self.assertEqual(set(response.data['errors'][1]['errors']), {'departure_time', 'seat_type'})
+        flight = Flight.objects.get(flight_number='PR102')
+        self.assertEqual((flight.origin_id, flight.available_seats, flight.seat_type), (self.cebu.id, 20, 'business'))
+
+    def test_reimport_upserts_and_keeps_sold_seats(self):
+        row = 'PR101,CEB,MNL,2024-03-01 08:00,2024-03-01 09:30,2024-03-05 08:00,{capacity},economy,{price}\n'
+        self.post_csv(row.format(capacity=180, price=2500))
+        Flight.objects.update(available_seats=170)
+
+        response = self.post_csv(row.format(capacity=200, price=2999))
+
+        self.assertEqual((response.data['created'], response.data['updated']), (0, 1))
+        flight = Flight.objects.get()
+        self.assertEqual((flight.capacity, flight.available_seats, flight.economy_class_price), (200, 190, 2999))
+
+    def test_duplicate_rows_in_one_batch_are_reported(self):
+        row = 'PR101,CEB,MNL,2024-03-01 08:00,2024-03-01 09:30,2024-03-05 08:00,180,economy,{price}\n'
+        response = self.post_csv(row.format(price=2500) + row.format(price=2999))
+
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertEqual(Flight.objects.get().economy_class_price, 2500)
+
+    def test_json_lines_import(self):
+        lines = [
+            json.dumps({'flight_number': 'PR201', 'origin': 'MNL', 'destination': 'CEB',
+                        'departure_time': '2024-03-02T06:00:00Z', 'arrival_time': '2024-03-02T07:20:00Z',
+                        'return_time': '2024-03-04T06:00:00Z', 'capacity': 150}),
+            '{broken',
+        ]
+        response = self.client.generic('POST', '/importflights/', '\n'.join(lines), content_type='application/x-ndjson')
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+
+    def test_unsupported_content_type_is_rejected(self):
+        response = self.client.post('/importflights/', {'rows': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_management_command_imports_file(self):
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as stream:
+            stream.write(self.csv_header)
+            for hour in range(10):
+                stream.write(f'PR{hour},CEB,MNL,2024-03-01 {hour:02}:00,2024-03-01 {hour:02}:59,2024-03-05 08:00,180,economy,2500\n')
+        self.addCleanup(os.remove, path)
+
+        call_command('import_flights', path, batch_size=3, stdout=io.StringIO())
+
+        self.assertEqual(Flight.objects.count(), 10)
+
+
+class ConnectionSearchTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        route_graph.invalidate()
+        self.client = APIClient()
+        self.cebu = make_city('Cebu', 'CEB')
+        self.manila = make_city('Manila', 'MNL')
+        self.davao = make_city('Davao', 'DVO')
+        self.iloilo = make_city('Iloilo', 'ILO')
+        self.day = timezone.make_aware(datetime(2024, 3, 1))
+
+    def at(self, hours, minutes=0):
+        return self.day + timedelta(hours=hours, minutes=minutes)
+
+    def leg(self, origin, destination, depart, arrive, price, number):
+        return make_flight(origin, destination, depart, arrival_time=arrive, economy_class_price=price, flight_number=number)
+
+    def search(self, **criteria):
+        criteria.setdefault('origin_id', self.cebu.id)
+        criteria.setdefault('destination_id', self.davao.id)
+        criteria.setdefault('departure_time', '2024-03-01 00:00')
+        return self.client.post('/search/connections/', criteria, format='json')
+
+    def numbers(self, itinerary):
+        return [flight['flight_number'] for flight in itinerary['flights']]
+
+    def test_finds_connections_respecting_minimum_connection_time(self):
+        self.leg(self.cebu, self.iloilo, self.at(6), self.at(7), 1000, 'PR1')
+        self.leg(self.iloilo, self.davao, self.at(7, 30), self.at(8, 30), 1000, 'PR2')
+        self.leg(self.iloilo, self.davao, self.at(8), self.at(9), 1000, 'PR3')
+        # MNL needs 90 minutes to connect.
+        self.leg(self.cebu, self.manila, self.at(6), self.at(7), 500, 'PR4')
+        self.leg(self.manila, self.davao, self.at(8), self.at(9, 30), 500, 'PR5')
+        self.leg(self.manila, self.davao, self.at(9), self.at(11), 500, 'PR6')
+
+        response = self.search()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([self.numbers(itinerary) for itinerary in response.data], [['PR1', 'PR3'], ['PR4', 'PR6']])
+        self.assertEqual(response.data[0]['stops'], 1)
+        self.assertEqual(response.data[0]['duration_minutes'], 180)
+
+        cheapest = self.search(optimize='cheapest')
+        self.assertEqual(self.numbers(cheapest.data[0]), ['PR4', 'PR6'])
+        self.assertEqual(cheapest.data[0]['total_price'], 1000)
+
+    def test_direct_flights_only_when_no_stops_allowed(self):
+        self.leg(self.cebu, self.davao, self.at(12), self.at(14), 4000, 'PR7')
+        self.leg(self.cebu, self.iloilo, self.at(6), self.at(7), 1000, 'PR1')
+        self.leg(self.iloilo, self.davao, self.at(8), self.at(9), 1000, 'PR3')
+
+        self.assertEqual([self.numbers(i) for i in self.search(max_stops=0).data], [['PR7']])
+        self.assertEqual(len(self.search().data), 2)
+
+    def graph_flight_ids(self):
+        return {leg.flight_id for legs in route_graph._departures.values() for leg in legs}
+
+    def test_graph_follows_flight_changes(self):
+        self.assertEqual(self.search().data, [])
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.leg(self.cebu, self.iloilo, self.at(6), self.at(7), 1000, 'PR1')
+            second = self.leg(self.iloilo, self.davao, self.at(8), self.at(9), 1000, 'PR3')
+        self.assertEqual(len(self.search().data), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second.departure_time = self.at(7, 15)
+            second.save()
+        self.assertEqual(self.search().data, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertNotIn(first.id, self.graph_flight_ids())
+
+    def test_change_on_another_worker_between_patch_and_bump_forces_rebuild(self):
+        self.search()
+        elsewhere = Flight(origin=self.cebu, destination=self.davao, departure_time=self.at(12), arrival_time=self.at(14),
+                           return_time=self.at(72), capacity=180, available_seats=180, economy_class_price=4000,
+                           business_class_price=9000, flight_number='PR7')
+
+        def bump_after_another_worker(namespace):
+            # The other worker commits its flight and bumps just before we do.
+            Flight.objects.bulk_create([elsewhere])
+            bump_version(namespace)
+            return bump_version(namespace)
+
+        with mock.patch('airlineapp.routes.bump_version', bump_after_another_worker):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.leg(self.cebu, self.iloilo, self.at(6), self.at(7), 1000, 'PR1')
+
+        self.assertEqual([self.numbers(i) for i in self.search(max_stops=0).data], [['PR7']])
+
+    def test_rolled_back_saves_leave_no_leg(self):
+        self.search()
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError), transaction.atomic():
+                phantom = self.leg(self.cebu, self.davao, self.at(6), self.at(8), 1000, 'PR9')
+                raise ValueError
+        self.assertNotIn(phantom.id, self.graph_flight_ids())
+
+    def test_sold_out_legs_are_not_offered(self):
+        self.leg(self.cebu, self.iloilo, self.at(6), self.at(7), 1000, 'PR1')
+        full = self.leg(self.iloilo, self.davao, self.at(8), self.at(9), 1000, 'PR3')
+        self.leg(self.iloilo, self.davao, self.at(10), self.at(11), 500, 'PR5')
+        self.assertEqual([self.numbers(i) for i in self.search().data], [['PR1', 'PR3'], ['PR1', 'PR5']])
+
+        # Sold out behind the graph's back, as a booking on another worker would.
+        Flight.objects.filter(pk=full.pk).update(available_seats=0)
+        self.assertEqual([self.numbers(i) for i in self.search().data], [['PR1', 'PR5']])
+        self.assertEqual(route_graph._departures[self.iloilo.id][0].available_seats, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_seats(full.id)
+        self.assertEqual(route_graph._departures[self.iloilo.id][0].available_seats, 1)
+        self.assertEqual(len(self.search().data), 2)
+
+    def test_missing_criteria_are_rejected(self):
+        self.assertEqual(self.client.post('/search/connections/', {}, format='json').status_code, 400)
+        self.assertEqual(self.search(optimize='shortest').status_code, 400)
+
+
+class FareCalendarTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.cebu = make_city('Cebu', 'CEB')
+        self.manila = make_city('Manila', 'MNL')
+        self.day = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+
+    def calendar(self, **params):
+        params.setdefault('origin_id', self.cebu.id)
+        params.setdefault('destination_id', self.manila.id)
+        params.setdefault('start', '2024-03-01')
+        params.setdefault('end', '2024-03-31')
+        return self.client.get('/fares/calendar/', params)
+
+    def days(self):
+        return [(str(day['day']), day['min_economy_price'], day['min_business_price'], day['flights'])
+                for day in self.calendar().data['days']]
+
+    def test_lowest_fares_per_day_in_one_query(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            make_flight(self.cebu, self.manila, self.day, economy_class_price=3000, business_class_price=9000)
+            make_flight(self.cebu, self.manila, self.day + timedelta(hours=6), economy_class_price=2500, business_class_price=9500)
+            make_flight(self.cebu, self.manila, self.day + timedelta(days=2), economy_class_price=1999)
+            make_flight(self.manila, self.cebu, self.day, economy_class_price=100)
+
+        with self.assertNumQueries(1):
+            response = self.calendar()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.days(), [('2024-03-01', 2500, 9000, 2), ('2024-03-03', 1999, 9000, 1)])
+
+    def test_calendar_follows_flight_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            flight = make_flight(self.cebu, self.manila, self.day, economy_class_price=3000)
+            make_flight(self.cebu, self.manila, self.day, economy_class_price=3500)
+        self.assertEqual(self.days(), [('2024-03-01', 3000, 9000, 2)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.departure_time = self.day + timedelta(days=1)
+            flight.save()
+        self.assertEqual(self.days(), [('2024-03-01', 3500, 9000, 1), ('2024-03-02', 3000, 9000, 1)])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            flight.delete()
+        self.assertEqual(self.days(), [('2024-03-01', 3500, 9000, 1)])
+
+    def test_calendar_follows_bulk_import(self):
+        header = 'flight_number,origin,destination,departure_time,arrival_time,return_time,capacity,economy_class_price\n'
+        body = 'PR1,CEB,MNL,2024-03-05 08:00,2024-03-05 09:00,2024-03-08 08:00,180,1234\n'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.generic('POST', '/importflights/', header + body, content_type='text/csv')
+        self.assertEqual(self.days(), [('2024-03-05', 1234, 0, 1)])
+
+    def test_refresh_waits_for_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            make_flight(self.cebu, self.manila, self.day)
+        self.assertEqual(self.days(), [])
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(self.days()), 1)
+
+    def test_invalid_range_is_rejected(self):
+        self.assertEqual(self.calendar(start='2024-03-10', end='2024-03-01').status_code, 400)
+        self.assertEqual(self.client.get('/fares/calendar/').status_code, 400)
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='juan', password='secret')
+        self.cebu = make_city('Cebu', 'CEB')
+        self.manila = make_city('Manila', 'MNL')
+        self.day = timezone.make_aware(datetime(2024, 3, 1, 8, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.flight = make_flight(self.cebu, self.manila, self.day, capacity=10, available_seats=10,
+                                      economy_class_price=2500, business_class_price=9000)
+            self.other = make_flight(self.cebu, self.manila, self.day + timedelta(hours=4), capacity=20, available_seats=20,
+                                     seat_type='business')
+
+    def book(self, flight, **fields):
+        reservation = book_reservation(flight.id, **reservation_fields(self.user, **fields))
+        refresh_stale_stats()
+        return reservation
+
+    def routes(self, **params):
+        params.setdefault('start', '2024-03-01')
+        return self.client.get('/analytics/routes/', params).data['routes']
+
+    def test_rollups_follow_bookings_and_cancellations(self):
+        self.book(self.flight, seat_type='economy', status='confirmed')
+        self.book(self.other, seat_type='business', status='confirmed')
+        held = self.book(self.flight, seat_type='economy')
+
+        [route] = self.routes()
+        self.assertEqual((route['flights'], route['capacity'], route['seats_taken'], route['load_factor']), (2, 30, 3, 0.1))
+        self.assertEqual((route['confirmed'], route['pending'], route['economy_sold'], route['business_sold']), (2, 1, 1, 1))
+        self.assertEqual(route['revenue'], 11500)
+
+        self.client.put(f'/edit_reservation/{held.id}/', {'status': 'cancelled'}, format='json')
+        refresh_stale_stats()
+        [route] = self.routes()
+        self.assertEqual((route['seats_taken'], route['pending'], route['cancelled']), (2, 0, 1))
+
+    def test_expired_holds_and_deleted_flights_leave_the_rollups(self):
+        self.book(self.other, seat_type='business', expires_at=timezone.now() - timedelta(minutes=1))
+        call_command('expire_holds', stdout=io.StringIO())
+        call_command('refresh_analytics', stale=True, stdout=io.StringIO())
+        [route] = self.routes()
+        self.assertEqual((route['seats_taken'], route['pending'], route['cancelled']), (0, 0, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        [route] = self.routes()
+        self.assertEqual((route['flights'], route['capacity'], route['cancelled']), (1, 10, 0))
+
+    def test_bookings_only_mark_their_flight_stale(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertNumQueries(1):
+                signals.reservation_changed(Reservation, Reservation(flight_id=self.flight.id))
+        self.assertEqual(callbacks, [])
+        book_reservation(self.flight.id, **reservation_fields(self.user, seat_type='economy', status='confirmed'))
+
+        self.assertEqual(self.routes()[0]['confirmed'], 0)
+        self.assertEqual(list(FlightStats.objects.filter(stale=True).values_list('flight_id', flat=True)), [self.flight.id])
+
+        self.assertEqual(refresh_stale_stats(), 1)
+        self.assertEqual(self.routes()[0]['confirmed'], 1)
+        self.assertFalse(FlightStats.objects.filter(stale=True).exists())
+
+    def test_endpoints_read_only_the_rollups(self):
+        for i in range(3):
+            self.book(self.flight, seat_type='economy', status='confirmed')
+
+        with self.assertNumQueries(1):
+            days = self.client.get('/analytics/routes/', {'start': '2024-03-01', 'group': 'day'}).data['routes']
+        with self.assertNumQueries(1):
+            flights = self.client.get('/analytics/flights/', {'start': '2024-03-01', 'origin_id': self.cebu.id}).data['flights']
+
+        self.assertEqual([(str(day['day']), day['revenue']) for day in days], [('2024-03-01', 7500)])
+        self.assertEqual([(row['flight_id'], row['load_factor']) for row in flights], [(self.flight.id, 0.3), (self.other.id, 0.0)])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        self.book(self.other, seat_type='business', status='confirmed')
+        incremental = self.routes(group='day')
+        call_command('refresh_analytics', stdout=io.StringIO())
+        self.assertEqual(self.routes(group='day'), incremental)
+
+    def test_invalid_parameters_are_rejected(self):
+        self.assertEqual(self.client.get('/analytics/routes/').status_code, 400)
+        self.assertEqual(self.client.get('/analytics/routes/', {'start': '2024-03-10', 'end': '2024-03-01'}).status_code, 400)
+        self.assertEqual(self.client.get('/analytics/flights/', {'start': '2024-03-01', 'limit': 0}).status_code, 400)
+
+
+class AsyncViewTests(TransactionTestCase):
+    # The async views query from worker threads, on connections of their own.
+    def setUp(self):
+        get_cache().clear()
+        self.cebu = make_city('Cebu', 'CEB')
+        self.manila = make_city('Manila', 'MNL')
+        self.flight = make_flight(self.cebu, self.manila, timezone.make_aware(datetime(2024, 3, 1, 8, 0)))
+        self.user = User.objects.create_user(username='juan', password='secret')
+        Reservation.objects.create(flight=self.flight, **reservation_fields(self.user), seat_type='economy')
+        self.token = Token.objects.create(user=self.user)
+        self.sync_flight = APIClient().get(f'/get_flight/{self.flight.id}/').json()
+
+    async def test_async_endpoints_match_sync_payloads(self):
+        client = AsyncClient()
+
+        response = await client.get(f'/async/get_flight/{self.flight.id}/')
+        self.assertEqual(response.json(), self.sync_flight)
+        self.assertEqual((await client.get('/async/get_flight/0/')).status_code, 404)
+
+        response = await client.post('/async/search/', {'origin_id': self.cebu.id, 'seat_type': 'economy'},
+                                     content_type='application/json')
+        self.assertEqual([flight['id'] for flight in response.json()], [self.flight.id])
+
+        self.assertEqual(len((await client.get('/async/flights/')).json()), 1)
+        cities = await client.get('/async/cities/')
+        self.assertEqual([city['airport_code'] for city in cities.json()], ['CEB', 'MNL'])
+        self.assertEqual((await client.get('/async/cities/', headers={'If-None-Match': cities['ETag']})).status_code, 304)
+
+    async def test_async_user_reservations_requires_token(self):
+        client = AsyncClient()
+        self.assertEqual((await client.get('/async/user_reservations/')).status_code, 401)
+
+        response = await client.get('/async/user_reservations/', headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([reservation['flight']['id'] for reservation in response.json()], [self.flight.id])
+
+    async def test_async_flight_list_pages_and_streams_like_the_sync_one(self):
+        later = await sync_to_async(make_flight)(self.cebu, self.manila, timezone.make_aware(datetime(2024, 3, 2, 8, 0)))
+        sync_get = sync_to_async(lambda *args: APIClient().get(*args).json())
+        client = AsyncClient()
+
+        first = (await client.get('/async/flights/', {'limit': 1})).json()
+        self.assertEqual(first, await sync_get('/flights/', {'limit': 1}))
+        second = (await client.get('/async/flights/', {'limit': 1, 'cursor': first['next']})).json()
+        self.assertEqual([flight['id'] for flight in second['results']], [later.id])
+        self.assertEqual((await client.get('/async/flights/', {'cursor': 'junk'})).status_code, 400)
+
+        response = await client.get('/async/flights/', {'stream': '1'})
+        self.assertTrue(response.is_async)
+        lines = [json.loads(line) async for line in response.streaming_content]
+        self.assertEqual([flight['id'] for flight in lines], [self.flight.id, later.id])
+
+    async def test_async_requests_do_not_queue_on_one_thread(self):
+        def slow(request):
+            time.sleep(0.2)
+            return HttpResponse(str(threading.get_ident()))
+
+        view = run_in_thread(slow)
+        started = time.perf_counter()
+        responses = await asyncio.gather(*(view(RequestFactory().get('/')) for _ in range(4)))
+
+        self.assertLess(time.perf_counter() - started, 0.6)
+        self.assertEqual(len({response.content for response in responses}), 4)
+
+    async def test_async_search_shares_the_sync_search_cache(self):
+        registry.reset()
+        criteria = {'origin_id': self.cebu.id, 'destination_id': self.manila.id, 'seat_type': 'economy'}
+        sync_rows = await sync_to_async(lambda: APIClient().post('/search/', criteria, format='json').json())()
+
+        response = await AsyncClient().post('/async/search/', criteria, content_type='application/json')
+
+        self.assertEqual(response.json(), sync_rows)
+        self.assertEqual(registry.value('airline_search_cache_total', result='miss'), 1)
+        self.assertEqual(registry.value('airline_search_cache_total', result='hit'), 1)
+
+
+class RequestMetricsTests(TestCase):
+    def setUp(self):
+        registry.reset()
+        self.client = APIClient()
+        cebu = make_city('Cebu', 'CEB')
+        self.flight = make_flight(cebu, make_city('Manila', 'MNL'), timezone.make_aware(datetime(2024, 3, 1, 8, 0)))
+
+    def test_metrics_endpoint_reports_per_route_histograms(self):
+        self.client.post('/search/', {'seat_type': 'economy'}, format='json')
+        self.client.get(f'/get_flight/{self.flight.id}/')
+
+        response = self.client.get('/metrics/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('airline_requests_total{method="POST",route="search/",status="200"} 1', body)
+        self.assertIn('airline_request_duration_seconds_count{method="GET",route="get_flight/<int:id>/"} 1', body)
+        self.assertIn('airline_db_queries_per_request_bucket{route="search/",le="1"} 1', body)
+        self.assertIn('airline_serializer_duration_seconds_count{serializer="FlightSerializer[]"} 1', body)
+        self.assertIn('airline_response_size_bytes_count{route="search/"} 1', body)
+
+    @override_settings(METRICS_SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged_with_queries(self):
+        with self.assertLogs('airlineapp.slow_requests', 'WARNING') as logs:
+            APIClient().get(f'/get_flight/{self.flight.id}/')
+        entry = json.loads(logs.records[0].getMessage())
+        self.assertEqual(entry['route'], 'get_flight/<int:id>/')
+        self.assertGreaterEqual(entry['db_queries'], 1)
+        self.assertTrue(entry['slowest_queries'][0]['sql'].startswith('SELECT'))
+
+    @override_settings(SEARCH_LOG_SAMPLE_RATE=1)
+    def test_search_criteria_are_logged_when_sampled(self):
+        with self.assertLogs('airlineapp.search', 'INFO') as logs:
+            self.client.post('/search/', {'seat_type': 'economy'}, format='json')
+        self.assertEqual(json.loads(logs.records[0].getMessage()), {'event': 'flight_search', 'criteria': {'seat_type': 'economy'}})
+
+
+class TokenCacheTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user('ana', 'ana@example.com', 'secret')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_repeat_requests_authenticate_without_queries(self):
+        self.assertEqual(self.client.get('/api/user-data/').status_code, 200)
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/user-data/')
+        self.assertEqual(response.json()['user'], {'user_id': self.user.id, 'username': 'ana', 'email': 'ana@example.com'})
+
+    def test_snapshot_leaves_out_the_password(self):
+        self.client.get('/api/user-data/')
+
+        snapshot = token_cache.get(self.token.key)
+
+        self.assertNotIn(self.user.password, snapshot['user'])
+        user = restore_token(self.token.key, snapshot).user
+        self.assertEqual(user.get_deferred_fields(), {'password', 'last_login', 'date_joined'})
+
+    def test_deactivation_revokes_cached_token(self):
+        self.client.get('/api/user-data/')
+
+        admin_client().post(f'/api/active_status/{self.user.id}/', {'is_active': False}, format='json')
+
+        self.assertEqual(self.client.get('/api/user-data/').status_code, 401)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get('/api/user-data/')
+
+        self.token.delete()
+
+        self.assertEqual(self.client.get('/api/user-data/').status_code, 401)
+
+    def test_staff_toggle_refreshes_snapshot(self):
+        self.client.get('/api/user-data/')
+
+        admin_client().post(f'/api/staff_status/{self.user.id}/', {'is_staff': True}, format='json')
+
+        with self.assertNumQueries(1):
+            self.client.get('/api/user-data/')
+
+    def test_snapshot_cached_before_commit_is_dropped_on_commit(self):
+        self.client.get('/api/user-data/')
+        stale = token_cache.get(self.token.key)
+        admin = admin_client()
+
+        for path, body in ((f'/api/staff_status/{self.user.id}/', {'is_staff': True}),
+                           ('/api/users/bulk_status/', {'ids': [self.user.id], 'is_staff': False})):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(admin.post(path, body, format='json').status_code, 200)
+                # A request authenticating before the commit still sees the old row.
+                token_cache.set(self.token.key, stale)
+            self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = type(token_cache)(max_entries=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+
+
+@override_settings(AIRLINE_AUTH_MODE='signed')
+class SignedTokenTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ana', 'ana@example.com', 'secret')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/login/', {'username': 'ana', 'password': 'secret'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_login_issues_pair_and_access_token_needs_no_queries(self):
+        tokens = self.login()
+        self.assertFalse(Token.objects.filter(user=self.user).exists())
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens["access"]}')
+        with self.assertNumQueries(1):  # the reservation listing itself
+            response = client.get('/user_reservations/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_tampered_or_expired_access_token_is_rejected(self):
+        access = self.login()['access']
+        client = APIClient()
+
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access[:-1]}x')
+        self.assertEqual(client.get('/api/user-data/').status_code, 401)
+
+        with override_settings(ACCESS_TOKEN_LIFETIME=-1):
+            expired = self.login()['access']
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {expired}')
+        self.assertEqual(client.get('/api/user-data/').status_code, 401)
+
+    def test_refresh_rotates_and_spent_token_cannot_be_reused(self):
+        refresh = self.login()['refresh']
+
+        response = self.client.post('/token/refresh/', {'refresh': refresh}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.json()['refresh'], refresh)
+
+        self.assertEqual(self.client.post('/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+
+    def test_deactivation_and_logout_revoke_refresh_tokens(self):
+        first, second = self.login()['refresh'], self.login()['refresh']
+
+        self.client.post('/logout/', {'refresh': first}, format='json')
+        self.assertEqual(self.client.post('/token/refresh/', {'refresh': first}, format='json').status_code, 401)
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.post('/token/refresh/', {'refresh': second}, format='json').status_code, 401)
+
+
+class BulkUserAdminTests(TestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.admin = admin_client()
+
+    def make_users(self, count, domain='example.com'):
+        start = User.objects.count()
+        return [User.objects.create_user(f'user{start + i}', f'user{start + i}@{domain}', 'secret') for i in range(count)]
+
+    def bulk(self, **body):
+        return self.admin.post('/api/users/bulk_status/', body, format='json')
+
+    def test_deactivation_revokes_tokens_refresh_tokens_and_sessions(self):
+        user, bystander = self.make_users(2)
+        token = Token.objects.create(user=user)
+        token_client = APIClient()
+        token_client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        token_client.get('/api/user-data/')
+        refresh = issue_refresh_token(user)
+        session_client = APIClient()
+        session_client.force_login(user)
+
+        response = self.bulk(ids=[user.id], is_active=False)
+
+        self.assertEqual(response.json(), {'matched': 1, 'updated': 1, 'tokens_forgotten': 1, 'tokens_deleted': 1,
+                                           'refresh_tokens_revoked': 1})
+        self.assertFalse(Token.objects.filter(user=user).exists())
+        self.assertEqual(token_client.get('/api/user-data/').status_code, 401)
+        self.assertEqual(self.admin.post('/token/refresh/', {'refresh': refresh}, format='json').status_code, 401)
+        self.assertEqual(session_client.get('/api/user-data/').status_code, 401)
+        self.assertTrue(User.objects.get(pk=bystander.pk).is_active)
+
+    def test_sets_rather_than_toggles(self):
+        users = self.make_users(3, domain='spam.test')
+        self.make_users(2)
+
+        first = self.bulk(filter={'email__iendswith': '@spam.test'}, is_active=False, is_staff=True).json()
+        second = self.bulk(filter={'email__iendswith': '@spam.test'}, is_active=False, is_staff=True).json()
+
+        self.assertEqual((first['matched'], first['updated']), (3, 3))
+        self.assertEqual((second['matched'], second['updated']), (3, 0))
+        self.assertEqual(set(User.objects.filter(is_active=False, is_staff=True).values_list('id', flat=True)),
+                         {user.id for user in users})
+
+    def test_only_staff_may_change_users(self):
+        user, = self.make_users(1)
+        token = Token.objects.create(user=user)
+        passenger = APIClient()
+        passenger.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        for client in (APIClient(), passenger):
+            self.assertIn(client.post('/api/users/bulk_status/', {'filter': {'is_active': True}, 'is_active': False},
+                                      format='json').status_code, (401, 403))
+            self.assertIn(client.post(f'/api/staff_status/{user.id}/', {'is_staff': True}, format='json').status_code, (401, 403))
+            self.assertIn(client.post(f'/api/active_status/{user.id}/', {'is_active': False}, format='json').status_code, (401, 403))
+        self.assertFalse(User.objects.filter(is_active=False).exists())
+        self.assertFalse(User.objects.get(pk=user.pk).is_staff)
+
+    def test_single_user_endpoints_set_the_value_given(self):
+        user, = self.make_users(1)
+
+        for _ in range(2):
+            response = self.admin.post(f'/api/active_status/{user.id}/', {'is_active': False}, format='json')
+            self.assertEqual(response.json()['is_active'], False)
+        self.assertFalse(User.objects.get(pk=user.pk).is_active)
+        self.assertEqual(self.admin.post(f'/api/staff_status/{user.id}/', {}, format='json').status_code, 400)
+        self.assertEqual(self.admin.post('/api/staff_status/0/', {'is_staff': True}, format='json').status_code, 404)
+
+    def test_query_count_does_not_grow_with_users(self):
+        def deactivate(users):
+            for user in users:
+                Token.objects.create(user=user)
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.bulk(ids=[user.id for user in users], is_active=False).json()['updated'], len(users))
+            return len(queries)
+
+        self.assertEqual(deactivate(self.make_users(25)), deactivate(self.make_users(1)))
+
+    def test_invalid_requests_are_rejected(self):
+        user, = self.make_users(1)
+        for body in ({'is_active': False},
+                     {'ids': [user.id], 'filter': {'is_staff': True}, 'is_active': False},
+                     {'ids': [user.id]},
+                     {'ids': [user.id], 'is_active': 'no'},
+                     {'filter': {'password__startswith': 'pbkdf2'}, 'is_active': False},
+                     {'filter': {'date_joined__gte': 'yesterday'}, 'is_active': False}):
+            self.assertEqual(self.bulk(**body).status_code, 400, body)
+
+
+def legacy_user(username, **overrides):
+    values = {
+        'password': 'secret', 'last_login': '', 'is_superuser': '0', 'username': username,
+        'email': f'{username}@example.com', 'is_staff': '0', 'is_active': '1', 'data_joined': '2019-05-04 10:30:00',
+    }
+    values.update(overrides)
+    return AuthUser.objects.create(**values)
+
+
+class LegacyUserMigrationTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'legacy_users.json')
+
+    def migrate(self, **options):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('migrate_legacy_users', checkpoint=self.checkpoint, chunk_size=2, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_converts_rows_into_users_and_passengers(self):
+        legacy_user('ana', last_login='2024-02-01T09:00:00+08:00')
+        legacy_user('ben', is_active='0', password='')
+        legacy_user('root', is_staff='t', is_superuser='t')
+        legacy_user('ana', email='duplicate@example.com')
+        bad = legacy_user('cruz', data_joined='not a date')
+        User.objects.create_user(username='dana', password='x')
+        legacy_user('dana')
+
+        out, err = self.migrate()
+
+        ana = User.objects.get(username='ana')
+        # Hashed at full strength by the configured default hasher.
+        self.assertEqual(identify_hasher(ana.password).algorithm, get_hasher().algorithm)
+        self.assertTrue(ana.check_password('secret'))
+        self.assertEqual(ana.email, 'ana@example.com')
+        self.assertEqual(ana.date_joined, timezone.make_aware(datetime(2019, 5, 4, 10, 30)))
+        self.assertEqual(ana.last_login, timezone.make_aware(datetime(2024, 2, 1, 1, 0)))
+        ben = User.objects.get(username='ben')
+        self.assertFalse(ben.is_active)
+        self.assertFalse(ben.has_usable_password())
+        root = User.objects.get(username='root')
+        self.assertTrue(root.is_staff and root.is_superuser)
+        self.assertEqual(set(Passenger.objects.values_list('user__username', flat=True)), {'ana', 'ben'})
+        self.assertFalse(User.objects.filter(username='cruz').exists())
+        self.assertIn(f'id {bad.id}: invalid date', err)
+        self.assertIn('3 users and 2 passengers created, 2 skipped, 1 failed', out)
+        self.assertIn('rows/s); 1 need a password reset', out)
+
+    def test_reset_passwords_leaves_plaintext_passwords_unusable(self):
+        legacy_user('ana')
+        legacy_user('ben')
+
+        out, _ = self.migrate(reset_passwords=True)
+
+        self.assertFalse(User.objects.filter(username__in=['ana', 'ben'], password__startswith='pbkdf2').exists())
+        self.assertFalse(User.objects.get(username='ana').has_usable_password())
+        self.assertIn('2 need a password reset', out)
+
+    def test_resumes_after_the_checkpoint(self):
+        legacy_user('ana')
+        legacy_user('ben')
+        legacy_user('cruz')
+        self.migrate()
+        with open(self.checkpoint) as stream:
+            self.assertEqual(json.load(stream)['last_id'], AuthUser.objects.order_by('pk').last().pk)
+
+        legacy_user('dana')
+        with self.assertNumQueries(7):
+            # Read, username check, both inserts in a transaction, then the read that comes back empty.
+            out, _ = self.migrate()
+        self.assertIn('1 users and 1 passengers created, 0 skipped', out)
+        self.assertEqual(User.objects.count(), 4)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.alive = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(TestCase):
+    def setUp(self):
+        registry.reset()
+
+    def make_pool(self, **options):
+        def ping(conn):
+            if not conn.alive:
+                raise OperationalError('gone away')
+        values = {'size': 2, 'recycle': 60, 'timeout': 0.05, 'ping_after': 0}
+        values.update(options)
+        return ConnectionPool('default', ping=ping, **values)
+
+    def test_connections_are_reused_and_size_is_bounded(self):
+        pool = self.make_pool()
+        first = pool.checkout(FakeConnection)
+        pool.checkin(first)
+        self.assertIs(pool.checkout(FakeConnection), first)
+        pool.checkout(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(FakeConnection)
+        metrics = registry.render()
+        for line in ('airline_db_pool_checkouts_total{alias="default"} 4', 'airline_db_pool_connections_opened_total{alias="default"} 2',
+                     'airline_db_pool_waits_total{alias="default"} 1', 'airline_db_pool_timeouts_total{alias="default"} 1'):
+            self.assertIn(line, metrics)
+
+    def test_waiting_checkout_gets_the_returned_connection(self):
+        pool = self.make_pool(size=1, timeout=5)
+        held = pool.checkout(FakeConnection)
+        threading.Timer(0.05, pool.checkin, [held]).start()
+        self.assertIs(pool.checkout(FakeConnection), held)
+
+    def test_dead_and_old_connections_are_replaced(self):
+        pool = self.make_pool()
+        dead = pool.checkout(FakeConnection)
+        dead.alive = False
+        pool.checkin(dead)
+        replacement = pool.checkout(FakeConnection)
+        self.assertIsNot(replacement, dead)
+        self.assertTrue(dead.closed)
+
+        pool.recycle = 0
+        pool.checkin(replacement)
+        self.assertIsNot(pool.checkout(FakeConnection), replacement)
+        self.assertTrue(replacement.closed)
+        self.assertIn('airline_db_pool_reconnects_total{alias="default"} 1', registry.render())
+        self.assertIn('airline_db_pool_recycled_total{alias="default"} 1', registry.render())
+
+    def test_pooled_backend_returns_connections_on_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            handler = ConnectionHandler({'default': {'ENGINE': 'airlineapp.db.sqlite3', 'NAME': os.path.join(directory, 'pool.sqlite3')}})
+            wrapper = handler['default']
+            try:
+                for _ in range(3):
+                    with wrapper.cursor() as cursor:
+                        cursor.execute('SELECT 1')
+                    raw = wrapper.connection
+                    wrapper.close()
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                self.assertIs(wrapper.connection, raw)
+                self.assertIn('airline_db_pool_connections_opened_total{alias="default"} 1', registry.render())
+            finally:
+                wrapper.close()
+                close_pools()
+
+
+class ReplicaRouterTests(TransactionTestCase):
+    replicas = ['replica1', 'replica2']
+    databases = {'default', *replicas}
+
+    def setUp(self):
+        registry.reset()
+        replica_pool.reset()
+        get_cache().clear()
+        self.client = APIClient()
+        make_city('Cebu', 'CEB')
+
+    def reads_by_alias(self, path, client=None, aliases=('default', *replicas)):
+        captures = {alias: CaptureQueriesContext(connections[alias]) for alias in aliases}
+        for capture in captures.values():
+            capture.__enter__()
+        try:
+            (client or self.client).get(path)
+        finally:
+            for capture in captures.values():
+                capture.__exit__(None, None, None)
+        return {alias: len(capture) for alias, capture in captures.items()}
+
+    @override_settings(REPLICA_DATABASES=['replica1', 'replica2'])
+    def test_read_only_views_round_robin_over_replicas(self):
+        first, second = self.reads_by_alias('/api/auth_users/'), self.reads_by_alias('/api/auth_users/')
+
+        self.assertEqual((first['default'], second['default']), (0, 0))
+        self.assertEqual({alias for alias, count in first.items() if count}, {'replica1'})
+        self.assertEqual({alias for alias, count in second.items() if count}, {'replica2'})
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    def test_client_reads_its_own_writes_from_the_primary(self):
+        user = User.objects.create_user('ana', 'ana@example.com', 'secret')
+        token = Token.objects.create(user=user)
+        writer, other = APIClient(), APIClient()
+        writer.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+        writer.post('/addcity/', {'name': 'Davao', 'airport_name': 'Davao Airport', 'airport_code': 'DVO'}, format='json')
+
+        self.assertGreater(self.reads_by_alias('/api/auth_users/', writer)['default'], 0)
+        self.assertEqual(self.reads_by_alias('/api/auth_users/', other)['default'], 0)
+        # A token client that drops the cookie is still pinned by its credentials.
+        writer.cookies.clear()
+        self.assertGreater(self.reads_by_alias('/api/auth_users/', writer)['default'], 0)
+
+    @override_settings(DEBUG=True)
+    def test_asgi_middleware_chain_is_not_adapted(self):
+        # Any sync-only middleware would make Django log an adapter and run the whole chain on one thread.
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
+
+    @override_settings(REPLICA_DATABASES=['replica1'])
+    async def test_async_requests_that_write_are_pinned(self):
+        data = {'name': 'Davao', 'airport_name': 'Davao Airport', 'airport_code': 'DVO'}
+
+        response = await AsyncClient().post('/addcity/', data, content_type='application/json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = await AsyncClient().get('/async/cities/')
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    @override_settings(REPLICA_DATABASES=['replica1', 'replica2'])
+    def test_unavailable_replica_is_skipped_then_primary_is_used(self):
+        with mock.patch.object(connections['replica1'], 'ensure_connection', side_effect=OperationalError('down')):
+            counts = [self.reads_by_alias('/api/auth_users/', aliases=['default', 'replica2']) for _ in range(3)]
+            self.assertEqual(counts, [{'default': 0, 'replica2': counts[0]['replica2']}] * 3)
+
+            with mock.patch.object(connections['replica2'], 'ensure_connection', side_effect=OperationalError('down')):
+                replica_pool.reset()
+                self.assertGreater(self.reads_by_alias('/api/auth_users/', aliases=['default'])['default'], 0)
+        self.assertIn('airline_replica_unavailable_total{alias="replica1"} 2', registry.render())
+
+
+class SessionStoreTests(TestCase):
+    def test_prune_sessions_deletes_only_expired_rows_in_batches(self):
+        now = timezone.now()
+        Session.objects.bulk_create(
+            [Session(session_key=f'old{i}', session_data='', expire_date=now - timedelta(days=1)) for i in range(5)]
+            + [Session(session_key='live', session_data='', expire_date=now + timedelta(days=1))]
+        )
+        out = io.StringIO()
+
+        call_command('prune_sessions', batch_size=2, stdout=out)
+
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ['live'])
+        self.assertIn('5 expired sessions deleted', out.getvalue())
+
+    def test_benchmark_runs_against_each_store(self):
+        with override_settings(PASSWORD_HASHERS=FAST_PASSWORD_HASHERS):
+            info = seed(0, 0, 3, 2, random.Random(1))
+            for store, engine in settings.SESSION_ENGINES.items():
+                with override_settings(SESSION_ENGINE=engine):
+                    login, read = session_store_benchmark(info, 2, 3, random.Random(1))
+                self.assertEqual((login['errors'], read['errors'], read['requests']), (0, 0, 3), store)
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_seed_and_drive_every_scenario(self):
+        info = seed(flights=40, reservations=30, users=5, cities=4, rng=random.Random(1))
+
+        self.assertEqual((Flight.objects.count(), Reservation.objects.count(), len(info.tokens)), (40, 30, 5))
+        driver = InProcessDriver()
+        for name, scenario in SCENARIOS.items():
+            requests = 1 if name == 'login' else 3
+            result = run_scenario(scenario(info), driver, requests=requests, concurrency=1, warmup=0, seed_value=1)
+            self.assertEqual((result['requests'], result['errors']), (requests, 0), name)
+            self.assertGreaterEqual(result['mean_queries'], 1)
@@ -0,0 +1,203 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.db import transaction
+
+from .cache import CITY_FIELDS, bump_version, get_version
+from .models import City
+
+
+# Versions the index alone; cached city lists go by the cities namespace.
+CITY_INDEX_NAMESPACE = 'cities:index'
+
+# Tiers, best first. Within a tier, shorter and alphabetically earlier terms
+# win, and an airport code sorts ahead of a name spelled the same, so an exact
+# code hit always comes first.
+PREFIX, NAME_WORD, AIRPORT_WORD = range(3)
+CODE, TEXT = range(2)
+# Typos are matched against prefixes up to this long; longer queries are cut to it.
+FUZZY_PREFIX_LENGTH = 8
+FUZZY_MIN_LENGTH = 4
+WORD = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    """Lower-case and strip accents, so 'Cebú' and 'cebu' index alike."""
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold().strip()
+
+
+def deletes(text):
+    return {text[:i] + text[i + 1:] for i in range(len(text))}
+
+
+def city_terms(city):
+    """(tier, term, kind) triples a city is found under."""
+    name, code, airport = normalize(city['name']), normalize(city['airport_code']), normalize(city['airport_name'])
+    terms = {(PREFIX, code, CODE), (PREFIX, name, TEXT), (AIRPORT_WORD, airport, TEXT)}
+    terms.update((NAME_WORD, word, TEXT) for word in WORD.findall(name))
+    terms.update((AIRPORT_WORD, word, TEXT) for word in WORD.findall(airport))
+    return {(tier, term, kind) for tier, term, kind in terms if term}
+
+
+class CityIndex:
+    """In-memory typeahead over city name, airport code and airport name.
+
+    Prefix lookups bisect one sorted list of (term, kind, city id) per tier and
+    stop as soon as ``limit`` cities are found. Typos are caught with a
+    symmetric-delete map: each term prefix is stored under its one-character
+    deletions, so the prefixes within one edit of a query are found with a
+    handful of dict lookups and then scanned like an ordinary prefix. Patched in place on City
+    save/delete; the shared ``cities`` version tells other workers to rebuild.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._lock = threading.RLock()
+        self._reset([])
+
+    def _reset(self, cities):
+        self._cities = {}
+        self._tiers = ([], [], [])
+        self._deleted = {}
+        for city in cities:
+            self._add(city)
+        for entries in self._tiers:
+            entries.sort()
+
+    def __len__(self):
+        return len(self._cities)
+
+    def load(self, cities):
+        with self._lock:
+            self._reset(cities)
+
+    def rebuild(self):
+        version = get_version(CITY_INDEX_NAMESPACE)
+        cities = list(City.objects.values(*CITY_FIELDS))
+        with self._lock:
+            self._reset(cities)
+            self.version = version
+
+    def invalidate(self):
+        with self._lock:
+            self.version = None
+
+    def ensure_current(self):
+        if self.version is None or self.version != get_version(CITY_INDEX_NAMESPACE):
+            self.rebuild()
+
+    def add(self, city):
+        with self._lock:
+            self._remove(city['id'])
+            self._add(city, keep_sorted=True)
+
+    def remove(self, city_id):
+        with self._lock:
+            self._remove(city_id)
+
+    @staticmethod
+    def _fuzzy_keys(term):
+        # Query length n matches prefixes of length n (substitution) and n + 1
+        # (a character missing from the query) through this table.
+        for length in range(FUZZY_MIN_LENGTH, min(len(term), FUZZY_PREFIX_LENGTH + 1) + 1):
+            prefix = term[:length]
+            for variant in deletes(prefix):
+                yield variant, prefix
+
+    def _add(self, city, keep_sorted=False):
+        terms = city_terms(city)
+        self._cities[city['id']] = (city, terms, normalize(city['name']))
+        for tier, term, kind in terms:
+            entry = (term, kind, city['id'])
+            if keep_sorted:
+                insort(self._tiers[tier], entry)
+            else:
+                self._tiers[tier].append(entry)
+            for variant, prefix in self._fuzzy_keys(term):
+                prefixes = self._deleted.setdefault(variant, {})
+                prefixes[prefix] = prefixes.get(prefix, 0) + 1
+
+    def _remove(self, city_id):
+        indexed = self._cities.pop(city_id, None)
+        if indexed is None:
+            return
+        for tier, term, kind in indexed[1]:
+            entries = self._tiers[tier]
+            index = bisect_left(entries, (term, kind, city_id))
+            if index < len(entries) and entries[index] == (term, kind, city_id):
+                del entries[index]
+            for variant, prefix in self._fuzzy_keys(term):
+                prefixes = self._deleted[variant]
+                prefixes[prefix] -= 1
+                if not prefixes[prefix]:
+                    del prefixes[prefix]
+                    if not prefixes:
+                        del self._deleted[variant]
+
+    def search(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+        with self._lock:
+            found, seen = [], set()
+            self._scan(query, limit, found, seen)
+            if len(found) < limit and len(query) >= FUZZY_MIN_LENGTH:
+                for prefix in sorted(self._typo_prefixes(query[:FUZZY_PREFIX_LENGTH])):
+                    self._scan(prefix, limit, found, seen)
+            return [self._cities[city_id][0] for city_id in found]
+
+    def _scan(self, prefix, limit, found, seen):
+        for entries in self._tiers:
+            index = bisect_left(entries, (prefix,))
+            while len(found) < limit and index < len(entries) and entries[index][0].startswith(prefix):
+                city_id = entries[index][2]
+                if city_id not in seen:
+                    seen.add(city_id)
+                    found.append(city_id)
+                index += 1
+
+    def _typo_prefixes(self, query):
+        # Prefixes one edit from the query: the query with a character dropped,
+        # or indexed prefixes that share a deletion with it.
+        candidates = set(self._deleted.get(query, ()))
+        for variant in deletes(query):
+            candidates.add(variant)
+            candidates.update(self._deleted.get(variant, ()))
+        candidates.discard(query)
+        return candidates
+
+
+city_index = CityIndex()
+
+
+def search_cities(query, limit=10):
+    city_index.ensure_current()
+    return city_index.search(query, limit)
+
+
+def _apply_local_change(change):
+    # Patched once the save commits, so a rolled-back save leaves nothing behind.
+    transaction.on_commit(lambda: _patch(change))
+
+
+def _patch(change):
+    # Keep this worker's patched copy; other workers see the new version and rebuild.
+    # Only when our bump is the one right after the version the index holds:
+    # otherwise another worker changed cities in between and we must rebuild too.
+    known = city_index.version
+    change()
+    version = bump_version(CITY_INDEX_NAMESPACE)
+    if known is not None and version == known + 1:
+        city_index.version = version
+
+
+def city_saved(city):
+    values = {field: getattr(city, field) for field in CITY_FIELDS}
+    _apply_local_change(lambda: city_index.add(values))
+
+
+def city_deleted(city_id):
+    _apply_local_change(lambda: city_index.remove(city_id))
@@ -1,13 +1,17 @@
 from django.urls import path
 from .views import FlightList, FlightSearchView, SearchResultView, ReservationView, create_reservation
-from .views import ReservationListView, user_reservations, get_reservation, edit_reservation, delete_reservation, register, PassengerLoginView, LogoutView, register_admin, AdminLoginView, CityListView, add_city, get_city, edit_city, delete_city, add_flight, get_flight, edit_flight, delete_flight, FlightDetail 
-from .views import get_auth_users, staff_status, get_passengers, active_status, UserDataView
+from .views import ReservationListView, user_reservations, get_reservation, edit_reservation, delete_reservation, register, PassengerLoginView, LogoutView, TokenRefreshView, register_admin, AdminLoginView, CityListView, add_city, get_city, edit_city, delete_city, add_flight, get_flight, flight_batch, edit_flight, delete_flight, FlightDetail 
+from .views import import_flights_view, ConnectionSearchView, fare_calendar_view, analytics_routes_view, analytics_flights_view, metrics_view, flight_seat_map, city_typeahead
+from .views import get_auth_users, staff_status, get_passengers, active_status, bulk_user_status, UserDataView
 from rest_framework.authtoken.views import obtain_auth_token
+from . import async_views
 
 
 urlpatterns = [
     path('flights/', FlightList.as_view(), name='flightlist'),
     path('search/', FlightSearchView.as_view(), name='searchflight'),
+    path('search/connections/', ConnectionSearchView.as_view(), name='searchconnections'),
+    path('fares/calendar/', fare_calendar_view, name='fare_calendar'),
     path('result/', SearchResultView.as_view(), name='searchresult'),
 
     path('reservation/', ReservationView.as_view(), name='flightreservation'),
@@ -21,27 +25,42 @@ urlpatterns = [
     path('register/', register, name='register'),
     path('login/', PassengerLoginView.as_view(), name='passengerlogin'),
     path('logout/', LogoutView.as_view(), name='logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
 
     path('register/admin/', register_admin, name='admin_registration'),
     path('login/admin/', AdminLoginView.as_view(), name='adminlogin'),
 
     path('cities/', CityListView.as_view(), name='city-list'),
+    path('cities/search/', city_typeahead, name='city_typeahead'),
     path('addcity/', add_city, name='add_city'),
     path('get_city/<int:id>/', get_city, name='get_city'),
     path('edit_city/<int:id>/', edit_city, name='edit_city'),
     path('delete_city/<int:id>/', delete_city, name='delete_city'),
 
     path('addflight/', add_flight, name='add_flight'),
+    path('importflights/', import_flights_view, name='import_flights'),
     path('get_flight/<int:id>/', get_flight, name='get_flight'),
+    path('flights/batch/', flight_batch, name='flight_batch'),
     path('edit_flight/<int:id>/', edit_flight, name='edit_flight'),
     path('delete_flight/<int:id>/', delete_flight, name='delete_flight'),
     path('flights/<int:pk>/', FlightDetail.as_view(), name='flightdetail'),
+    path('flights/<int:pk>/seats/', flight_seat_map, name='flight_seat_map'),
 
     path('api/auth_users/', get_auth_users, name='get_auth_users'),
     path('api/passengers/', get_passengers, name='get_passengers'),
     path('api/staff_status/<int:id>/', staff_status, name='staff_status'),
     path('api/active_status/<int:id>/', active_status, name='active_status'),
+    path('api/users/bulk_status/', bulk_user_status, name='bulk_user_status'),
     path('api/user-data/', UserDataView.as_view(), name='user-data'),
     path('api/token/', obtain_auth_token, name='api_token'),
+    path('analytics/routes/', analytics_routes_view, name='analytics_routes'),
+    path('analytics/flights/', analytics_flights_view, name='analytics_flights'),
+    path('metrics/', metrics_view, name='metrics'),
+
+    path('async/flights/', async_views.flight_list, name='async_flightlist'),
+    path('async/search/', async_views.flight_search, name='async_searchflight'),
+    path('async/get_flight/<int:id>/', async_views.get_flight, name='async_get_flight'),
+    path('async/user_reservations/', async_views.user_reservations, name='async_user_reservations'),
+    path('async/cities/', async_views.city_list_view, name='async_city_list'),
 ]
 
@@ -0,0 +1,73 @@
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from .authentication import forget_user_tokens, revoke_user_refresh_tokens
+
+
+BULK_USER_LIMIT = 10000
+
+# Lookups a bulk request may filter on; anything else is rejected.
+BULK_USER_FILTERS = {
+    'is_active', 'is_staff', 'is_superuser',
+    'username__startswith', 'email__iendswith',
+    'date_joined__gte', 'date_joined__lt', 'last_login__lt', 'last_login__isnull',
+}
+
+
+class InvalidBulkUpdate(ValueError):
+    pass
+
+
+def bulk_user_targets(ids=None, filters=None):
+    if (ids is None) == (filters is None):
+        raise InvalidBulkUpdate('Give either ids or filter')
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise InvalidBulkUpdate('ids must be a list of integers')
+        return User.objects.filter(pk__in=ids)
+    if not isinstance(filters, dict) or not filters:
+        raise InvalidBulkUpdate('filter must be a non-empty object')
+    unknown = set(filters) - BULK_USER_FILTERS
+    if unknown:
+        raise InvalidBulkUpdate(f'Unsupported filter: {", ".join(sorted(unknown))}')
+    try:
+        return User.objects.filter(**filters)
+    except (ValidationError, ValueError, TypeError) as exc:
+        raise InvalidBulkUpdate(f'Invalid filter: {exc}')
+
+
+def bulk_update_users(users, is_active=None, is_staff=None):
+    """Set is_active / is_staff on every user in ``users`` with one UPDATE.
+
+    Only users whose flags actually change are written. queryset.update()
+    skips the User post_save signal, so its work is done here in bulk:
+    cached token snapshots are dropped, and deactivated users lose their
+    API tokens and refresh tokens. Session logins need nothing extra, since the auth backend
+    refuses inactive users on every request. The number of queries does not
+    depend on how many users match.
+    """
+    flags = {name: value for name, value in (('is_active', is_active), ('is_staff', is_staff)) if value is not None}
+    if not flags or not all(isinstance(value, bool) for value in flags.values()):
+        raise InvalidBulkUpdate('Set is_active and/or is_staff to true or false')
+
+    try:
+        rows = list(users.values_list('id', *flags)[:BULK_USER_LIMIT + 1])
+    except (ValidationError, ValueError, TypeError) as exc:
+        raise InvalidBulkUpdate(f'Invalid filter: {exc}')
+    if len(rows) > BULK_USER_LIMIT:
+        raise InvalidBulkUpdate(f'More than {BULK_USER_LIMIT} users match; narrow the selection')
+    wanted = tuple(flags.values())
+    changed = [row[0] for row in rows if tuple(row[1:]) != wanted]
+
+    summary = {'matched': len(rows), 'updated': 0, 'tokens_forgotten': 0, 'tokens_deleted': 0, 'refresh_tokens_revoked': 0}
+    if not changed:
+        return summary
+    with transaction.atomic():
+        summary['updated'] = User.objects.filter(pk__in=changed).update(**flags)
+        summary['tokens_forgotten'] = forget_user_tokens(changed)
+        if is_active is False:
+            summary['tokens_deleted'], _ = Token.objects.filter(user_id__in=changed).delete()
+            summary['refresh_tokens_revoked'] = revoke_user_refresh_tokens(changed)
+    return summary
@@ -1,21 +1,48 @@
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from .models import Flight, Reservation, City, Passenger
 from .serializers import UserSerializer, FlightSerializer, ReservationSerializer, RegistrationSerializer, AdminRegistrationSerializer, AdminLoginSerializer, CitySerializer
 from django.db.models import Q
 from django.views import View
+from django.utils.decorators import method_decorator
 from rest_framework import status
 from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import authenticate, login, logout
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
+from datetime import timedelta
 from dateutil import parser
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.db.models import F
 from rest_framework.authtoken.models import Token
-from rest_framework.authentication import TokenAuthentication
+from .authentication import CachedTokenAuthentication, SignedTokenAuthentication, forget_user_tokens
+from .authentication import issue_token_pair, rotate_refresh_token, revoke_refresh_token, signed_tokens_enabled, InvalidRefreshToken
+from .inventory import book_reservation, release_reservation_seats, reinstate_reservation_seats, set_seat_layout, SeatInventoryError, SoldOut, SeatTaken, SeatMapInUse
+from .seatmap import seat_map, InvalidLayout
+from .holds import convert_hold
+from .routers import read_from_replica
+from .useradmin import bulk_user_targets, bulk_update_users, InvalidBulkUpdate
+from django.db import transaction
+from .cache import city_list, city_detail, etag_matches
+from .schedule_import import import_flights, read_rows
+from .routes import available_itineraries, search_connections
+from .search_cache import cached_search, parse_departure
+from .typeahead import search_cities
+from .fares import fare_calendar
+from .analytics import flight_stats, route_stats
+from .metrics import registry, log_sampled
+from django.conf import settings
+import logging
+from .serializers import flight_rows, reservation_rows, compact_reservation_rows
+from .pagination import KeysetPaginator, InvalidCursor, STREAM_CHUNK_SIZE, wants_stream, stream_json_lines
+
+
+search_logger = logging.getLogger('airlineapp.search')
+
+flight_paginator = KeysetPaginator(ordering=('departure_time', 'id'))
+id_paginator = KeysetPaginator(ordering=('id',))
 
 
 
@@ -39,14 +66,17 @@ class PassengerLoginView(APIView):
         if user is not None:
             login(request, user)  
 
-            token, created = Token.objects.get_or_create(user=user)
-
             user_data = {
                 'user_id': user.id,
                 'username': user.username,
                 'email': user.email,  
             }
 
+            if signed_tokens_enabled():
+                return Response({**issue_token_pair(user), 'user': user_data, 'message': 'Login successful'})
+
+            token, created = Token.objects.get_or_create(user=user)
+
             return Response({'token': token.key, 'user': user_data, 'message': 'Login successful'})
 
         else:
@@ -55,12 +85,27 @@ class PassengerLoginView(APIView):
 class LogoutView(APIView):
 
     def post(self, request):
+        if request.user.is_authenticated:
+            forget_user_tokens([request.user.id])
+        if request.data.get('refresh'):
+            revoke_refresh_token(request.data['refresh'])
         logout(request)  
         return Response({'detail': 'Logged out successfully'}, status=status.HTTP_200_OK)
 
 
+class TokenRefreshView(APIView):
+    authentication_classes = []
+
+    def post(self, request):
+        try:
+            tokens = rotate_refresh_token(request.data.get('refresh'))
+        except InvalidRefreshToken as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response(tokens)
+
+
 class UserDataView(APIView):
-    authentication_classes = [TokenAuthentication]
+    authentication_classes = [SignedTokenAuthentication, CachedTokenAuthentication]
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
@@ -75,53 +120,212 @@ class UserDataView(APIView):
         return Response({'user': user_data})
 
 
+@method_decorator(read_from_replica, name='dispatch')
 class FlightList(APIView):
     def get(self, request):
-        flights = Flight.objects.all()
-        serializer = FlightSerializer(flights, many=True)
-        return Response(serializer.data)
+        flights = flight_rows.values(Flight.objects.all())
+
+        if wants_stream(request):
+            flights = flights.order_by('departure_time', 'id').iterator(chunk_size=STREAM_CHUNK_SIZE)
+            return stream_json_lines(map(flight_rows.builder(), flights))
+        if flight_paginator.is_requested(request):
+            try:
+                page = flight_paginator.page(flights, request, flight_rows.serialize)
+            except InvalidCursor:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response(page)
+
+        return Response(flight_rows.serialize(flights))
     
 @api_view(['GET'])
 def get_flight(request, id):
     try:
-        flight = Flight.objects.get(pk=id)
+        flight = Flight.objects.select_related('origin', 'destination').get(pk=id)
         serializer = FlightSerializer(flight)
         return Response(serializer.data, status=status.HTTP_200_OK)
     except Flight.DoesNotExist:
         return Response({"error": "Flight not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
+FLIGHT_BATCH_LIMIT = 500
+
+
+@api_view(['GET'])
+@read_from_replica
+def flight_batch(request):
+    """Several flights in one query: ?ids=3,1,2, optionally &fields=flight_number,origin,...
+
+    Flights come back in the order asked for, always with their id; ids that
+    match no flight are listed under "missing".
+    """
+    try:
+        ids = list(dict.fromkeys(int(pk) for pk in request.query_params.get('ids', '').split(',') if pk.strip()))
+    except ValueError:
+        return Response({'error': 'ids must be a comma-separated list of flight ids'}, status=status.HTTP_400_BAD_REQUEST)
+    if not ids:
+        return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > FLIGHT_BATCH_LIMIT:
+        return Response({'error': f'At most {FLIGHT_BATCH_LIMIT} ids per request'}, status=status.HTTP_400_BAD_REQUEST)
+
+    rows = flight_rows
+    fields = [name.strip() for name in request.query_params.get('fields', '').split(',') if name.strip()]
+    if fields:
+        try:
+            rows = flight_rows.subset(['id', *fields])
+        except ValueError as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    flights = {flight['id']: flight for flight in rows.serialize(rows.values(Flight.objects.filter(pk__in=ids)))}
+    return Response({
+        'results': [flights[pk] for pk in ids if pk in flights],
+        'missing': [pk for pk in ids if pk not in flights],
+    })
+
+
+def search_flights(criteria):
+    trip_choice = criteria.get('trip_choice')
+    destination_id = criteria.get('destination_id')
+    origin_id = criteria.get('origin_id')
+    departure_time_str = criteria.get('departure_time')
+
+    seat_type = criteria.get('seat_type')
+
+    flights = Flight.objects.select_related('origin', 'destination')
+
+    if trip_choice:
+        flights = flights.filter(trip_choice=trip_choice)
+    if destination_id:
+        flights = flights.filter(destination_id=destination_id)
+    if origin_id:
+        flights = flights.filter(origin_id=origin_id)
+    if departure_time_str:
+        flights = flights.filter(departure_time__gte=parse_departure(departure_time_str))
+
+    if seat_type:
+        flights = flights.filter(seat_type=seat_type)
 
+    return flights
+
+
+@method_decorator(read_from_replica, name='dispatch')
 class FlightSearchView(APIView):
     def post(self, request):
         search_criteria = request.data
-        print("Received search criteria:", search_criteria)
+        log_sampled(search_logger, getattr(settings, 'SEARCH_LOG_SAMPLE_RATE', 0), 'flight_search', criteria=search_criteria)
+
+        rows = cached_search(search_criteria, lambda: flight_rows.serialize(flight_rows.values(search_flights(search_criteria))))
+        return Response(rows)
 
-        trip_choice = request.data.get('trip_choice')
-        destination_id = request.data.get('destination_id')
-        origin_id = request.data.get('origin_id')
-        departure_time_str = request.data.get('departure_time')
 
-        seat_type = request.data.get('seat_type')
+CONNECTION_OPTIMIZE_CHOICES = ('earliest', 'cheapest')
 
-        flights = Flight.objects.all()
+class ConnectionSearchView(APIView):
+    def post(self, request):
+        try:
+            origin_id = int(request.data.get('origin_id'))
+            destination_id = int(request.data.get('destination_id'))
+            departure_time = parser.parse(request.data.get('departure_time'))
+            max_stops = min(max(int(request.data.get('max_stops', 2)), 0), 2)
+            limit = min(max(int(request.data.get('limit', 5)), 1), 20)
+        except (TypeError, ValueError, OverflowError):
+            return Response({'error': 'origin_id, destination_id and departure_time are required'}, status=status.HTTP_400_BAD_REQUEST)
+        optimize = request.data.get('optimize', 'earliest')
+        if optimize not in CONNECTION_OPTIMIZE_CHOICES:
+            return Response({'error': f'optimize must be one of {", ".join(CONNECTION_OPTIMIZE_CHOICES)}'}, status=status.HTTP_400_BAD_REQUEST)
+        if timezone.is_naive(departure_time):
+            departure_time = timezone.make_aware(departure_time)
+
+        itineraries = search_connections(
+            origin_id, destination_id, departure_time,
+            optimize=optimize, seat_type=request.data.get('seat_type'), max_legs=max_stops + 1, limit=limit,
+        )
+
+        flight_ids = {leg.flight_id for itinerary in itineraries for leg in itinerary.legs}
+        flights = {flight.id: FlightSerializer(flight).data for flight in Flight.objects.select_related('origin', 'destination').filter(pk__in=flight_ids)}
+        seats = {flight_id: flight['available_seats'] for flight_id, flight in flights.items()}
+        data = []
+        for itinerary in available_itineraries(itineraries, seats):
+            data.append({
+                'stops': len(itinerary.legs) - 1,
+                'total_price': itinerary.price,
+                'duration_minutes': int(itinerary.arrival - itinerary.departure) // 60,
+                'flights': [flights[leg.flight_id] for leg in itinerary.legs],
+            })
+        return Response(data)
+
+
+FARE_CALENDAR_MAX_DAYS = 366
+
+@api_view(['GET'])
+def fare_calendar_view(request):
+    try:
+        origin_id = int(request.query_params.get('origin_id'))
+        destination_id = int(request.query_params.get('destination_id'))
+        start = parser.parse(request.query_params.get('start')).date()
+        end_param = request.query_params.get('end')
+        end = parser.parse(end_param).date() if end_param else start + timedelta(days=30)
+    except (TypeError, ValueError, OverflowError):
+        return Response({'error': 'origin_id, destination_id and start are required'}, status=status.HTTP_400_BAD_REQUEST)
+    if end < start or (end - start).days > FARE_CALENDAR_MAX_DAYS:
+        return Response({'error': f'end must be within {FARE_CALENDAR_MAX_DAYS} days after start'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'origin_id': origin_id,
+        'destination_id': destination_id,
+        'start': start,
+        'end': end,
+        'days': fare_calendar(origin_id, destination_id, start, end),
+    })
+
+
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_MAX_FLIGHTS = 1000
+
+
+def analytics_params(request):
+    """Parse start/end and the optional route filter shared by the analytics endpoints."""
+    params = request.query_params
+    start = parser.parse(params.get('start')).date()
+    end = parser.parse(params['end']).date() if params.get('end') else start + timedelta(days=30)
+    origin_id = int(params['origin_id']) if params.get('origin_id') else None
+    destination_id = int(params['destination_id']) if params.get('destination_id') else None
+    return start, end, origin_id, destination_id
+
+
+@api_view(['GET'])
+def analytics_routes_view(request):
+    try:
+        start, end, origin_id, destination_id = analytics_params(request)
+    except (TypeError, ValueError, OverflowError):
+        return Response({'error': 'start is required; end, origin_id and destination_id must be valid'}, status=status.HTTP_400_BAD_REQUEST)
+    if end < start or (end - start).days > ANALYTICS_MAX_DAYS:
+        return Response({'error': f'end must be within {ANALYTICS_MAX_DAYS} days after start'}, status=status.HTTP_400_BAD_REQUEST)
 
-        if trip_choice:
-            flights = flights.filter(trip_choice=trip_choice)
-        if destination_id:
-            flights = flights.filter(destination_id=destination_id)
-        if origin_id:
-            flights = flights.filter(origin_id=origin_id)
-        if departure_time_str:
-            departure_time = parser.parse(departure_time_str)
-            departure_time_aware = timezone.make_aware(departure_time)
-            flights = flights.filter(departure_time__gte=departure_time_aware)
+    by_day = request.query_params.get('group') == 'day'
+    return Response({
+        'start': start,
+        'end': end,
+        'routes': route_stats(start, end, origin_id, destination_id, by_day=by_day),
+    })
 
-        if seat_type:
-            flights = flights.filter(seat_type=seat_type)
 
-        serializer = FlightSerializer(flights, many=True)
-        return Response(serializer.data)
+@api_view(['GET'])
+def analytics_flights_view(request):
+    try:
+        start, end, origin_id, destination_id = analytics_params(request)
+        limit = int(request.query_params.get('limit', 100))
+    except (TypeError, ValueError, OverflowError):
+        return Response({'error': 'start is required; end, origin_id, destination_id and limit must be valid'}, status=status.HTTP_400_BAD_REQUEST)
+    if end < start or (end - start).days > ANALYTICS_MAX_DAYS:
+        return Response({'error': f'end must be within {ANALYTICS_MAX_DAYS} days after start'}, status=status.HTTP_400_BAD_REQUEST)
+    if not 1 <= limit <= ANALYTICS_MAX_FLIGHTS:
+        return Response({'error': f'limit must be between 1 and {ANALYTICS_MAX_FLIGHTS}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'start': start,
+        'end': end,
+        'flights': flight_stats(start, end, origin_id, destination_id, limit=limit),
+    })
 
 
 class SearchResultView(APIView):
@@ -151,37 +355,70 @@ def create_reservation(request):
     email = request.data.get('email')
     contact_number = request.data.get('contact_number')
     seat_type = request.data.get('seat_type')
+    seat_number = request.data.get('seat_number')
+
+    try:
+        reservation = book_reservation(
+            flight_id,
+            seat_type=seat_type,
+            seat_number=seat_number,
+            user=user,
+            first_name=first_name,
+            middle_name=middle_name,
+            last_name=last_name,
+            email=email,
+            contact_number=contact_number,
+            status='pending'
+        )
+    except Flight.DoesNotExist:
+        return Response({"error": "Flight not found"}, status=status.HTTP_404_NOT_FOUND)
+    except (SoldOut, SeatTaken) as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+    except SeatInventoryError as exc:
+        return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
+    return Response({'reservation_id': reservation.id, 'seat_number': reservation.seat_number})
 
-    reservation = Reservation.objects.create(
-        flight_id=flight_id,
-        user=user, 
-        first_name=first_name,
-        middle_name=middle_name,
-        last_name=last_name,
-        email=email,
-        contact_number=contact_number,
-        seat_type=seat_type,
-        status='pending'  
-    )
 
-    return Response({'reservation_id': reservation.id})
+RESERVATION_STATUSES = {choice for choice, _ in Reservation.STATUS_CHOICES}
+
+
+def reservation_listing(request, reservations):
+    """Shared by ReservationListView and user_reservations.
+
+    ?status=pending,confirmed filters, ?compact=1 switches to the short
+    representation; ?stream and ?limit/?cursor work as on the flight list.
+    """
+    statuses = [value for value in request.GET.get('status', '').split(',') if value]
+    if statuses:
+        if not RESERVATION_STATUSES.issuperset(statuses):
+            return Response({'error': 'Invalid status'}, status=status.HTTP_400_BAD_REQUEST)
+        reservations = reservations.filter(status__in=statuses)
+    rows = compact_reservation_rows if request.GET.get('compact', '').lower() in ('1', 'true') else reservation_rows
+    reservations = rows.values(reservations)
+
+    if wants_stream(request):
+        reservations = reservations.order_by('id').iterator(chunk_size=STREAM_CHUNK_SIZE)
+        return stream_json_lines(map(rows.builder(), reservations))
+    if id_paginator.is_requested(request):
+        try:
+            page = id_paginator.page(reservations, request, rows.serialize)
+        except InvalidCursor:
+            return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(page)
+
+    return Response(rows.serialize(reservations))
 
 
 class ReservationListView(APIView):
     def get(self, request):
-        reservations = Reservation.objects.all()
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data)
+        return reservation_listing(request, Reservation.objects.all())
 
 
 @api_view(['GET'])
 def user_reservations(request):
     if request.user.is_authenticated:
-
-        reservations = Reservation.objects.filter(user=request.user)
-        serializer = ReservationSerializer(reservations, many=True)
-        return Response(serializer.data)
+        return reservation_listing(request, Reservation.objects.filter(user_id=request.user.id))
     else:        
         return Response({'message': 'User not authenticated'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -204,7 +441,20 @@ def edit_reservation(request, id):
 
     reservation_serializer = ReservationSerializer(instance=reservation, data=request.data, partial=True)
     if reservation_serializer.is_valid():
-        reservation_serializer.save()
+        previous_status = reservation.status
+        try:
+            with transaction.atomic():
+                reservation_serializer.save()
+                if previous_status != 'cancelled' and reservation.status == 'cancelled':
+                    release_reservation_seats(reservation)
+                elif previous_status == 'cancelled' and reservation.status != 'cancelled':
+                    reinstate_reservation_seats(reservation)
+                elif previous_status == 'pending' and reservation.status == 'confirmed' and reservation.expires_at:
+                    convert_hold(reservation)
+        except (SoldOut, SeatTaken) as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_409_CONFLICT)
+        except SeatInventoryError as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         return Response(reservation_serializer.data, status=status.HTTP_200_OK)
 
     return Response({"error": reservation_serializer.errors}, status=status.HTTP_400_BAD_REQUEST)
@@ -216,7 +466,10 @@ def delete_reservation(request, id):
     except Reservation.DoesNotExist:
         return Response({'error': 'Reservation not found'}, status=status.HTTP_404_NOT_FOUND)
 
-    reservation.delete()
+    with transaction.atomic():
+        if reservation.status != 'cancelled':
+            release_reservation_seats(reservation)
+        reservation.delete()
     return Response({'message': 'Reservation deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
@@ -249,20 +502,32 @@ class AdminLoginView(APIView):
             return Response({'message': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
         
 
+def cached_response(request, entry):
+    if etag_matches(request, entry['etag']):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': entry['etag']})
+    return Response(entry['data'], status=status.HTTP_200_OK, headers={'ETag': entry['etag']})
+
+
+@method_decorator(read_from_replica, name='dispatch')
 class CityListView(APIView):
     def get(self, request):
-        cities = City.objects.all()
-        data = [{'id': city.id, 'name': city.name, 'airport_name': city.airport_name, 'airport_code': city.airport_code, 'status': city.status} for city in cities]
-        return Response(data)
+        return cached_response(request, city_list())
     
 @api_view(['GET'])
-def get_city(request, id):
+def city_typeahead(request):
     try:
-        city = City.objects.get(pk=id)
-        serializer = CitySerializer(city)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    except City.DoesNotExist:
+        limit = max(1, min(int(request.GET.get('limit', 10)), 50))
+    except ValueError:
+        return Response({'error': 'Invalid limit'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(search_cities(request.GET.get('q', ''), limit))
+
+
+@api_view(['GET'])
+def get_city(request, id):
+    entry = city_detail(id)
+    if entry is None:
         return Response({"error": "City not found"}, status=status.HTTP_404_NOT_FOUND)
+    return cached_response(request, entry)
 
 
 @api_view(['POST'])
@@ -307,6 +572,28 @@ def add_flight(request):
         return Response({'message': 'Flight added successfully'}, status=201)
     return Response(serializer.errors, status=400)
 
+IMPORT_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json-lines': 'jsonl',
+}
+
+@api_view(['POST'])
+def import_flights_view(request):
+    upload = request.FILES.get('file') if request.content_type.startswith('multipart/') else None
+    if upload is not None:
+        input_format = 'csv' if upload.name.lower().endswith('.csv') else 'jsonl'
+        stream = upload
+    else:
+        input_format = IMPORT_CONTENT_TYPES.get(request.content_type.split(';')[0].strip())
+        stream = request.body
+    if input_format is None:
+        return Response({'error': 'Send text/csv, application/x-ndjson or a multipart "file" upload'}, status=status.HTTP_400_BAD_REQUEST)
+
+    report = import_flights(read_rows(stream, input_format))
+    return Response(report.as_dict(), status=status.HTTP_200_OK)
+
 @api_view(['PUT'])
 def edit_flight(request, id):
     flight = Flight.objects.get(pk=id)
@@ -327,10 +614,28 @@ def delete_flight(request, id):
     flight.delete()
     return Response({'message': 'Flight deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
+@api_view(['GET', 'PUT'])
+def flight_seat_map(request, pk):
+    if request.method == 'PUT':
+        try:
+            set_seat_layout(pk, request.data.get('cabins'))
+        except Flight.DoesNotExist:
+            return Response({'error': 'Flight not found'}, status=status.HTTP_404_NOT_FOUND)
+        except InvalidLayout as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        except SeatMapInUse as exc:
+            return Response({'error': str(exc)}, status=status.HTTP_409_CONFLICT)
+
+    data = seat_map(pk)
+    if data is None:
+        return Response({'error': 'Flight not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response(data)
+
+
 class FlightDetail(View):
     def get(self, request, pk):
         try:
-            flight = Flight.objects.get(pk=pk)
+            flight = Flight.objects.select_related('origin', 'destination').get(pk=pk)
             flight_data = {
                 'id': flight.id,
                 'flight_number': flight.flight_number,
@@ -356,47 +661,78 @@ class FlightDetail(View):
         except Flight.DoesNotExist:
             return JsonResponse({'error': 'Flight not found'}, status=404)
 
+def values_listing(request, queryset, full_list=None):
+    # Pages and streams are keyed on id; ``full_list`` is what the endpoint
+    # returned before they existed, for clients that ask for neither.
+    if wants_stream(request):
+        return stream_json_lines(queryset.order_by('id').iterator(chunk_size=STREAM_CHUNK_SIZE))
+    if id_paginator.is_requested(request):
+        try:
+            return JsonResponse(id_paginator.page(queryset, request))
+        except InvalidCursor:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    return JsonResponse(list(queryset if full_list is None else full_list), safe=False)
+
+@read_from_replica
 def get_auth_users(request):
     users = User.objects.values('id', 'username', 'email', 'is_superuser', 'is_staff', 'is_active', 'date_joined', 'last_login')
-    return JsonResponse(list(users), safe=False)
-
+    return values_listing(request, users)
+
+PASSENGER_FIELDS = (
+    'user__id',
+    'user__username',
+    'user__first_name',
+    'user__last_name',
+    'user__email',
+    'user__is_superuser',
+    'user__is_staff',
+    'user__is_active',
+    'user__date_joined',
+    'user__last_login',
+    'contact_number',
+    'gender',
+    'address'
+)
+
+@read_from_replica
 def get_passengers(request):
-    passengers = Passenger.objects.select_related('user').values(
-        'user__id',
-        'user__username',
-        'user__first_name',
-        'user__last_name',
-        'user__email',
-        'user__is_superuser',
-        'user__is_staff',
-        'user__is_active',
-        'user__date_joined',
-        'user__last_login',
-        'contact_number',
-        'gender',
-        'address'
-    )
-    return JsonResponse(list(passengers), safe=False)
+    passengers = Passenger.objects.select_related('user')
+    return values_listing(request, passengers.values('id', *PASSENGER_FIELDS), full_list=passengers.values(*PASSENGER_FIELDS))
+
+def set_user_flag(request, id, flag):
+    # The caller says which value it wants, so a retried or concurrent request cannot flip it back.
+    value = request.data.get(flag)
+    if not isinstance(value, bool):
+        return Response({'error': f'{flag} must be true or false'}, status=status.HTTP_400_BAD_REQUEST)
+    if not bulk_update_users(User.objects.filter(pk=id), **{flag: value})['matched']:
+        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+    return JsonResponse({'success': True, flag: value, 'message': f'{flag} status updated successfully'})
 
 @api_view(['POST'])
+@permission_classes([IsAdminUser])
 def staff_status(request, id):
-    user = get_object_or_404(User, pk=id)
-    user.is_staff = not user.is_staff
-    user.save()
-    return JsonResponse({'success': True, 'is_staff': user.is_staff, 'message': 'is_staff status updated successfully'})
+    return set_user_flag(request, id, 'is_staff')
 
 @api_view(['POST'])
+@permission_classes([IsAdminUser])
 def active_status(request, id):
-    user = get_object_or_404(User, pk=id)
-    user.is_active = not user.is_active
-    user.save()
-    return JsonResponse({'success': True, 'is_active': user.is_active, 'message': 'is_active status updated successfully'})
+    return set_user_flag(request, id, 'is_active')
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def bulk_user_status(request):
+    """Set is_active and/or is_staff for ``ids`` or a ``filter`` of users in one UPDATE."""
+    try:
+        users = bulk_user_targets(ids=request.data.get('ids'), filters=request.data.get('filter'))
+        summary = bulk_update_users(users, is_active=request.data.get('is_active'), is_staff=request.data.get('is_staff'))
+    except InvalidBulkUpdate as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(summary, status=status.HTTP_200_OK)
 
 
 def is_token_valid(user_id, token_key):
-    try:
-        user = User.objects.get(id=user_id)
-        token = Token.objects.get(user=user, key=token_key)
-        return True
-    except (User.DoesNotExist, Token.DoesNotExist):
-        return False
+    return Token.objects.filter(user_id=user_id, key=token_key).exists()
+
+
+def metrics_view(request):
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
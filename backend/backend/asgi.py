@@ -5,6 +5,27 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
+
+ASGI deployment mode
+--------------------
+The read-heavy endpoints have async twins under ``async/`` (see
+airlineapp/async_views.py): ``async/search/``, ``async/flights/``,
+``async/get_flight/<id>/``, ``async/user_reservations/`` and ``async/cities/``.
+They run the same code as the sync views (search cache, pagination, replica
+reads, authentication), each request on a worker thread of its own, and stream
+``?stream=1`` listings chunk by chunk. They only pay off when served by an
+ASGI server, e.g.::
+
+    uvicorn backend.asgi:application --workers 4 --host 0.0.0.0 --port 8000
+
+or ``daphne backend.asgi:application``. The sync DRF views keep working under
+ASGI too (Django runs them in a thread pool), so one deployment can serve both.
+Point the frontend's read calls at the ``async/`` URLs to use the async path.
+
+Compare the two paths locally with ``python manage.py bench_asgi``. ASGI wins
+when requests mostly wait on the database (try ``--db-latency-ms 50``): many
+more of them can be in flight than a WSGI server has threads. With fast
+queries each async request costs a little more CPU, so WSGI can come out ahead.
 """
 
 import os
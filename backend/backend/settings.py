@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 
@@ -46,16 +47,23 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'airlineapp.authentication.SignedTokenAuthentication',
+        'airlineapp.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
 
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'airlineapp.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     #     'DEFAULT_PERMISSION_CLASSES': [
     #     'rest_framework.permissions.IsAuthenticated',
     # ],
 }
 
 MIDDLEWARE = [
+    'airlineapp.middleware.RequestMetricsMiddleware',
+    'airlineapp.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -70,7 +78,18 @@ CORS_ALLOWED_ORIGINS = [
     'http://localhost:3000'
 ]
 
-SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+# AIRLINE_SESSION_STORE picks where login() keeps sessions:
+#   db     - a django_session row per login, read on every session request
+#   cache  - cached_db: reads come from the cache, writes go through to the DB
+#   cookie - signed_cookies: no server-side storage at all
+# Expired rows in django_session are removed by `manage.py prune_sessions`.
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cache': 'django.contrib.sessions.backends.cached_db',
+    'cookie': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_ENGINE = SESSION_ENGINES[os.environ.get('AIRLINE_SESSION_STORE', 'db')]
+SESSION_CACHE_ALIAS = 'default'
 
 
 ROOT_URLCONF = 'backend.urls'
@@ -108,6 +127,153 @@ DATABASES = {
     }
 }
 
+# AIRLINE_DB=sqlite runs against a local SQLite file instead, e.g. for the test
+# suite or `manage.py bench_api` on a machine without MySQL.
+if os.environ.get('AIRLINE_DB') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('AIRLINE_SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+
+
+# AIRLINE_DB_CONNECTIONS picks how each worker holds its database connections:
+#   close      - Django's default: connect for every request, close at its end
+#   persistent - keep each thread's connection for CONN_MAX_AGE seconds and
+#                check it is still alive before the first query of a request
+#   pooled     - a per-process pool shared by the worker's threads, with
+#                AIRLINE_DB_POOL_SIZE connections recycled after
+#                AIRLINE_DB_POOL_RECYCLE seconds (see airlineapp/db/pool.py)
+# Pool checkouts, waits and reconnects are reported at /metrics/.
+POOLED_ENGINES = {
+    'django.db.backends.mysql': 'airlineapp.db.mysql',
+    'django.db.backends.sqlite3': 'airlineapp.db.sqlite3',
+}
+DB_CONNECTIONS = os.environ.get('AIRLINE_DB_CONNECTIONS', 'close')
+if DB_CONNECTIONS == 'persistent':
+    DATABASES['default'].update(CONN_MAX_AGE=600, CONN_HEALTH_CHECKS=True)
+elif DB_CONNECTIONS == 'pooled':
+    DATABASES['default']['ENGINE'] = POOLED_ENGINES[DATABASES['default']['ENGINE']]
+    DATABASES['default']['POOL'] = {
+        'SIZE': int(os.environ.get('AIRLINE_DB_POOL_SIZE', 10)),
+        'RECYCLE': int(os.environ.get('AIRLINE_DB_POOL_RECYCLE', 30 * 60)),
+        'TIMEOUT': 10,
+        'PING_AFTER': 30,
+    }
+
+
+# Read replicas
+# AIRLINE_DB_REPLICAS is a comma-separated list of replica hosts (or SQLite
+# files with AIRLINE_DB=sqlite), configured as aliases replica1, replica2, ...
+# Views wrapped in @read_from_replica round-robin over them; a client that
+# wrote within READ_YOUR_WRITES_SECONDS reads from the primary instead, as does
+# everyone when no replica is reachable. A replica that fails to connect is
+# skipped for REPLICA_RETRY_SECONDS.
+# With AIRLINE_DB=sqlite and no replicas listed, replica1 and replica2 are extra
+# connections to the same file: not used for routing, but there for the tests.
+REPLICA_DATABASES = []
+for index, location in enumerate(filter(None, os.environ.get('AIRLINE_DB_REPLICAS', '').split(',')), 1):
+    replica = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+    replica['NAME' if replica['ENGINE'].endswith('sqlite3') else 'HOST'] = location.strip()
+    DATABASES[f'replica{index}'] = replica
+    REPLICA_DATABASES.append(f'replica{index}')
+if not REPLICA_DATABASES and DATABASES['default']['ENGINE'].endswith('sqlite3'):
+    for alias in ('replica1', 'replica2'):
+        DATABASES[alias] = dict(DATABASES['default'], TEST={'MIRROR': 'default'})
+
+DATABASE_ROUTERS = ['airlineapp.routers.ReplicaRouter']
+READ_YOUR_WRITES_SECONDS = 5
+REPLICA_RETRY_SECONDS = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# LocMem per worker by default; set REDIS_URL to share one cache between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'airline',
+    }
+}
+
+if os.environ.get('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['REDIS_URL'],
+    }
+
+AIRLINE_CACHE_ALIAS = 'default'
+
+# Flight searches on one route are cached for SEARCH_CACHE_SECONDS (0 turns
+# this off) and dropped as soon as a flight on the route changes or sells a
+# seat. Past that a stale copy is served for up to SEARCH_CACHE_STALE_SECONDS
+# while one worker recomputes it. Searches read from a replica, so a lagging
+# replica can put pre-write seats back in the cache for at most the TTL.
+SEARCH_CACHE_SECONDS = 30
+SEARCH_CACHE_STALE_SECONDS = 10
+
+# The city list and details are cached until a city changes, and for at most
+# CITY_CACHE_SECONDS, in case a change slipped past the version bumps.
+CITY_CACHE_SECONDS = 3600
+
+# Token authentication caches token -> user snapshots. 'local' is a per-worker
+# LRU (revocations reach other workers after TOKEN_CACHE_TTL); 'shared' keeps
+# the snapshots in AIRLINE_CACHE_ALIAS so every worker sees them at once.
+TOKEN_CACHE_BACKEND = os.environ.get('TOKEN_CACHE_BACKEND', 'local')
+TOKEN_CACHE_MAX_ENTRIES = 10000
+TOKEN_CACHE_TTL = 300
+
+# AIRLINE_AUTH_MODE=signed makes login hand out a short-lived signed access
+# token (sent as "Authorization: Bearer ...", checked without the database) and
+# a refresh token for /token/refresh/. Deactivating a user revokes their refresh
+# tokens; access tokens already issued stay valid until they expire.
+AIRLINE_AUTH_MODE = os.environ.get('AIRLINE_AUTH_MODE', 'token')
+ACCESS_TOKEN_LIFETIME = 5 * 60
+REFRESH_TOKEN_LIFETIME = 30 * 24 * 60 * 60
+
+
+# Instrumentation
+# Per-route metrics are served at /metrics/; requests slower than
+# METRICS_SLOW_REQUEST_MS are logged with their slowest queries.
+
+METRICS_SLOW_REQUEST_MS = 500
+SEARCH_LOG_SAMPLE_RATE = 0.01
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'airlineapp': {
+            'handlers': ['console'],
+            'level': 'INFO',
+        },
+    },
+}
+
+
+# Reservation holds
+# Pending reservations hold their seats this long; `manage.py expire_holds`
+# (run from cron, or with --loop) cancels lapsed holds and returns the seats.
+
+RESERVATION_HOLD_MINUTES = 15
+
+
+# Connection search
+# Minimum/maximum layover between legs, with per-airport-code overrides.
+
+ROUTE_MIN_CONNECTION_MINUTES = 45
+ROUTE_MAX_CONNECTION_MINUTES = 12 * 60
+ROUTE_MIN_CONNECTION_OVERRIDES = {
+    'MNL': 90,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators